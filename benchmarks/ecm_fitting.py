@@ -0,0 +1,104 @@
+"""
+Benchmark equivalent circuit fitting of many synthetic HPPC pulses: one
+scipy.optimize.curve_fit call per pulse against the batched fitter in
+src.ecm.
+
+Usage (from the repository root):
+
+    python benchmarks/ecm_fitting.py
+    python benchmarks/ecm_fitting.py --pulses 5000 --num-rc 1
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.ecm import evaluate_pulses, fit_pulses
+
+
+def make_pulses(num_pulses, num_rc, pulse_s=10, dt_s=0.1, noise_ohm=1e-5):
+    """
+    Returns the samples and true parameters of `num_pulses` pulses
+    """
+
+    rng = np.random.default_rng(0)
+
+    lengths = np.full(num_pulses, int(pulse_s / dt_s) + 1)
+    time = np.tile(np.arange(lengths[0]) * dt_s, num_pulses)
+
+    params = np.column_stack(
+        [rng.uniform(0.02, 0.05, num_pulses)]
+        + [rng.uniform(0.005, 0.02, num_pulses) for _ in range(num_rc)]
+        + [rng.uniform(0.3, 1, num_pulses) * 5**k for k in range(num_rc)])
+
+    values = evaluate_pulses(time, lengths, params) \
+        + rng.normal(0, noise_ohm, lengths.sum())
+
+    return time, values, lengths, params
+
+
+def fit_loop(time, values, lengths, num_rc):
+    """
+    Fit each pulse separately with a generic least squares solver
+    """
+
+    def model(t, *p):
+        return evaluate_pulses(t, [len(t)], np.array(p)[np.newaxis, :])
+
+    offsets = np.cumsum(lengths) - lengths
+    params = []
+
+    for start, length in zip(offsets, lengths):
+
+        t = time[start:start + length]
+        y = values[start:start + length]
+
+        p0 = [y[0]] + [(y[-1] - y[0]) / num_rc] * num_rc \
+            + list(t[-1] * np.geomspace(1 / 50, 1 / 2, num_rc + 2)[1:-1])
+
+        # Covariance warnings of near-degenerate pulses are irrelevant here
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            params.append(curve_fit(model, t, y, p0=p0, maxfev=10000)[0])
+
+    return np.array(params)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pulses', type=int, default=1000,
+                        help='number of pulses to fit')
+    parser.add_argument('--num-rc', type=int, default=2,
+                        help='number of RC pairs')
+    args = parser.parse_args()
+
+    time_s, values, lengths, params = make_pulses(args.pulses, args.num_rc)
+
+    start = time.perf_counter()
+    loop_params = fit_loop(time_s, values, lengths, args.num_rc)
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_params, _, converged = fit_pulses(time_s, values, lengths, args.num_rc)
+    batch_s = time.perf_counter() - start
+
+    loop_error = np.median(np.abs(loop_params[:, 0] / params[:, 0] - 1))
+    batch_error = np.median(np.abs(batch_params[:, 0] / params[:, 0] - 1))
+
+    print(f'{args.pulses} pulses, {args.num_rc} RC pairs '
+          f'({converged.mean():.1%} converged)')
+    print(f'  curve_fit loop: {loop_s * 1000:9.1f} ms, median R0 error {loop_error:.2e}')
+    print(f'  batched:        {batch_s * 1000:9.1f} ms, median R0 error {batch_error:.2e}')
+    print(f'  speedup:        {loop_s / batch_s:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark the cold import time of each `src` module.
+
+Every module is imported in a fresh interpreter, so the timings include all
+of the module's dependencies, as a short script or test collection would pay
+them. The slowest dependencies are taken from Python's `-X importtime`
+report.
+
+Usage (from the repository root):
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 5 --top 3 src.formation
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Scripts that run analyses when imported
+SKIPPED_MODULES = ['src.run']
+
+
+def get_modules():
+    """
+    Returns the names of all modules in the `src` package
+    """
+
+    return [f'src.{file.stem}' for file in sorted((ROOT / 'src').glob('*.py'))
+            if file.stem != '__init__' and f'src.{file.stem}' not in SKIPPED_MODULES]
+
+
+def time_import(module):
+    """
+    Import a module in a fresh interpreter
+
+    Returns a tuple of (wall time in seconds, `-X importtime` report), or
+    (None, error message) if the import failed
+    """
+
+    start = time.perf_counter()
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True,
+                          env={**os.environ, 'PYTHONPATH': str(ROOT)})
+
+    seconds = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1]
+
+    return seconds, proc.stderr
+
+
+def get_slowest_imports(report, module, top):
+    """
+    Returns the `top` direct dependencies of a module with the largest
+    cumulative import time, as a list of (name, seconds)
+    """
+
+    children = []
+
+    for line in report.splitlines()[1:]:
+
+        _, cumulative_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+
+        # Each top-level import is listed after its own dependencies
+        if depth == 0:
+            if name.strip() == module:
+                break
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative_us) / 1e6))
+
+    return sorted(children, key=lambda x: -x[1])[:top]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('modules', nargs='*', help='modules to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='imports per module; the fastest is reported')
+    parser.add_argument('--top', type=int, default=5,
+                        help='number of slowest dependencies to list')
+    args = parser.parse_args()
+
+    modules = args.modules or get_modules()
+
+    interpreter_seconds = min(time_import('sys')[0] for _ in range(args.repeat))
+
+    print(f'Interpreter startup: {interpreter_seconds:.3f}s (subtracted below)\n')
+
+    for module in modules:
+
+        runs = [time_import(module) for _ in range(args.repeat)]
+
+        if runs[0][0] is None:
+            print(f'{module:20s}  import failed: {runs[0][1]}')
+            continue
+
+        seconds, report = min(runs, key=lambda x: x[0])
+
+        print(f'{module:20s} {seconds - interpreter_seconds:7.3f}s')
+
+        for name, cumulative in get_slowest_imports(report, module, args.top):
+            print(f'    {name:30s} {cumulative:7.3f}s')
+
+
+if __name__ == '__main__':
+    main()
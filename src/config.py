@@ -0,0 +1,127 @@
+"""
+Lazily resolved data and output locations.
+
+The directories are configured in `paths.yaml` in the working directory. The
+file is only read when a path is first needed, so importing `src` modules
+does not depend on it, and any directory can be overridden at runtime:
+
+    from src import config
+    config.set_paths(data='/mnt/lab/data/')
+"""
+
+import os
+import threading
+
+# Configuration file read on first use, relative to the working directory
+PATH_CONFIG_FILE = 'paths.yaml'
+
+# Named locations, as (configured directory, path within that directory)
+NAMED_PATHS = {
+    'PATH_CYCLE':        ('data', '2020-10-aging-test-cycles'),
+    'PATH_TIMESERIES':   ('data', '2020-10-aging-test-timeseries'),
+    'PATH_FORMATION':    ('data', '2020-06-microformation-timeseries'),
+    'PATH_METADATA':     ('documents', 'cell_tracker.xlsx'),
+    'PATH_ESOH_SUMMARY': ('outputs', 'summary_esoh_table.csv'),
+    'PATH_ESOH_DATA':    ('outputs', '2021-04-12-formation-esoh-fits'),
+    'PATH_CORR':         ('outputs', 'correlation_data.csv'),
+    'PATH_OUTPUT':       ('outputs', ''),
+    'PATH_CACHE':        ('cache', ''),
+}
+
+_config_file = PATH_CONFIG_FILE
+_paths = None
+_overrides = dict()
+_lock = threading.Lock()
+
+
+def get_paths():
+    """
+    Returns the configured directories as a dict, reading the configuration
+    file on first use.
+
+    Keys are 'data', 'outputs', 'documents' and 'cache'. The cache directory
+    defaults to 'cache/' under the outputs directory.
+    """
+
+    global _paths
+
+    with _lock:
+
+        if _paths is None:
+
+            import yaml
+
+            with open(_config_file, 'r') as f:
+                _paths = yaml.load(f, Loader=yaml.FullLoader) or dict()
+
+        paths = {**_paths, **_overrides}
+
+    if 'cache' not in paths and 'outputs' in paths:
+        paths['cache'] = paths['outputs'] + 'cache/'
+
+    return paths
+
+
+def get_path(name):
+    """
+    Returns a named location, e.g. 'PATH_TIMESERIES'
+
+    Parameters
+    ---------
+    name (str): a key of NAMED_PATHS
+
+    Returns
+    ---------
+    the path as a string
+    """
+
+    assert name in NAMED_PATHS, f'Unknown path "{name}"'
+
+    directory, path = NAMED_PATHS[name]
+
+    paths = get_paths()
+
+    assert directory in paths, \
+        f'"{directory}" is not configured in {_config_file}; ' \
+        f'set it with config.set_paths({directory}=...)'
+
+    return paths[directory] + path
+
+
+def set_paths(**paths):
+    """
+    Override configured directories, e.g. `set_paths(data='/mnt/data/')`.
+
+    Overrides take precedence over the configuration file and last until
+    `reset_paths` is called.
+    """
+
+    with _lock:
+        _overrides.update(paths)
+
+
+def use_config_file(config_file):
+    """
+    Read directories from another configuration file, on next use
+    """
+
+    global _config_file, _paths
+
+    assert os.path.exists(config_file), f'{config_file} does not exist.'
+
+    with _lock:
+        _config_file = config_file
+        _paths = None
+
+
+def reset_paths():
+    """
+    Drop all overrides and re-read the default configuration file on next use
+    """
+
+    global _config_file, _paths
+
+    with _lock:
+        _config_file = PATH_CONFIG_FILE
+        _paths = None
+        _overrides.clear()
@@ -3,12 +3,9 @@ Utility functions for dV/dQ analysis
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
 from scipy import interpolate
 from scipy.optimize import fsolve
 
-import plotter as plotter
-
 
 def f_pos_ocv(sto):
     """
@@ -201,6 +198,10 @@ def make_plot(q, Voc, Up, Un):
     Un:  negative electrode equilibrium potential
     """
 
+    from matplotlib import pyplot as plt
+
+    import plotter as plotter
+
     plotter.initialize(plt)
 
     plt.figure(figsize=(12, 8))
@@ -0,0 +1,357 @@
+"""
+Batched equivalent circuit fitting of current pulses.
+
+The voltage response of a cell to a constant current pulse is modeled by a
+series resistance and `num_rc` RC pairs. Expressed as a transient resistance,
+the voltage change from the rest voltage divided by the pulse current,
+
+    r(t) = R0 + sum_k R_k * (1 - exp(-t / tau_k))
+
+with t measured from the start of the pulse.
+
+All pulses are fit together by a Levenberg-Marquardt iteration. Pulses are
+passed in the ragged layout of src.hppc.PulseStore and padded to a common
+length, so that residuals, Jacobians and the small normal equations of every
+pulse are formed and solved as one batch. Each pulse keeps its own damping
+and drops out of the batch once converged.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Bounds on the time constants, in seconds
+TAU_BOUNDS_S = (1e-2, 1e2)
+
+# Iteration controls
+ECM_MAX_ITER = 100
+ECM_TOL = 1e-10
+
+
+def get_num_params(num_rc):
+    """
+    Returns the number of parameters of a model with `num_rc` RC pairs
+    """
+
+    return 1 + 2 * num_rc
+
+
+def evaluate_pulses(time, lengths, params):
+    """
+    Evaluate the transient resistance of every pulse.
+
+    Parameters
+    ---------
+    time (array): concatenated sample times, from 0 at each pulse start
+    lengths (array of int): number of samples in each pulse
+    params (array): one row per pulse holding [R0, R1..Rn, tau1..taun]
+
+    Returns
+    ---------
+    the concatenated model values, in ohms
+    """
+
+    time = np.asarray(time, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    value, _ = _get_model(_to_padded(time, lengths),
+                          _to_internal(np.asarray(params, dtype=np.float64)))
+
+    return value[np.arange(value.shape[1]) < lengths[:, np.newaxis]]
+
+
+def fit_pulses(time, values, lengths, num_rc=2, init=None,
+               tau_bounds=TAU_BOUNDS_S, max_iter=ECM_MAX_ITER, tol=ECM_TOL):
+    """
+    Fit the equivalent circuit model to every pulse at once.
+
+    Parameters
+    ---------
+    time (array): concatenated sample times, from 0 at each pulse start
+    values (array): concatenated transient resistances, in ohms
+    lengths (array of int): number of samples in each pulse
+    num_rc (int): number of RC pairs
+    init (array): initial parameters, one row per pulse as in the output;
+                  rows holding NaN, or all rows if None, start from a guess
+                  based on the pulse data
+    tau_bounds (tuple): lower and upper bound on the time constants
+    max_iter (int): maximum number of iterations
+    tol (float): relative decrease of the sum of squares below which a pulse
+                 has converged
+
+    Returns
+    ---------
+    a tuple of
+      - params: array with one row per pulse, [R0, R1..Rn, tau1..taun], with
+        the RC pairs sorted by time constant
+      - rmse: root mean square error of each pulse, in ohms
+      - converged: True for pulses that met the tolerance
+    """
+
+    time = np.asarray(time, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    assert np.all(lengths > 0), 'Every pulse must hold at least one sample.'
+
+    num_pulses = len(lengths)
+    num_params = get_num_params(num_rc)
+
+    log_tau_bounds = np.log(tau_bounds)
+
+    theta = _to_internal(_get_initial_params(time, values, lengths, num_rc))
+
+    if init is not None:
+        init = np.asarray(init, dtype=np.float64)
+        assert init.shape == (num_pulses, num_params), \
+            f'Initial parameters must have shape {(num_pulses, num_params)}.'
+        is_given = ~np.isnan(init).any(axis=1)
+        theta[is_given] = _to_internal(init[is_given])
+
+    theta[:, 1 + num_rc:] = np.clip(theta[:, 1 + num_rc:], *log_tau_bounds)
+
+    # Pad the pulses to a common length so that the normal equations of all
+    # pulses are formed by one batched matrix product; padding samples carry
+    # zero weight
+    time, values, weight = _to_padded(time, lengths), _to_padded(values, lengths), \
+        _to_padded(np.ones(len(time)), lengths)
+
+    resid, jac = _evaluate_padded(time, values, weight, theta)
+    cost = np.sum(resid**2, axis=1)
+
+    damping = np.full(num_pulses, 1e-3)
+    converged = np.zeros(num_pulses, dtype=bool)
+
+    for _ in range(max_iter):
+
+        active = np.flatnonzero(~converged)
+
+        if len(active) == 0:
+            break
+
+        # (J'J + damping * diag(J'J)) step = J'r for every active pulse
+        jac_t = jac[active].transpose(0, 2, 1)
+        jtj = jac_t @ jac[active]
+        jtr = jac_t @ resid[active][:, :, np.newaxis]
+
+        diag = np.diagonal(jtj, axis1=1, axis2=2) + 1e-12
+        lhs = jtj + np.eye(num_params) * (damping[active, np.newaxis] * diag)[:, np.newaxis, :]
+
+        step = np.linalg.solve(lhs, jtr)[:, :, 0]
+
+        theta_new = theta[active] + step
+        theta_new[:, 1 + num_rc:] = np.clip(theta_new[:, 1 + num_rc:], *log_tau_bounds)
+
+        resid_new, jac_new = _evaluate_padded(time[active], values[active],
+                                              weight[active], theta_new)
+        cost_new = np.sum(resid_new**2, axis=1)
+
+        is_better = cost_new <= cost[active]
+
+        converged[active] = (is_better & (cost[active] - cost_new <= tol * cost[active])) \
+            | np.all(np.abs(theta_new - theta[active]) <= tol * (np.abs(theta[active]) + tol),
+                     axis=1)
+
+        # Accept improving steps and relax their damping; retry the others
+        # with a larger damping
+        better = active[is_better]
+
+        theta[better] = theta_new[is_better]
+        cost[better] = cost_new[is_better]
+        resid[better] = resid_new[is_better]
+        jac[better] = jac_new[is_better]
+
+        damping[active] = np.clip(np.where(is_better, damping[active] / 10,
+                                           damping[active] * 10), 1e-12, 1e12)
+
+    params = _sort_rc_pairs(_to_external(theta), num_rc)
+    rmse = np.sqrt(cost / lengths)
+
+    return params, rmse, converged
+
+
+def fit_pulse_sequences(time, values, lengths, sequence, position, num_rc=2, **kwargs):
+    """
+    Fit pulses taken in sequences, e.g. the pulses of an HPPC test at
+    decreasing states of charge, warm starting each pulse from the fit of the
+    previous pulse in its sequence.
+
+    Pulses at the same position of all sequences are fit together, so the
+    number of batches is the length of the longest sequence.
+
+    Parameters
+    ---------
+    time, values, lengths: pulse samples, as in `fit_pulses`
+    sequence (array): sequence label of each pulse, e.g. the cycle index
+    position (array of int): position of each pulse within its sequence;
+                             each (sequence, position) pair must be unique
+    num_rc (int): number of RC pairs
+    kwargs: passed on to `fit_pulses`
+
+    Returns
+    ---------
+    a tuple (params, rmse, converged) as in `fit_pulses`
+    """
+
+    time = np.asarray(time, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    sequence = np.asarray(sequence)
+    position = np.asarray(position)
+
+    assert len(set(zip(sequence.tolist(), position.tolist()))) == len(sequence), \
+        'Each pulse must have its own (sequence, position) pair.'
+
+    offsets = np.cumsum(lengths) - lengths
+
+    num_pulses = len(lengths)
+    params = np.full((num_pulses, get_num_params(num_rc)), np.nan)
+    rmse = np.full(num_pulses, np.nan)
+    converged = np.zeros(num_pulses, dtype=bool)
+
+    # Pulse at the previous position of each sequence
+    previous = dict()
+
+    for pos in np.unique(position):
+
+        pulses = np.flatnonzero(position == pos)
+
+        # Fit of the previous pulse of each sequence, if any
+        init = np.full((len(pulses), params.shape[1]), np.nan)
+        prev = np.array([previous.get(label, -1) for label in sequence[pulses].tolist()],
+                        dtype=np.int64)
+        has_prev = prev >= 0
+        init[has_prev] = params[prev[has_prev]]
+
+        rows = np.arange(lengths[pulses].sum()) \
+            + np.repeat(offsets[pulses] - np.cumsum(lengths[pulses]) + lengths[pulses],
+                        lengths[pulses])
+
+        (params[pulses], rmse[pulses], converged[pulses]) = \
+            fit_pulses(time[rows], values[rows], lengths[pulses], num_rc,
+                       init=init, **kwargs)
+
+        previous = dict(zip(sequence[pulses].tolist(), pulses))
+
+    return params, rmse, converged
+
+
+def get_params_table(params, num_rc):
+    """
+    Returns fitted parameters as a DataFrame with columns r0_ohm, r1_ohm,
+    ..., tau1_s, ...
+    """
+
+    columns = ['r0_ohm'] + [f'r{k}_ohm' for k in range(1, num_rc + 1)] \
+        + [f'tau{k}_s' for k in range(1, num_rc + 1)]
+
+    return pd.DataFrame(params, columns=columns)
+
+
+def _get_initial_params(time, values, lengths, num_rc):
+    """
+    Returns a starting point for each pulse: R0 at the first sample, the
+    remaining rise split evenly over RC pairs with time constants spread
+    logarithmically over the pulse duration
+    """
+
+    offsets = np.cumsum(lengths) - lengths
+    last = offsets + lengths - 1
+
+    duration = np.maximum(time[last], TAU_BOUNDS_S[0])
+
+    params = np.empty((len(lengths), get_num_params(num_rc)))
+    params[:, 0] = values[offsets]
+    params[:, 1:1 + num_rc] = ((values[last] - values[offsets]) / num_rc)[:, np.newaxis]
+    params[:, 1 + num_rc:] = duration[:, np.newaxis] \
+        * np.geomspace(1 / 50, 1 / 2, num_rc + 2)[np.newaxis, 1:-1]
+
+    return params
+
+
+def _to_internal(params):
+    """
+    Fit the logarithm of the time constants so that they stay positive
+    """
+
+    theta = params.copy()
+    num_rc = (params.shape[1] - 1) // 2
+    theta[:, 1 + num_rc:] = np.log(params[:, 1 + num_rc:])
+
+    return theta
+
+
+def _to_external(theta):
+
+    params = theta.copy()
+    num_rc = (theta.shape[1] - 1) // 2
+    params[:, 1 + num_rc:] = np.exp(theta[:, 1 + num_rc:])
+
+    return params
+
+
+def _sort_rc_pairs(params, num_rc):
+    """
+    Order the RC pairs of each pulse by increasing time constant
+    """
+
+    order = np.argsort(params[:, 1 + num_rc:], axis=1)
+
+    params = params.copy()
+    params[:, 1:1 + num_rc] = np.take_along_axis(params[:, 1:1 + num_rc], order, axis=1)
+    params[:, 1 + num_rc:] = np.take_along_axis(params[:, 1 + num_rc:], order, axis=1)
+
+    return params
+
+
+def _to_padded(values, lengths):
+    """
+    Returns concatenated per-pulse values as a 2D array with one zero-padded
+    row per pulse
+    """
+
+    offsets = np.cumsum(lengths) - lengths
+
+    padded = np.zeros((len(lengths), lengths.max(initial=0)))
+    padded[np.repeat(np.arange(len(lengths)), lengths),
+           np.arange(len(values)) - np.repeat(offsets, lengths)] = values
+
+    return padded
+
+
+def _get_model(time, theta):
+    """
+    Returns the model values and the exponential decay of each RC pair on
+    padded sample times
+    """
+
+    num_rc = (theta.shape[1] - 1) // 2
+
+    resistance = theta[:, np.newaxis, 1:1 + num_rc]
+    tau = np.exp(theta[:, np.newaxis, 1 + num_rc:])
+
+    decay = np.exp(-time[:, :, np.newaxis] / tau)
+
+    value = theta[:, np.newaxis, 0] + np.sum(resistance * (1 - decay), axis=2)
+
+    return value, decay
+
+
+def _evaluate_padded(time, values, weight, theta):
+    """
+    Returns the weighted residuals and Jacobian with respect to
+    [R0, R1..Rn, log tau1..log taun] on padded samples
+    """
+
+    num_rc = (theta.shape[1] - 1) // 2
+
+    model, decay = _get_model(time, theta)
+
+    resistance = theta[:, np.newaxis, 1:1 + num_rc]
+    tau = np.exp(theta[:, np.newaxis, 1 + num_rc:])
+
+    jac = np.empty(time.shape + (theta.shape[1],))
+    jac[:, :, 0] = 1
+    jac[:, :, 1:1 + num_rc] = 1 - decay
+    jac[:, :, 1 + num_rc:] = -resistance * decay * time[:, :, np.newaxis] / tau
+
+    return weight * (values - model), jac * weight[:, :, np.newaxis]
@@ -0,0 +1,154 @@
+"""
+Single-file binary export of processed diagnostic data.
+
+Writing the HPPC and C/20 results as CSV files produces several small text
+files per cycle and cell. Instead, the results of a cell can be written into
+one compressed HDF5 container, with one group per cycle:
+
+    /cell_<cellid>/hppc_discharge/cycle_<n>/data
+    /cell_<cellid>/hppc_discharge/cycle_<n>/raw_pulses
+    /cell_<cellid>/hppc_discharge/cycle_<n>/raw_all
+    /cell_<cellid>/hppc_charge/cycle_<n>/...
+    /cell_<cellid>/c20/cycle_<n>/charge
+    /cell_<cellid>/c20/cycle_<n>/discharge
+
+Tables are stored in the chunked PyTables 'table' format, so reading a cycle
+only touches the chunks of that cycle. Several cells can share one file.
+"""
+
+import re
+
+import pandas as pd
+
+# Compression applied to every table
+HDF_COMPLIB = 'blosc'
+HDF_COMPLEVEL = 5
+
+# Tables stored for each cycle of a dataset
+HDF_TABLES = {'hppc_discharge': ['data', 'raw_pulses', 'raw_all'],
+              'hppc_charge': ['data', 'raw_pulses', 'raw_all'],
+              'c20': ['charge', 'discharge']}
+
+
+def write_diagnostic_results(file, cellid, dataset, results):
+    """
+    Write the results of a diagnostic test into an HDF5 container, replacing
+    any results already stored for the same cell, dataset and cycles.
+
+    Parameters
+    ---------
+    file (str): path to the container; created if missing
+    cellid (int): cell number
+    dataset (str): 'hppc_discharge', 'hppc_charge' or 'c20'
+    results (list of dict): output of the matching
+                            FormationCell.process_diagnostic_* method
+    """
+
+    assert dataset in HDF_TABLES, f'Unknown dataset "{dataset}"'
+
+    with pd.HDFStore(file, mode='a', complib=HDF_COMPLIB,
+                     complevel=HDF_COMPLEVEL) as store:
+
+        for res in results:
+
+            group = _get_group(cellid, dataset, res['cycle_index'])
+
+            if dataset == 'c20':
+                tables = {'charge': pd.DataFrame({'chg_capacity': res['chg_capacity'],
+                                                  'chg_voltage': res['chg_voltage'],
+                                                  'chg_dvdq': res['chg_dvdq']}),
+                          'discharge': pd.DataFrame({'dch_capacity': res['dch_capacity'],
+                                                     'dch_voltage': res['dch_voltage'],
+                                                     'dch_dvdq': res['dch_dvdq']})}
+            else:
+                tables = {name: res[name] for name in HDF_TABLES[dataset]}
+
+            for name, df in tables.items():
+                store.put(f'{group}/{name}', df, format='table')
+
+
+def read_diagnostic_results(file, cellid, dataset, cycles=None):
+    """
+    Read diagnostic results back from an HDF5 container, loading only the
+    requested cycles.
+
+    Parameters
+    ---------
+    file (str): path to the container
+    cellid (int): cell number
+    dataset (str): 'hppc_discharge', 'hppc_charge' or 'c20'
+    cycles (list of int): cycle indices to load; if None, load all cycles
+                          stored for the cell
+
+    Returns
+    ---------
+    a list of dictionaries in the format returned by the matching
+    FormationCell.process_diagnostic_* method, sorted by cycle index
+    """
+
+    assert dataset in HDF_TABLES, f'Unknown dataset "{dataset}"'
+
+    with pd.HDFStore(file, mode='r') as store:
+
+        if cycles is None:
+            cycles = list_cycles(store, cellid, dataset)
+
+        results = []
+
+        for cycle in sorted(cycles):
+
+            group = _get_group(cellid, dataset, cycle)
+
+            assert f'{group}/{HDF_TABLES[dataset][0]}' in store, \
+                f'No {dataset} data stored for cell {cellid}, cycle {cycle} ' \
+                f'in {file}'
+
+            tables = {name: store.get(f'{group}/{name}')
+                      for name in HDF_TABLES[dataset]}
+
+            res = dict()
+            res['cycle_index'] = cycle
+
+            if dataset == 'c20':
+                res.update(tables['charge'].to_dict('series'))
+                res.update(tables['discharge'].to_dict('series'))
+            else:
+                res.update(tables)
+
+            results.append(res)
+
+    return results
+
+
+def list_cycles(store, cellid, dataset):
+    """
+    Returns the sorted cycle indices stored for a cell and dataset
+
+    Parameters
+    ---------
+    store (HDFStore): an open container
+    cellid (int): cell number
+    dataset (str): 'hppc_discharge', 'hppc_charge' or 'c20'
+    """
+
+    root = f'/cell_{cellid}/{dataset}'
+
+    if root not in store:
+        return []
+
+    cycles = []
+
+    for group in store.get_node(root)._v_groups:
+        match = re.fullmatch(r'cycle_(\d+)', group)
+        if match:
+            cycles.append(int(match.group(1)))
+
+    return sorted(cycles)
+
+
+def _get_group(cellid, dataset, cycle):
+    """
+    Returns the group holding the results of one cycle
+    """
+
+    return f'/cell_{cellid}/{dataset}/cycle_{int(cycle)}'
@@ -0,0 +1,106 @@
+"""
+Formation features computed the same way from the raw cycler exports
+(src.formation.FormationCell) and from VAS (src.parsers.FormationParser).
+
+Only NumPy and the smoothing helpers are needed to import this module; SciPy
+is imported on first use.
+"""
+
+import numpy as np
+
+from src.smoothing import savgol_filter
+
+
+def get_rest_decay_features(step_time_s, voltage_v, voltage_maximum=4.2):
+    """
+    Returns the features of the voltage decay during the 6-hour rest at 100%
+    SOC that ends formation
+
+    Parameters
+    ---------
+    step_time_s (array-like): time since the start of the rest
+    voltage_v (array-like): voltage during the rest
+    voltage_maximum (float): voltage at the start of the rest
+
+    Returns
+    ---------
+    a dict holding the voltage drops over time windows, the total drop, the
+    final voltage and the steady and initial decay rates, keyed by the
+    feature names of `FormationCell.get_formation_test_summary_statistics`
+    """
+
+    from scipy import stats
+
+    x = step_time_s
+    res_dict = dict()
+
+    # Smooth the signal
+    y_smoothed = savgol_filter(voltage_v, 41, 3)
+    voltage_final = y_smoothed[-1]
+
+    # Extract the voltage drop for different time cutoffs
+    # e.g. 0 to 1 hour, 0 to 2 hours
+    for time_cutoff_hr in [1, 2, 3, 4, 5, 6]:
+        these_voltages = y_smoothed[x < time_cutoff_hr * 3600]
+        res_dict[f'form_6hr_rest_delta_voltage_v_0_to_{time_cutoff_hr}_hr'] = \
+            y_smoothed[0] - these_voltages[-1]
+
+    for time_cutoff_hr in [0, 1, 2, 3, 4, 5]:
+        these_voltages = y_smoothed[x > time_cutoff_hr * 3600]
+        res_dict[f'form_6hr_rest_delta_voltage_v_{time_cutoff_hr}_to_6_hr'] = \
+            these_voltages[0] - voltage_final
+
+    res_dict['form_6hr_rest_delta_voltage_v'] = voltage_maximum - voltage_final
+    res_dict['form_6hr_rest_voltage_v'] = voltage_final
+
+    # Estimate steady-state dV/dt using data from the last two hours
+    volts_per_second = stats.linregress(x[x > 4 * 3600], y_smoothed[x > 4 * 3600])[0]
+    res_dict['form_6hr_rest_mv_per_day_steady'] = volts_per_second * 86400 * 1000
+
+    # Estimate initial dV/dt using data from the first 15 minutes
+    volts_per_second = stats.linregress(x[x < 15 * 60], y_smoothed[x < 15 * 60])[0]
+    res_dict['form_6hr_rest_mv_per_sec_initial'] = volts_per_second * 1000
+
+    return res_dict
+
+
+def get_dvdq_peaks(capacity, voltage):
+    """
+    Locate the two dV/dQ peaks of a C/20 charge curve, whose distance is the
+    peak-to-peak capacity of the formation features
+
+    Parameters
+    ---------
+    capacity (array): charge capacity
+    voltage (array): voltage
+
+    Returns
+    ---------
+    a tuple of the capacities below 1.25 Ah, the smoothed dV/dQ at those
+    capacities, and the positions and heights of the two peaks
+    """
+
+    from scipy.signal import find_peaks
+
+    # Exclude values above 1.5Ah from this analysis.
+    to_keep = capacity < 1.25
+    voltage = voltage[to_keep]
+    capacity = capacity[to_keep]
+
+    dvdq = np.gradient(voltage)/np.gradient(capacity)
+
+    dvdq_smoothed = savgol_filter(dvdq, 5, 3)
+
+    idx_peaks, properties = find_peaks(dvdq_smoothed, height=0.35, prominence=0.005)
+
+    # Discard first if there are three peaks
+    if len(idx_peaks) == 3:
+        idx_peaks = idx_peaks[1::]
+        properties['peak_heights'] = properties['peak_heights'][1::]
+
+    assert len(idx_peaks) == 2, "Too many peaks found."
+
+    assert capacity[idx_peaks[-1]] - capacity[idx_peaks[0]] > 0, \
+        "Something went wrong with the peak indexing."
+
+    return capacity, dvdq_smoothed, idx_peaks, properties['peak_heights']
@@ -1,46 +1,145 @@
 import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import numpy as np
-import json, yaml
 import pandas as pd
-import natsort
-from matplotlib import pyplot as plt
-from scipy import interpolate, stats
-from scipy.signal import find_peaks, savgol_filter
 
-# Configure paths
-paths = yaml.load(open('paths.yaml', 'r'), Loader=yaml.FullLoader)
-
-PATH_CYCLE      = paths['data'] + '2020-10-aging-test-cycles'
-PATH_TIMESERIES = paths['data'] + '2020-10-aging-test-timeseries'
-PATH_FORMATION  = paths['data'] + '2020-06-microformation-timeseries'
-PATH_METADATA   = paths['documents'] + 'cell_tracker.xlsx'
-PATH_ESOH_SUMMARY = paths['outputs'] + 'summary_esoh_table.csv'
-PATH_ESOH_DATA = paths['outputs'] + '2021-04-12-formation-esoh-fits'
+from src.config import NAMED_PATHS, get_path, get_paths
+from src.ecm import fit_pulse_sequences, get_params_table
+from src.features import get_dvdq_peaks, get_rest_decay_features
+from src.export import write_diagnostic_results
+from src.hppc import PulseStore, find_pulses, get_pulse_rows
+from src.manifest import get_manifest
+from src.metadata import get_metadata_registry
+from src.schedules import AGING_SCHEDULE, FORMATION_BASELINE_SCHEDULE, \
+                          FORMATION_FAST_SCHEDULE
+from src.smoothing import savgol_filter, savgol_filter_many
+from src.storage import ColumnStore, Timer, clear_cache, get_memory_usage, \
+                        load_column_store, read_csv_cached, read_csv_schema
+from src.timeseries import STREAM_CHUNK_ROWS, StepRowIndex, iter_csv_cycles, \
+                           take_slices
+
+# Paths are configured in paths.yaml and resolved on first use (see
+# src.config). Module attributes such as PATH_TIMESERIES are kept for
+# existing callers.
+def __getattr__(name):
+
+    if name in NAMED_PATHS:
+        return get_path(name)
+
+    if name == 'paths':
+        return get_paths()
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# Raw data file locations (names in NAMED_PATHS) and name patterns for each
+# dataset
+RAW_DATA_FILES = {
+    'formation':  ('PATH_FORMATION',  'UM_Internal_0620_*_{cellid}.*.csv'),
+    'timeseries': ('PATH_TIMESERIES', 'UM_Internal_0620_*_Cycling_Cell_{cellid}.*.csv'),
+    'cycles':     ('PATH_CYCLE',      'UM_Internal_0620_*_Cell_{cellid}.*.csv'),
+}
+
+# FormationCell getter returning each dataset
+DATASET_GETTERS = {'formation': 'get_formation_data',
+                   'timeseries': 'get_aging_data_timeseries',
+                   'cycles': 'get_aging_data_cycles'}
+
+# Number of cells read at once by the bulk loader
+MAX_LOAD_WORKERS = 8
+
+# eSOH fit results, one file per cell and cycle
+ESOH_DATA_FILES = ('PATH_ESOH_DATA', 'cell_{cellid}_*.json')
+
+# Columns and dtypes read by the compact loaders, and kept by the
+# memory-mapped ('mmap') timeseries backend when compact. Currents and per-cycle
+# capacities fit in float32 (~7 significant digits); test times and
+# cumulative capacities keep float64 since they grow without bound.
+# Voltages also keep float64: the rest decay and Var(Q(V)) features take
+# differences of nearly equal voltages or interpolate capacity over voltage,
+# and float32 rounding moves them by more than COMPACT_FEATURE_RTOL.
+SCHEMA_TIMESERIES = {
+    'Cycle Number':            np.int32,
+    'Step Index':              np.int16,
+    'Test Time (s)':           np.float64,
+    'Potential (V)':           np.float64,
+    'Current (A)':             np.float32,
+    'Charge Capacity (Ah)':    np.float32,
+    'Discharge Capacity (Ah)': np.float32,
+    'dQ/dV (Ah/V)':            np.float32,
+}
+
+SCHEMA_FORMATION = {
+    'Cycle Number':            np.int32,
+    'Step Index':              np.int16,
+    'Test Time (s)':           np.float64,
+    'Step Time (s)':           np.float64,
+    'Potential (V)':           np.float64,
+    'Current (A)':             np.float32,
+    'Charge Capacity (Ah)':    np.float32,
+    'Discharge Capacity (Ah)': np.float32,
+}
+
+SCHEMA_CYCLES = {
+    'Cycle Number':                       np.int32,
+    'Charge Capacity (Ah)':               np.float32,
+    'Discharge Capacity (Ah)':            np.float32,
+    'Cumulative Discharge Capacity (Ah)': np.float64,
+    'Total Charge Time (s)':              np.float64,
+}
+
+# Columns and dtypes kept by the memory-mapped ('mmap') timeseries backend
+# when not compact: the same columns at full precision
+TIMESERIES_STORE_DTYPES = {
+    'Cycle Number':            np.int32,
+    'Step Index':              np.int16,
+    'Test Time (s)':           np.float64,
+    'Potential (V)':           np.float64,
+    'Current (A)':             np.float64,
+    'Charge Capacity (Ah)':    np.float64,
+    'Discharge Capacity (Ah)': np.float64,
+    'dQ/dV (Ah/V)':            np.float64,
+}
+
+SCHEMAS = {'formation': SCHEMA_FORMATION,
+           'timeseries': SCHEMA_TIMESERIES,
+           'cycles': SCHEMA_CYCLES}
+
+# Relative tolerance between the features computed from compact and
+# full-width loads (float32 rounding of currents and per-cycle capacities;
+# voltages are not narrowed, see SCHEMA_TIMESERIES)
+COMPACT_FEATURE_RTOL = 1e-4
+
+# Step semantics of the aging and formation protocols are declared in
+# src.schedules; the aging step indices are kept here for existing callers.
 
 # Configure step indices during cycling RPTs
-STEP_INDEX_C3_CHARGE = 7
-STEP_INDEX_C3_DISCHARGE = 10
-STEP_INDEX_C20_CHARGE = 13
-STEP_INDEX_C20_DISCHARGE = 16
-STEP_INDEX_HPPC_CHARGE = 22
-STEP_INDEX_HPPC_DISCHARGE = 24
+STEP_INDEX_C3_CHARGE = AGING_SCHEDULE.get_step('c3_charge')
+STEP_INDEX_C3_DISCHARGE = AGING_SCHEDULE.get_step('c3_discharge')
+STEP_INDEX_C20_CHARGE = AGING_SCHEDULE.get_step('c20_charge')
+STEP_INDEX_C20_DISCHARGE = AGING_SCHEDULE.get_step('c20_discharge')
+STEP_INDEX_REST_TOP_4P2V = AGING_SCHEDULE.get_step('rest_top_4p2v')
+STEP_INDEX_HPPC_CHARGE = AGING_SCHEDULE.get_step('hppc_pulse_charge')
+STEP_INDEX_HPPC_DISCHARGE = AGING_SCHEDULE.get_step('hppc_pulse_discharge')
+HPPC_PULSE_STEPS = {'discharge': STEP_INDEX_HPPC_DISCHARGE,
+                    'charge': STEP_INDEX_HPPC_CHARGE}
+
+# Pulse statistics returned as 'data' by the HPPC methods
+HPPC_DATA_COLUMNS = ['capacity', 'voltage', 'resistance_1s_ohm',
+                     'resistance_3s_ohm', 'resistance_10s_ohm', 'current']
 
 # Configure step indices during cycling 1C charge-discharges
-STEP_INDEX_CYCLING_CHARGE_CC = 30
-STEP_INDEX_CYCLING_CHARGE_CV = 31
-STEP_INDEX_CYCLING_CHARGE_REST = 32
-STEP_INDEX_CYCLING_DISCHARGE_CC = 33
-STEP_INDEX_CYCLING_DISCHARGE_REST = 34
-
-# Configure step indices during formation
-STEP_INDEX_FORMATION_C20_CHARGE_BASELINE = 10
-STEP_INDEX_FORMATION_C20_DISCHARGE_BASELINE = 13
-STEP_INDEX_FORMATION_C20_CHARGE_FAST = 11
-STEP_INDEX_FORMATION_C20_DISCHARGE_FAST = 14
-STEP_INDEX_FORMATION_FIRST_DISCHARGE_BASELINE = 6
-STEP_INDEX_FORMATION_FIRST_DISCHARGE_FAST = 9
-STEP_INDEX_FORMATION_FIRST_DISCHARGE_REST_BASELINE = 7
-STEP_INDEX_FORMATION_FIRST_DISCHARGE_REST_FAST = [] # Does not exist
+STEP_INDEX_CYCLING_CHARGE_CC = AGING_SCHEDULE.get_step('cycling_charge_cc')
+STEP_INDEX_CYCLING_CHARGE_CV = AGING_SCHEDULE.get_step('cycling_charge_cv')
+STEP_INDEX_CYCLING_CHARGE_REST = AGING_SCHEDULE.get_step('cycling_charge_rest')
+STEP_INDEX_CYCLING_DISCHARGE_CC = AGING_SCHEDULE.get_step('cycling_discharge_cc')
+STEP_INDEX_CYCLING_DISCHARGE_REST = AGING_SCHEDULE.get_step('cycling_discharge_rest')
+
+# Step schedule of each formation protocol, as named in the metadata
+FORMATION_SCHEDULES = {'Baseline': FORMATION_BASELINE_SCHEDULE,
+                       'Fast': FORMATION_FAST_SCHEDULE}
 
 # This is a fixed number for this experiment
 NUM_TOTAL_CELLS = 40
@@ -58,9 +157,28 @@ class FormationCell:
     to process and summarize key features from each part of the test.
     """
 
-    def __init__(self, cellid):
+    def __init__(self, cellid, use_cache=True, backend='pandas', compact=False):
+        """
+        Args:
+          cellid (int): cell number
+          use_cache (bool): read raw data through the columnar on-disk cache
+          backend (str): storage for the aging timeseries:
+            - 'pandas': hold the full table as a DataFrame in memory
+            - 'mmap': hold the columns in TIMESERIES_STORE_DTYPES (or
+              SCHEMA_TIMESERIES if `compact`) as memory-mapped arrays; `get_aging_data_timeseries` then returns
+              a ColumnStore and only the rows being processed are loaded
+          compact (bool): read only the columns in SCHEMAS, downcast to the
+            dtypes listed there. Features agree with full-width loads to
+            within COMPACT_FEATURE_RTOL.
+        """
+
+        assert backend in ('pandas', 'mmap'), \
+            'Backend must be either "pandas" or "mmap"'
 
         self.cellid = cellid
+        self.use_cache = use_cache
+        self.backend = backend
+        self.compact = compact
 
         # Initialize DataFrames
         self._df_timeseries = pd.DataFrame()
@@ -68,8 +186,16 @@ class FormationCell:
         self._df_formation = pd.DataFrame()
         self._df_esoh_fitting_results = pd.DataFrame()
 
+        # Row-range index into the aging timeseries
+        self._timeseries_index = None
+
+        # Table and samples of all HPPC pulses
+        self._df_hppc_pulses = None
+        self._hppc_pulse_store = None
+
         # Initialize dictionaries
         self._metadata_dict = dict()
+        self._load_times = dict()
 
 
     def __repr__(self):
@@ -105,16 +231,15 @@ class FormationCell:
 
     def _load_metadata(self):
         """
-        Retrieve metadata for this cell
+        Retrieve metadata for this cell from the shared metadata registry
 
         Assigns data as object property
         """
 
-        df = pd.read_excel(PATH_METADATA, engine="openpyxl")
-
-        df = df[df['cell_number'] == self.cellid]
+        registry = get_metadata_registry(get_path('PATH_METADATA'),
+                                         get_path('PATH_CACHE'))
 
-        self._metadata_dict = df.to_dict('records')[0]
+        self._metadata_dict = registry.get(self.cellid)
 
 
     def is_baseline_formation(self):
@@ -127,6 +252,18 @@ class FormationCell:
         return df['formation_protocol'] == 'Baseline'
 
 
+    def get_formation_schedule(self):
+        """
+        Returns the step schedule of this cell's formation protocol (see
+        src.schedules)
+        """
+
+        if self.is_baseline_formation():
+            return FORMATION_SCHEDULES['Baseline']
+
+        return FORMATION_SCHEDULES['Fast']
+
+
     def is_plating(self):
         """
         Has this cell plated lithium?
@@ -207,15 +344,9 @@ class FormationCell:
         Assigns data as object property
         """
 
-        regex = f'UM_Internal_0620_*_{self.cellid}.*.csv'
+        file = self._find_file('formation')
 
-        file = glob.glob(f'{PATH_FORMATION}/{regex}')
-
-        assert len(file) == 1, f'File is missing or more than one file ' \
-                               f'is associated with cell {self.cellid}. ' \
-                               f'Check "{PATH_FORMATION}/{regex}"'
-
-        df = pd.read_csv(file[0])
+        df = self._read_csv(file, 'formation')
 
         # Make cycle number start from 1, not 0, to follow standard convention
         df['Cycle Number'] += 1
@@ -226,6 +357,9 @@ class FormationCell:
     def get_aging_data_timeseries(self):
         """
         Get timeseries data with caching implementation
+
+        Returns:
+          A Pandas DataFrame, or a ColumnStore for the 'mmap' backend
         """
 
         if self._df_timeseries.empty:
@@ -241,18 +375,212 @@ class FormationCell:
         Assigns data as object property
         """
 
-        regex = f'UM_Internal_0620_*_Cycling_Cell_{self.cellid}.*.csv'
-
-        file = glob.glob(f'{PATH_TIMESERIES}/{regex}')
+        file = self._find_file('timeseries')
 
-        assert len(file) == 1, f'More than one file associated with ' \
-                               f'cell {self.cellid}'
+        if self.backend == 'mmap':
+            self._df_timeseries = self._load_column_store(file, 'timeseries')
+            self._timeseries_index = None
+            return
 
-        df = pd.read_csv(file[0])
+        df = self._read_csv(file, 'timeseries')
 
         df['Cycle Number'] += 1
 
         self._df_timeseries = df
+        self._timeseries_index = None
+
+
+    def get_aging_data_index(self):
+        """
+        Get the (cycle, step) row-range index of the aging timeseries with
+        caching implementation
+
+        Returns:
+          A StepRowIndex
+        """
+
+        if self._timeseries_index is None:
+            df = self.get_aging_data_timeseries()
+            self._timeseries_index = StepRowIndex(np.asarray(df['Cycle Number']),
+                                                  np.asarray(df['Step Index']))
+
+        return self._timeseries_index
+
+
+    def get_aging_data_rows(self, cycle_index, step_index=None):
+        """
+        Return the aging timeseries rows for a cycle, or for one step within a
+        cycle, using the row-range index
+
+        Args:
+          cycle_index (int): cycle number
+          step_index (int): step index; if None, return the whole cycle
+
+        Returns:
+          Pandas DataFrame containing only the requested rows
+        """
+
+        df = self.get_aging_data_timeseries()
+        index = self.get_aging_data_index()
+
+        if step_index is None:
+            slices = index.get_cycle_slices(cycle_index)
+        else:
+            slices = index.get_step_slices(cycle_index, step_index)
+
+        if isinstance(df, ColumnStore):
+            return df.take_slices(slices)
+
+        return take_slices(df, slices)
+
+
+    def iter_aging_data_cycles(self, chunksize=STREAM_CHUNK_ROWS):
+        """
+        Stream the aging timeseries from the raw CSV file one cycle at a time,
+        without holding the full table in memory.
+
+        Rows are read `chunksize` at a time; with `compact` only the columns
+        in SCHEMA_TIMESERIES are read. Nothing is cached on the object.
+
+        Args:
+          chunksize (int): number of rows read per chunk
+
+        Yields:
+          (cycle index, Pandas DataFrame holding the rows of that cycle)
+        """
+
+        file = self._find_file('timeseries')
+
+        kwargs = dict()
+        if self.compact:
+            kwargs = dict(usecols=list(SCHEMA_TIMESERIES), dtype=SCHEMA_TIMESERIES)
+
+        yield from iter_csv_cycles(file, chunksize,
+                                   transform=self._shift_cycle_number, **kwargs)
+
+
+    def _iter_diagnostic_cycles(self, step_index, stream=False):
+        """
+        Yield the aging timeseries of each cycle containing a step index
+
+        Args:
+          step_index (int or list of int): step index marking the diagnostic
+            test; with a list, cycles containing any of the step indices
+          stream (bool): read the cycles from the raw CSV file one at a time
+            (see `iter_aging_data_cycles`) instead of loading the full table
+
+        Yields:
+          (cycle index, Pandas DataFrame holding the rows of that cycle)
+        """
+
+        step_indices = np.atleast_1d(step_index)
+
+        if stream:
+            for cycle_index, df in self.iter_aging_data_cycles():
+                if df['Step Index'].isin(step_indices).any():
+                    yield cycle_index, df
+            return
+
+        index = self.get_aging_data_index()
+
+        cycle_indices = np.unique(np.concatenate(
+            [index.get_cycles_with_step(step) for step in step_indices]))
+
+        for cycle_index in cycle_indices:
+            yield cycle_index, self.get_aging_data_rows(cycle_index)
+
+
+    def _find_file(self, dataset):
+        """
+        Returns the path of the raw data file for this cell, looked up in the
+        shared manifest of the dataset directory
+
+        Args:
+          dataset (str): 'formation', 'timeseries' or 'cycles'
+        """
+
+        path_name, pattern = RAW_DATA_FILES[dataset]
+
+        return get_manifest(get_path(path_name), pattern).get_file(self.cellid)
+
+
+    def _read_csv(self, file, dataset):
+        """
+        Read a raw data file, going through the columnar cache if enabled.
+
+        Records the load time and whether the cache was hit under `dataset`.
+        """
+
+        cache_dir = get_path('PATH_CACHE') if self.use_cache else None
+
+        with Timer() as timer:
+            if self.compact:
+                df, is_cached = read_csv_schema(file, SCHEMAS[dataset], cache_dir)
+            elif self.use_cache:
+                df, is_cached = read_csv_cached(file, cache_dir)
+            else:
+                df, is_cached = pd.read_csv(file), False
+
+        self._record_load_time(dataset, timer.seconds, is_cached)
+
+        return df
+
+
+    def _load_column_store(self, file, dataset):
+        """
+        Open a raw data file as a memory-mapped ColumnStore, building the
+        store on first use.
+
+        Cycle numbers are shifted to start from 1, as in the other loaders.
+        The columns are stored at full precision unless `compact`.
+        """
+
+        dtypes = SCHEMA_TIMESERIES if self.compact else TIMESERIES_STORE_DTYPES
+
+        with Timer() as timer:
+            store, is_cached = load_column_store(file, get_path('PATH_CACHE'),
+                                                 dtypes,
+                                                 transform=self._shift_cycle_number,
+                                                 variant='cycle_number_from_1')
+
+        self._record_load_time(dataset, timer.seconds, is_cached)
+
+        return store
+
+
+    @staticmethod
+    def _shift_cycle_number(df):
+        """
+        Make cycle numbers start from 1, not 0, to follow standard convention
+        """
+
+        df['Cycle Number'] += 1
+
+        return df
+
+
+    def _record_load_time(self, dataset, seconds, is_cached):
+        """
+        Record and print the load time of a dataset
+        """
+
+        self._load_times[dataset] = {'seconds': seconds,
+                                     'cached': is_cached}
+
+        print(f'Cell {self.cellid}: loaded {dataset} data in '
+              f'{seconds:.2f}s ({"warm" if is_cached else "cold"})')
+
+
+    def get_load_times(self):
+        """
+        Returns the load times of the datasets read so far as a dict.
+
+        Each value is a dict holding:
+          - seconds: wall time spent reading the file
+          - cached: True if the columnar cache was hit (warm load)
+        """
+
+        return self._load_times
 
 
     def _load_esoh_fitting_results(self):
@@ -260,7 +588,7 @@ class FormationCell:
         Retrive pre-calculated summary results from the eSOH fitting
         """
 
-        file = glob.glob(f'{PATH_ESOH_SUMMARY}')
+        file = glob.glob(get_path('PATH_ESOH_SUMMARY'))
 
         df = pd.read_csv(file[0])
         df = df[(df['cellid'] == self.cellid)]
@@ -276,8 +604,12 @@ class FormationCell:
           - A list of dictionaries. Each dictionary holds
         """
 
+        import json
+        import natsort
+
         # Load in the json files
-        file_list = glob.glob(f'{PATH_ESOH_DATA}/cell_{self.cellid}_*.json')
+        path_name, pattern = ESOH_DATA_FILES
+        file_list = get_manifest(get_path(path_name), pattern).get_files(self.cellid)
 
         file_list = natsort.natsorted(file_list)
 
@@ -325,14 +657,9 @@ class FormationCell:
           A Pandas DataFrame
         """
 
-        regex = f'UM_Internal_0620_*_Cell_{self.cellid}.*.csv'
-
-        file = glob.glob(f'{PATH_CYCLE}/{regex}')
-
-        assert len(file) == 1, f'More than one file associated with ' \
-                               f'cell {self.cellid}'
+        file = self._find_file('cycles')
 
-        df = pd.read_csv(file[0])
+        df = self._read_csv(file, 'cycles')
 
         # Make cycle number start at 1 instead of 0
         df['Cycle Number'] += 1
@@ -355,23 +682,28 @@ class FormationCell:
            Pandas DataFrame containing only the data for this cycle
         """
 
-        df = self.get_aging_data_timeseries()
-
-        df = df[ (df['Cycle Number'] == cycle_index) & \
-                 (df['Step Index'] == STEP_INDEX_CYCLING_DISCHARGE_CC) ]
+        df = self.get_aging_data_rows(cycle_index, STEP_INDEX_CYCLING_DISCHARGE_CC)
 
         assert not df.empty, f'No data found for cycle index {cycle_index}'
 
         return df
 
 
-    def export_diagnostic_c20_data(self):
+    def export_diagnostic_c20_data(self, file=None):
         """
         Writes csv files to disk containing the raw C/20 voltage data
+
+        Args:
+          file (str): if given, write all cycles into this HDF5 container
+            instead (see src.export)
         """
 
         results = self.process_diagnostic_c20_data()
 
+        if file is not None:
+            write_diagnostic_results(file, self.cellid, 'c20', results)
+            return
+
         for res in results:
 
             chg_output = pd.DataFrame({'chg_capacity': res['chg_capacity'],
@@ -389,81 +721,118 @@ class FormationCell:
                             f'cyc_{res["cycle_index"]}_discharge.csv')
 
 
+    def export_diagnostic_data(self, file=None, stream=False):
+        """
+        Writes the C/20 curves and the processed and raw HPPC pulses of all
+        RPTs into one compressed HDF5 container, with one group per cycle.
+        Read the results back with `src.export.read_diagnostic_results`.
+
+        Args:
+          file (str): path to the container; defaults to
+            'diagnostic_data_cell_<cellid>.h5' in the current directory
+          stream (bool): process the aging test one cycle at a time
+
+        Returns:
+          the path to the container
+        """
+
+        if file is None:
+            file = f'diagnostic_data_cell_{self.cellid}.h5'
+
+        write_diagnostic_results(file, self.cellid, 'c20',
+                                 self.process_diagnostic_c20_data(stream=stream))
+        write_diagnostic_results(file, self.cellid, 'hppc_discharge',
+                                 self.process_diagnostic_hppc_discharge_data(stream=stream))
+        write_diagnostic_results(file, self.cellid, 'hppc_charge',
+                                 self.process_diagnostic_hppc_charge_data(stream=stream))
+
+        return file
 
-    def process_diagnostic_c3_data(self):
+
+    def process_diagnostic_c3_data(self, stream=False):
         """
         Filters out aging timeseries data to include only C/3 charge and
         discharge curves
 
+        Args:
+          stream (bool): process the aging test one cycle at a time from the
+            raw CSV file, bounding memory by the largest cycle
+
         Returns:
           A list of dictionaries containing the results
         """
 
-        df = self.get_aging_data_timeseries()
-
-        df_c3_charge = df[df['Step Index'] == STEP_INDEX_C3_CHARGE]
-        df_c3_discharge = df[df['Step Index'] == STEP_INDEX_C3_DISCHARGE]
-
-        c3_test_cycle_indices = np.unique(df_c3_charge['Cycle Number'])
+        return [self._process_diagnostic_c3_cycle(idx_cyc, df_cyc)
+                for idx_cyc, df_cyc in
+                self._iter_diagnostic_cycles(STEP_INDEX_C3_CHARGE, stream)]
 
-        results = []
 
-        for idx_cyc in c3_test_cycle_indices:
+    @staticmethod
+    def _process_diagnostic_c3_cycle(idx_cyc, df_cyc):
+        """
+        Extract the C/3 charge and discharge curves from one cycle of the
+        aging timeseries
+        """
 
-            df_chg = df_c3_charge[df_c3_charge['Cycle Number'] == idx_cyc]
-            df_dch = df_c3_discharge[df_c3_discharge['Cycle Number'] == idx_cyc]
+        step_type = AGING_SCHEDULE.label(df_cyc['Step Index'].values)
 
-            curr_dict = dict()
+        df_chg = df_cyc[step_type == 'c3_charge']
+        df_dch = df_cyc[step_type == 'c3_discharge']
 
-            curr_dict['cycle_index'] = idx_cyc
-            curr_dict['chg_capacity'] = df_chg['Charge Capacity (Ah)'].astype('float')
-            curr_dict['chg_voltage'] = df_chg['Potential (V)'].astype('float')
-            curr_dict['chg_dvdq'] = 1/df_chg['dQ/dV (Ah/V)'].astype('float')
-            curr_dict['dch_capacity'] = df_dch['Discharge Capacity (Ah)'].astype('float')
-            curr_dict['dch_voltage'] = df_dch['Potential (V)'].astype('float')
-            curr_dict['dch_dvdq'] = 1/df_dch['dQ/dV (Ah/V)'].astype('float')
+        curr_dict = dict()
 
-            results.append(curr_dict)
+        curr_dict['cycle_index'] = idx_cyc
+        curr_dict['chg_capacity'] = df_chg['Charge Capacity (Ah)'].astype('float')
+        curr_dict['chg_voltage'] = df_chg['Potential (V)'].astype('float')
+        curr_dict['chg_dvdq'] = 1/df_chg['dQ/dV (Ah/V)'].astype('float')
+        curr_dict['dch_capacity'] = df_dch['Discharge Capacity (Ah)'].astype('float')
+        curr_dict['dch_voltage'] = df_dch['Potential (V)'].astype('float')
+        curr_dict['dch_dvdq'] = 1/df_dch['dQ/dV (Ah/V)'].astype('float')
 
-        return results
+        return curr_dict
 
 
-    def process_diagnostic_c20_data(self):
+    def process_diagnostic_c20_data(self, stream=False):
         """
         Filters out aging timeseries data to include only C/20 charge and
         discharge curves
 
+        Args:
+          stream (bool): process the aging test one cycle at a time from the
+            raw CSV file, bounding memory by the largest cycle
+
         Returns:
           A list of dictionaries containing the results
         """
 
-        df = self.get_aging_data_timeseries()
-
-        df_c20_charge = df[df['Step Index'] == STEP_INDEX_C20_CHARGE]
-        df_c20_discharge = df[df['Step Index'] == STEP_INDEX_C20_DISCHARGE]
+        return [self._process_diagnostic_c20_cycle(idx_cyc, df_cyc)
+                for idx_cyc, df_cyc in
+                self._iter_diagnostic_cycles(STEP_INDEX_C20_CHARGE, stream)]
 
-        c20_test_cycle_indices = np.unique(df_c20_charge['Cycle Number'])
 
-        results = []
-
-        for idx_cyc in c20_test_cycle_indices:
+    @staticmethod
+    def _process_diagnostic_c20_cycle(idx_cyc, df_cyc):
+        """
+        Extract the C/20 charge and discharge curves from one cycle of the
+        aging timeseries
+        """
 
-            df_chg = df_c20_charge[df_c20_charge['Cycle Number'] == idx_cyc]
-            df_dch = df_c20_discharge[df_c20_discharge['Cycle Number'] == idx_cyc]
+        step_type = AGING_SCHEDULE.label(df_cyc['Step Index'].values)
 
-            curr_dict = dict()
+        df_chg = df_cyc[step_type == 'c20_charge']
+        df_dch = df_cyc[step_type == 'c20_discharge']
 
-            curr_dict['cycle_index'] = idx_cyc
-            curr_dict['chg_capacity'] = df_chg['Charge Capacity (Ah)']
-            curr_dict['chg_voltage'] = df_chg['Potential (V)']
-            curr_dict['chg_dvdq'] = 1/df_chg['dQ/dV (Ah/V)']
-            curr_dict['dch_capacity'] = df_dch['Discharge Capacity (Ah)']
-            curr_dict['dch_voltage'] = df_dch['Potential (V)']
-            curr_dict['dch_dvdq'] = 1/df_dch['dQ/dV (Ah/V)']
+        curr_dict = dict()
 
-            results.append(curr_dict)
+        curr_dict['cycle_index'] = idx_cyc
+        curr_dict['chg_capacity'] = df_chg['Charge Capacity (Ah)']
+        curr_dict['chg_voltage'] = df_chg['Potential (V)']
+        curr_dict['chg_dvdq'] = 1/df_chg['dQ/dV (Ah/V)']
+        curr_dict['dch_capacity'] = df_dch['Discharge Capacity (Ah)']
+        curr_dict['dch_voltage'] = df_dch['Potential (V)']
+        curr_dict['dch_dvdq'] = 1/df_dch['dQ/dV (Ah/V)']
 
-        return results
+        return curr_dict
 
 
     def get_formation_test_final_c20_charge(self):
@@ -472,16 +841,12 @@ class FormationCell:
         """
 
         df = self.get_formation_data()
+        schedule = self.get_formation_schedule()
 
-        if self.is_baseline_formation():
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number'])
-            step_index_c20_charge = STEP_INDEX_FORMATION_C20_CHARGE_BASELINE
-        else:
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number']) - 1
-            step_index_c20_charge = STEP_INDEX_FORMATION_C20_CHARGE_FAST
+        CYCLE_INDEX_LAST = schedule.get_cycle('final', np.max(df['Cycle Number']))
 
         df_c20_charge = df[(df['Cycle Number'] == CYCLE_INDEX_LAST) &
-                           (df['Step Index'] == step_index_c20_charge)]
+                           schedule.select(df['Step Index'].values, 'c20_charge')]
 
 
         return df_c20_charge
@@ -502,33 +867,14 @@ class FormationCell:
 
         df = self.get_formation_test_final_c20_charge()
 
-        capacity = df['Charge Capacity (Ah)'].values
-        voltage = df['Potential (V)'].values
-
-        # Exclude values above 1.5Ah from this analysis.
-        to_keep = capacity < 1.25
-        voltage = voltage[to_keep]
-        capacity = capacity[to_keep]
-
-        dvdq = np.gradient(voltage)/np.gradient(capacity)
-
-        dvdq_smoothed = savgol_filter(dvdq, 5, 3)
-
-        idx_peaks, properties = find_peaks(dvdq_smoothed, height=0.35, prominence=0.005)
-
-
-        # Discard first if there are three peaks
-        if len(idx_peaks) == 3:
-            idx_peaks = idx_peaks[1::]
-            properties['peak_heights'] = properties['peak_heights'][1::]
-
-        assert len(idx_peaks) == 2, "Too many peaks found."
+        capacity, dvdq_smoothed, idx_peaks, peak_heights = \
+            get_dvdq_peaks(df['Charge Capacity (Ah)'].values, df['Potential (V)'].values)
 
         capacity_peak_to_peak_ah = capacity[idx_peaks[-1]] - capacity[idx_peaks[0]]
 
-        assert capacity_peak_to_peak_ah > 0, "Something went wrong with the peak indexing."
-
         if to_plot:
+            from matplotlib import pyplot as plt
+
             plt.figure()
             plt.plot(capacity, dvdq_smoothed)
             plt.plot(capacity[idx_peaks], dvdq_smoothed[idx_peaks], 'o')
@@ -538,7 +884,7 @@ class FormationCell:
             plt.savefig(f'qpp_cell_{self.cellid}.png')
             plt.close()
 
-        right_peak_height_v_per_ah = properties['peak_heights'][-1]
+        right_peak_height_v_per_ah = peak_heights[-1]
 
         return capacity_peak_to_peak_ah, right_peak_height_v_per_ah
 
@@ -549,16 +895,12 @@ class FormationCell:
         """
 
         df = self.get_formation_data()
+        schedule = self.get_formation_schedule()
 
-        if self.is_baseline_formation():
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number'])
-            step_index_c20_discharge = STEP_INDEX_FORMATION_C20_DISCHARGE_BASELINE
-        else:
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number']) - 1
-            step_index_c20_discharge = STEP_INDEX_FORMATION_C20_DISCHARGE_FAST
+        CYCLE_INDEX_LAST = schedule.get_cycle('final', np.max(df['Cycle Number']))
 
         df_c20_discharge = df[(df['Cycle Number'] == CYCLE_INDEX_LAST) &
-                              (df['Step Index'] == step_index_c20_discharge)]
+                              schedule.select(df['Step Index'].values, 'c20_discharge')]
 
         return df_c20_discharge
 
@@ -569,30 +911,27 @@ class FormationCell:
         Return summary statistics from the formation cycle
         """
 
+        from scipy import interpolate
+
         df = self.get_formation_data()
 
         res_dict = dict()
 
+        # Label every row with its step category once; the schedule of each
+        # protocol accounts for the schedule file differences
+        schedule = self.get_formation_schedule()
+        step_type = schedule.label(df['Step Index'].values)
+
         # Index for cycle containing the final discharge capacity
-        # Work around some quirks due to schedule file differences
-        if self.is_baseline_formation():
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number'])
-            step_index_c20_charge = STEP_INDEX_FORMATION_C20_CHARGE_BASELINE
-            step_index_first_discharge = STEP_INDEX_FORMATION_FIRST_DISCHARGE_BASELINE
-            step_index_first_discharge_rest = STEP_INDEX_FORMATION_FIRST_DISCHARGE_REST_BASELINE
-        else:
-            CYCLE_INDEX_LAST = np.max(df['Cycle Number']) - 1
-            step_index_c20_charge = STEP_INDEX_FORMATION_C20_CHARGE_FAST
-            step_index_first_discharge = STEP_INDEX_FORMATION_FIRST_DISCHARGE_FAST
-            step_index_first_discharge_rest = STEP_INDEX_FORMATION_FIRST_DISCHARGE_REST_FAST
+        CYCLE_INDEX_LAST = schedule.get_cycle('final', np.max(df['Cycle Number']))
 
-        df_first_cycle = df[df['Cycle Number'] == 1]
+        df_first_cycle = df[df['Cycle Number'] == schedule.get_cycle('first_cycle')]
         df_last_cycle = df[df['Cycle Number'] == CYCLE_INDEX_LAST]
 
         df_c20_charge = df[(df['Cycle Number'] == CYCLE_INDEX_LAST) &
-                           (df['Step Index'] == step_index_c20_charge)]
+                           (step_type == 'c20_charge')]
 
-        df_first_discharge = df[(df['Step Index'] == step_index_first_discharge)]
+        df_first_discharge = df[step_type == 'first_discharge']
 
         # Extract "capacity below 3.2V" metric as a proxy to low-SOC resistance
         idx_below_3p2v = np.where(df_first_discharge['Potential (V)'] < 3.2)[0]
@@ -605,8 +944,8 @@ class FormationCell:
         res_dict['form_first_discharge_capacity_below_3p2v_ah'] = cap_vec_below_3p2v.iloc[-1] - cap_vec_below_3p2v.iloc[0]
 
         # Extract "voltage rebound after initial discharge" as a proxy to low-SOC resistance
-        if step_index_first_discharge_rest:
-            df_first_discharge_rest = df[(df['Step Index'] == step_index_first_discharge_rest) &
+        if schedule.get_steps('first_discharge_rest'):
+            df_first_discharge_rest = df[(step_type == 'first_discharge_rest') &
                                          (df['Cycle Number'] == 1)]
 
             rest_voltage_arr = df_first_discharge_rest['Potential (V)']
@@ -675,52 +1014,23 @@ class FormationCell:
         res_dict['form_final_discharge_capacity_ah'] = np.max(df_last_cycle['Discharge Capacity (Ah)'])
 
         # Process voltage decay signal during 12-hour rest step
-        STEP_INDEX_6HR_REST = 12 if self.is_baseline_formation() else 13
-        CYCLE_INDEX_6HR_REST = 3 if self.is_baseline_formation() else 7
-        VOLTAGE_MAXIMUM = 4.2
+        CYCLE_INDEX_6HR_REST = schedule.get_cycle('six_hour_rest')
 
         df_6hr_rest = df[(df['Cycle Number'] == CYCLE_INDEX_6HR_REST) &
-                         (df['Step Index'] == STEP_INDEX_6HR_REST)]
-
-        x = df_6hr_rest['Step Time (s)']
-        y = df_6hr_rest['Potential (V)']
-
-        # Smooth the signal
-        y_smoothed = savgol_filter(y, 41, 3)
-        voltage_final = y_smoothed[-1]
-        delta_voltage = VOLTAGE_MAXIMUM - voltage_final
-
-        # Extract the voltage drop for different time cutoffs
-        # e.g. 0 to 1 hour, 0 to 2 hours
-        for time_cutoff_hr in [1, 2, 3, 4, 5, 6]:
-            these_voltages = y_smoothed[x < time_cutoff_hr * 3600]
-            res_dict[f'form_6hr_rest_delta_voltage_v_0_to_{time_cutoff_hr}_hr'] = \
-                y_smoothed[0] - these_voltages[-1]
-
-        for time_cutoff_hr in [0, 1, 2, 3, 4, 5]:
-            these_voltages = y_smoothed[x > time_cutoff_hr * 3600]
-            final_voltage = y_smoothed[-1]
-            res_dict[f'form_6hr_rest_delta_voltage_v_{time_cutoff_hr}_to_6_hr'] = \
-                these_voltages[0] - final_voltage
-
-        # Estimate steady-state dV/dt using data from the last two hours
-        x_steady = x[x > 4 * 3600]
-        y_steady = y_smoothed[x > 4 * 3600]
-        volts_per_second = stats.linregress(x_steady, y_steady)[0]
-        mv_per_day_steady = volts_per_second * 86400 * 1000
-
-        # Estimate initial dV/dt using data from the first 15 minutes
-        x_initial = x[x < 15 * 60]
-        y_initial = y_smoothed[x < 15 * 60]
-        volts_per_second = stats.linregress(x_initial, y_initial)[0]
-        mv_per_sec_initial = volts_per_second * 1000
+                         (step_type == 'six_hour_rest')]
+
+        rest_features = get_rest_decay_features(df_6hr_rest['Step Time (s)'],
+                                                df_6hr_rest['Potential (V)'])
+
+        # Voltage drop for different time cutoffs
+        res_dict.update({key: value for key, value in rest_features.items()
+                         if key.startswith('form_6hr_rest_delta_voltage_v_')})
 
 
         # Process current bump signal during first CV hold step
-        STEP_INDEX_FIRST_CV_HOLD = 4 if self.is_baseline_formation() else 5
-        CYCLE_INDEX_FIRST_CV_HOLD = 1 if self.is_baseline_formation() else 1
+        CYCLE_INDEX_FIRST_CV_HOLD = schedule.get_cycle('first_cv_hold')
         df_first_cv_hold = df[(df['Cycle Number'] == CYCLE_INDEX_FIRST_CV_HOLD) &
-                              (df['Step Index'] == STEP_INDEX_FIRST_CV_HOLD)]
+                              (step_type == 'first_cv_hold')]
 
         cv_hold_capacity = df_first_cv_hold['Charge Capacity (Ah)'].iloc[-1] - \
                            df_first_cv_hold['Charge Capacity (Ah)'].iloc[0]
@@ -737,18 +1047,18 @@ class FormationCell:
         res_dict['form_c20_charge_right_peak_v_per_ah'] = c20_charge_right_peak_v_per_ah
 
         # (+) DEF: Delta voltage after 6 hour rest at 100% SOC (preceded by a C/100 CV cut)
-        res_dict['form_6hr_rest_delta_voltage_v'] = delta_voltage
+        res_dict['form_6hr_rest_delta_voltage_v'] = rest_features['form_6hr_rest_delta_voltage_v']
 
         # (+) DEF: Final voltage after 6 hour rest at 100% SOC (preceded by a C/100 CV cut)
-        res_dict['form_6hr_rest_voltage_v'] = voltage_final
+        res_dict['form_6hr_rest_voltage_v'] = rest_features['form_6hr_rest_voltage_v']
 
         # (+) DEF: Steady-state voltage decay rate after 6 hour rest at 100% SOC (mV/day)
         #     (Averaged over last 2 hours)
-        res_dict['form_6hr_rest_mv_per_day_steady'] = mv_per_day_steady
+        res_dict['form_6hr_rest_mv_per_day_steady'] = rest_features['form_6hr_rest_mv_per_day_steady']
 
         # (+) DEF: Initial voltage drop rate after 6 hour rest at 100% SOC (mV/sec)
         #      (Averaged over first 15 minutes)
-        res_dict['form_6hr_rest_mv_per_sec_initial'] = mv_per_sec_initial
+        res_dict['form_6hr_rest_mv_per_sec_initial'] = rest_features['form_6hr_rest_mv_per_sec_initial']
 
         # (+) DEF: First cycle CV hold capacity (Ah)
         res_dict['form_first_cv_hold_capacity_ah'] = cv_hold_capacity
@@ -775,6 +1085,8 @@ class FormationCell:
             - var q (scalar)
         """
 
+        from scipy import interpolate
+
         assert cyc1 > cyc0, 'Final cycle must be greater than initial cycle'
 
         df1 = self.get_aging_data_discharge_curve(cyc1)
@@ -820,6 +1132,8 @@ class FormationCell:
               - var q (scalar)
         """
 
+        from scipy import interpolate
+
         result_list = self.process_diagnostic_c20_data()
 
         var_q_dict = dict()
@@ -852,6 +1166,8 @@ class FormationCell:
             var_q_dict[f'var_q_c20_c{cyc1}_c{cyc0}_voltage_v'] = v_shared
 
             if to_plot:
+                from matplotlib import pyplot as plt
+
                 plt.figure()
                 plt.plot(delta_q, v_shared)
                 plt.xlabel('Capacity (Ah)')
@@ -1074,25 +1390,30 @@ class FormationCell:
         direction (default='discharge'): either 'charge' or 'discharge' pulses
         """
 
+        assert direction in HPPC_PULSE_STEPS, \
+            'Direction must be either "charge" or "discharge"'
+
+        pulses = self.get_hppc_pulses()
+
+        pulses = pulses[pulses['direction'] == direction]
+
         if direction == 'discharge':
-            results_list = self.process_diagnostic_hppc_discharge_data()
-        elif direction == 'charge':
-            results_list = self.process_diagnostic_hppc_charge_data()
-        else:
-            assert 'Direction must be either "charge" or "discharge"'
+            assert pulses['is_completed'].all(), "Pulse did not last 10 seconds."
+
+        pulses = pulses[pulses['is_completed']]
 
         stats = []
 
-        for result in results_list:
+        for cycle_index, data in pulses.groupby('cycle_index', observed=True):
 
-            data = result['data']
+            data = data[HPPC_DATA_COLUMNS].reset_index(drop=True)
 
             data.sort_values(by=['capacity'])
 
             soc_vec = data['capacity']/np.max(data['capacity'])
 
             curr_result = dict()
-            curr_result['cycle_index'] = result['cycle_index']
+            curr_result['cycle_index'] = cycle_index
 
             soc_target_list = np.array([0, 5, 7, 10, 15, 20, 30, 50, 70, 90, 100])/100
 
@@ -1125,34 +1446,41 @@ class FormationCell:
         return (stats, soc_target_list)
 
 
-    def process_diagnostic_4p2v_voltage_decay(self):
+    def process_diagnostic_4p2v_voltage_decay(self, stream=False):
         """
         Takes in raw data and returns summary statistics of the
         1-hour voltage decay starting from 4.2V, following the C/20 charge cycle
         in each RPT.
 
+        Parameters
+        ---------
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+
         Returns a list of dictionaries. Each dictionary holds:
           - cycle_index: cycle index containing the voltage decay data
           - voltage decay: measured 1-hour voltage decay from 4.2V
         """
 
-        df = self.get_aging_data_timeseries()
-
-        df_voltage_decay = df[df['Step Index'] == 15]
-
-        cycle_indices = np.unique(df_voltage_decay['Cycle Number'])
-
         results_list = list()
 
         VOLTAGE_MAXIMUM = 4.2
+        WINDOW_LENGTH = 41
+
+        cycle_list = []
+        voltage_list = []
 
-        for curr_cyc in cycle_indices:
+        for curr_cyc, curr_df in self._iter_diagnostic_cycles(STEP_INDEX_REST_TOP_4P2V, stream):
 
-            curr_df = df[df['Cycle Number'] == curr_cyc]
+            # The last smoothed point only depends on the last window
+            cycle_list.append(curr_cyc)
+            voltage_list.append(curr_df['Potential (V)'].values[-WINDOW_LENGTH:])
 
-            voltage = curr_df['Potential (V)']
+        # Smooth the voltage decays of all cycles in one batch
+        voltage_smoothed_list = savgol_filter_many(voltage_list, WINDOW_LENGTH, 3)
+
+        for curr_cyc, voltage_smoothed in zip(cycle_list, voltage_smoothed_list):
 
-            voltage_smoothed = savgol_filter(voltage, 41, 3)
             voltage_final = voltage_smoothed[-1]
             delta_voltage = VOLTAGE_MAXIMUM - voltage_final
 
@@ -1165,120 +1493,315 @@ class FormationCell:
         return results_list
 
 
-    def process_diagnostic_hppc_charge_data(self):
+    def get_hppc_pulses(self, stream=False):
         """
-        Takes in raw data and returns a data structure holding processed
-        HPPC discharge pulse information; uses step indices to infer start
-        and end of each pulse.
+        Returns a table of all HPPC pulses in the aging test, in both
+        directions, with caching implementation.
 
-        Outputs:
+        Charge and discharge pulses are extracted together in a single pass
+        over the HPPC cycles. `process_diagnostic_hppc_charge_data`,
+        `process_diagnostic_hppc_discharge_data` and
+        `summarize_hppc_pulse_statistics` are views over this table.
+
+        Parameters
         ---------
-        A list of dictionaries. Each dictionary holds:
-          - key: cycle index containing the HPPC cycle
-          - value: a Pandas DataFrame
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+
+        Returns
+        ---------
+        A Pandas DataFrame with one row per pulse, holding:
+          - cycle_index, direction ('charge' or 'discharge')
+          - row_start, row_stop: row positions of the pulse within its cycle
+          - capacity, voltage: charge capacity and voltage before the pulse
+          - resistance_1s_ohm, resistance_3s_ohm, resistance_10s_ohm
+          - current: absolute mean current during the pulse
+          - is_completed: True if the pulse lasted 10 seconds
         """
 
-        df = self.get_aging_data_timeseries()
+        if self._df_hppc_pulses is None:
+            self._load_hppc_pulses(stream)
 
-        df_hppc = df[df['Step Index'] == STEP_INDEX_HPPC_CHARGE]
-        hppc_cycle_indices = np.unique(df_hppc['Cycle Number'])
+        return self._df_hppc_pulses
 
-        results_list = list()
 
-        # Loop through each diagnostic test
-        for curr_cyc in hppc_cycle_indices:
+    def get_hppc_pulse_store(self, stream=False):
+        """
+        Returns the samples of all HPPC pulses as a PulseStore, with caching
+        implementation. Pulse i of the store is row i of `get_hppc_pulses`.
+
+        Parameters
+        ---------
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+        """
 
-            curr_df = df[df['Cycle Number'] == curr_cyc]
+        if self._hppc_pulse_store is None:
+            self._load_hppc_pulses(stream)
 
-            # Initialize a bunch of variables for exporting raw outputs
-            voltage_vec_all = []
-            capacity_0_vec_all = []
-            voltage_0_vec_all = []
-            current_vec_all = []
-            time_vec_all = []
-            df_raw_list = []
+        return self._hppc_pulse_store
 
-            # Process each pulse
-            pulse_list = []
-            for idx, point in enumerate(curr_df['Step Index'].values):
 
-                if idx == 0:
-                    continue
+    def get_hppc_resistance(self, times, stream=False):
+        """
+        Returns the resistance of every HPPC pulse at a list of times from the
+        start of the pulse, e.g. `np.logspace(-1, 1, 30)` seconds.
+
+        Resistances are evaluated on the stored pulse samples for all pulses
+        at once, without segmenting the timeseries again, and are defined as
+        in `get_hppc_pulses`: the voltage change from the last point before
+        the pulse divided by the mean pulse current, positive in both
+        directions. Times beyond the end of a pulse take the voltage at its
+        last sample.
+
+        Parameters
+        ---------
+        times (array-like): times in seconds
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+
+        Returns
+        ---------
+        A Pandas DataFrame with one row per pulse, indexed as the table from
+        `get_hppc_pulses`, and one column per time
+        """
+
+        pulses = self.get_hppc_pulses(stream)
+        store = self.get_hppc_pulse_store(stream)
+
+        times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+
+        voltage = store.interp_voltage(times)
+        voltage_0 = pulses['voltage'].values[:, np.newaxis]
+        current = pulses['current'].values[:, np.newaxis]
+        sign = np.where(pulses['direction'] == 'charge', 1, -1)[:, np.newaxis]
+
+        resistance = sign * (voltage - voltage_0) / current
+
+        return pd.DataFrame(resistance, index=pulses.index,
+                            columns=pd.Index(times, name='time_s'))
+
+
+    def fit_hppc_ecm(self, num_rc=2, stream=False, **kwargs):
+        """
+        Fit an equivalent circuit model, a series resistance and `num_rc` RC
+        pairs, to every HPPC pulse (see src.ecm).
+
+        All pulses of the cell are fit as one batch. Pulses are visited in
+        order of state of charge within each cycle and direction, and each
+        fit is warm started from the previous pulse of the same sweep.
+
+        Parameters
+        ---------
+        num_rc (default=2): number of RC pairs
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+        kwargs: passed on to src.ecm.fit_pulses
+
+        Returns
+        ---------
+        A Pandas DataFrame with one row per pulse, indexed as the table from
+        `get_hppc_pulses`, holding:
+          - cycle_index, direction
+          - pulse_number: position of the pulse within its HPPC sweep
+          - capacity, voltage, is_completed: as in `get_hppc_pulses`
+          - r0_ohm, r1_ohm, ..., tau1_s, ...: fitted parameters, with the RC
+            pairs sorted by time constant
+          - rmse_ohm: root mean square error of the fit
+          - converged: True if the fit met the tolerance
+        """
+
+        pulses = self.get_hppc_pulses(stream)
+        store = self.get_hppc_pulse_store(stream)
+
+        # Transient resistance, defined as in get_hppc_pulses
+        sign = np.where(pulses['direction'] == 'charge', 1, -1)
+        values = np.repeat(sign / pulses['current'].values, store.lengths) \
+            * (store.voltage - np.repeat(pulses['voltage'].values, store.lengths))
+
+        sweeps = pulses.groupby(['cycle_index', 'direction'], observed=True, sort=False)
+
+        params, rmse, converged = fit_pulse_sequences(store.time, values, store.lengths,
+                                                      sweeps.ngroup().values,
+                                                      sweeps.cumcount().values,
+                                                      num_rc, **kwargs)
+
+        df = pulses[['cycle_index', 'direction']].copy()
+        df['pulse_number'] = sweeps.cumcount()
+        df[['capacity', 'voltage', 'is_completed']] = \
+            pulses[['capacity', 'voltage', 'is_completed']]
+
+        df_params = get_params_table(params, num_rc)
+        df_params.index = pulses.index
+        df = pd.concat([df, df_params], axis=1)
+
+        df['rmse_ohm'] = rmse
+        df['converged'] = converged
+
+        return df
+
+
+    def _load_hppc_pulses(self, stream=False):
+        """
+        Segment all HPPC cycles and assign the pulse table and pulse store as
+        object properties
+        """
+
+        tables = []
+        stores = []
 
-                # Detect pulse start
-                if point == STEP_INDEX_HPPC_CHARGE \
-                    and curr_df['Step Index'].iloc[idx-1] != STEP_INDEX_HPPC_CHARGE:
+        for curr_cyc, curr_df in self._iter_diagnostic_cycles(
+                list(HPPC_PULSE_STEPS.values()), stream):
 
-                    capacity_0 = curr_df['Charge Capacity (Ah)'].iloc[idx-1]
-                    voltage_0 = curr_df['Potential (V)'].iloc[idx-1]
+            table, store = self._get_hppc_cycle_pulses(curr_cyc, curr_df)
 
-                    # Detect index corresponding to end of pulse
-                    jdx = idx + 1
-                    while True:
-                        jdx += 1
-                        if curr_df['Step Index'].iloc[jdx] != STEP_INDEX_HPPC_CHARGE:
-                            break
+            tables.append(table)
+            stores.append(store)
 
-                    # Extract, voltage-current-time vector for this pulse
-                    voltage_vec = curr_df['Potential (V)'].iloc[idx:jdx]
-                    current_vec = curr_df['Current (A)'].iloc[idx:jdx]
-                    time_vec = curr_df['Test Time (s)'].iloc[idx:jdx] - \
-                               curr_df['Test Time (s)'].iloc[idx]
+        if not tables:
+            table, store = self._get_hppc_cycle_pulses(0, None)
+            tables.append(table)
+            stores.append(store)
 
-                    voltage_0_vec = voltage_0 * np.ones(np.size(voltage_vec))
-                    capacity_0_vec = capacity_0 * np.ones(np.size(voltage_vec))
+        self._df_hppc_pulses = pd.concat(tables, ignore_index=True)
+        self._hppc_pulse_store = PulseStore.concat(stores)
 
-                    curr_dict = dict()
-                    curr_dict['voltage_v'] = voltage_vec
-                    curr_dict['current_a'] = current_vec
-                    curr_dict['time_s'] = time_vec
-                    curr_dict['voltage_0_v'] = voltage_0_vec
-                    curr_dict['capacity_0_ah'] = capacity_0_vec
-                    curr_df_raw = pd.DataFrame(curr_dict)
-                    df_raw_list.append(curr_df_raw)
 
-                    # Pulses that did not last 10 seconds could indicate a fault
-                    # in the test. We want to code to pass at this point
-                    is_pulse_completed = np.abs(time_vec.iloc[-1] - 10) < 0.1
+    @staticmethod
+    def _get_hppc_cycle_pulses(curr_cyc, curr_df):
+        """
+        Segment and characterize the HPPC pulses in both directions in one
+        cycle of the aging timeseries.
+
+        Pulses are located in one pass over the step indices and the pulse
+        features of all pulses are computed together (see src.hppc). Returns
+        empty results if `curr_df` is None.
+
+        Returns a tuple of (pulse table, PulseStore)
+        """
+
+        tables = []
+        stores = []
+
+        for direction, pulse_step in HPPC_PULSE_STEPS.items():
+
+            if curr_df is None:
+                starts = stops = np.array([], dtype=np.int64)
+                voltage = current = test_time = capacity = np.array([])
+            else:
+                starts, stops = find_pulses(curr_df['Step Index'].values, pulse_step)
+                voltage = curr_df['Potential (V)'].values
+                current = curr_df['Current (A)'].values
+                test_time = curr_df['Test Time (s)'].values
+                capacity = curr_df['Charge Capacity (Ah)'].values
+
+            lengths = stops - starts
+            rows = get_pulse_rows(starts, stops)
+
+            store = PulseStore(test_time[rows] - np.repeat(test_time[starts], lengths),
+                               voltage[rows], current[rows], lengths)
+
+            # Pulses are referenced to the last point before the pulse
+            capacity_0 = capacity[starts - 1]
+            voltage_0 = voltage[starts - 1]
+
+            voltage_at_1_sec, voltage_at_3_sec, voltage_at_10_sec = \
+                store.interp_voltage([1, 3, 10]).T
+
+            # Use the mean current throughout the pulse to reduce noise
+            current_mean = np.abs(store.get_mean_current())
 
-                    if not is_pulse_completed:
-                        continue
+            sign = 1 if direction == 'charge' else -1
+
+            tables.append(pd.DataFrame({
+                'cycle_index': np.full(len(starts), curr_cyc),
+                'direction': direction,
+                'row_start': starts,
+                'row_stop': stops,
+                'capacity': capacity_0,
+                'voltage': voltage_0,
+                'resistance_1s_ohm': sign * (voltage_at_1_sec - voltage_0) / current_mean,
+                'resistance_3s_ohm': sign * (voltage_at_3_sec - voltage_0) / current_mean,
+                'resistance_10s_ohm': sign * (voltage_at_10_sec - voltage_0) / current_mean,
+                'current': current_mean,
+                'is_completed': np.abs(store.get_duration() - 10) < 0.1}))
+            stores.append(store)
+
+        df = pd.concat(tables, ignore_index=True)
+        df['direction'] = pd.Categorical(df['direction'], categories=list(HPPC_PULSE_STEPS))
+
+        return df, PulseStore.concat(stores)
+
+
+    def _get_hppc_results(self, direction, stream=False):
+        """
+        Returns the HPPC results of one direction in the format of
+        `process_diagnostic_hppc_charge_data`, built from the pulse table
+        """
+
+        pulse_step = HPPC_PULSE_STEPS[direction]
+
+        if stream:
+            cycles = ((curr_cyc, curr_df, self._get_hppc_cycle_pulses(curr_cyc, curr_df)[0])
+                      for curr_cyc, curr_df in self._iter_diagnostic_cycles(pulse_step, True))
+        else:
+            pulses = self.get_hppc_pulses()
+            pulses_by_cycle = dict(list(pulses.groupby('cycle_index', observed=True)))
+            cycles = ((curr_cyc, curr_df, pulses_by_cycle.get(curr_cyc, pulses.iloc[0:0]))
+                      for curr_cyc, curr_df in self._iter_diagnostic_cycles(pulse_step))
+
+        results_list = list()
 
-                    voltage_at_1_sec  = np.interp(1, time_vec, voltage_vec)
-                    voltage_at_3_sec  = np.interp(3, time_vec, voltage_vec)
-                    voltage_at_10_sec = np.interp(10, time_vec, voltage_vec, right=voltage_vec.iloc[-1])
+        for curr_cyc, curr_df, pulses in cycles:
 
-                    # Use the mean current throughout the pulse to reduce noise
-                    current_mean = np.abs(np.mean(current_vec))
+            pulses = pulses[pulses['direction'] == direction]
 
-                    result = dict()
-                    result['capacity'] = capacity_0
-                    result['voltage'] = voltage_0
-                    result['resistance_1s_ohm']  = (voltage_at_1_sec - voltage_0) / current_mean
-                    result['resistance_3s_ohm']  = (voltage_at_3_sec - voltage_0) / current_mean
-                    result['resistance_10s_ohm'] = (voltage_at_10_sec - voltage_0) / current_mean
-                    result['current'] = current_mean
+            if direction == 'discharge':
+                # Pulses that did not last 10 seconds could indicate a fault
+                # in the test. We want to code to fail a this point so we
+                # can look more carefully at what is going on.
+                assert pulses['is_completed'].all(), "Pulse did not last 10 seconds."
 
-                    pulse_list.append(result)
+            starts = pulses['row_start'].values
+            lengths = pulses['row_stop'].values - starts
+            rows = get_pulse_rows(starts, pulses['row_stop'].values)
 
+            test_time = curr_df['Test Time (s)'].values
 
-            df_raw_all = pd.concat(df_raw_list)
+            df_raw_all = pd.DataFrame({
+                'voltage_v': curr_df['Potential (V)'].values[rows],
+                'current_a': curr_df['Current (A)'].values[rows],
+                'time_s': test_time[rows] - np.repeat(test_time[starts], lengths),
+                'voltage_0_v': np.repeat(pulses['voltage'].values, lengths)
+                                 .astype(np.float64),
+                'capacity_0_ah': np.repeat(pulses['capacity'].values, lengths)
+                                   .astype(np.float64)},
+                index=curr_df.index[rows])
 
             curr_result = dict()
             curr_result['cycle_index'] = curr_cyc
-            curr_result['data'] = pd.DataFrame(pulse_list)
+            curr_result['data'] = pulses.loc[pulses['is_completed'], HPPC_DATA_COLUMNS] \
+                                        .reset_index(drop=True)
             curr_result['raw_pulses'] = df_raw_all
             curr_result['raw_all'] = curr_df
             results_list.append(curr_result)
 
         return results_list
 
-    def process_diagnostic_hppc_discharge_data(self):
+
+    def process_diagnostic_hppc_charge_data(self, stream=False):
         """
         Takes in raw data and returns a data structure holding processed
-        HPPC discharge pulse information; uses step indices to infer start
+        HPPC charge pulse information; uses step indices to infer start
         and end of each pulse.
 
+        Pulses that did not last 10 seconds are left out of 'data'.
+
+        Parameters
+        ---------
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
+
         Outputs:
         ---------
         A list of dictionaries. Each dictionary holds:
@@ -1286,98 +1809,28 @@ class FormationCell:
           - value: a Pandas DataFrame
         """
 
-        df = self.get_aging_data_timeseries()
-
-        df_hppc = df[df['Step Index'] == STEP_INDEX_HPPC_DISCHARGE]
-        hppc_cycle_indices = np.unique(df_hppc['Cycle Number'])
-
-        results_list = list()
-
-        # Loop through each diagnostic test
-        for curr_cyc in hppc_cycle_indices:
-
-            curr_df = df[df['Cycle Number'] == curr_cyc]
+        return self._get_hppc_results('charge', stream)
 
-            # Initialize a bunch of variables for exporting raw outputs
-            voltage_vec_all = []
-            capacity_0_vec_all = []
-            voltage_0_vec_all = []
-            current_vec_all = []
-            time_vec_all = []
-            df_raw_list = []
 
-            # Process each pulse
-            pulse_list = []
-            for idx, point in enumerate(curr_df['Step Index'].values):
-
-                if idx == 0:
-                    continue
+    def process_diagnostic_hppc_discharge_data(self, stream=False):
+        """
+        Takes in raw data and returns a data structure holding processed
+        HPPC discharge pulse information; uses step indices to infer start
+        and end of each pulse.
 
-                # Detect pulse start
-                if point == STEP_INDEX_HPPC_DISCHARGE \
-                    and curr_df['Step Index'].iloc[idx-1] != STEP_INDEX_HPPC_DISCHARGE:
-
-                    capacity_0 = curr_df['Charge Capacity (Ah)'].iloc[idx-1]
-                    voltage_0 = curr_df['Potential (V)'].iloc[idx-1]
-
-                    # Detect index corresponding to end of pulse
-                    jdx = idx + 1
-                    while True:
-                        jdx += 1
-                        if curr_df['Step Index'].iloc[jdx] != STEP_INDEX_HPPC_DISCHARGE:
-                            break
-
-                    # Extract, voltage-current-time vector for this pulse
-                    voltage_vec = curr_df['Potential (V)'].iloc[idx:jdx]
-                    current_vec = curr_df['Current (A)'].iloc[idx:jdx]
-                    time_vec = curr_df['Test Time (s)'].iloc[idx:jdx] - \
-                               curr_df['Test Time (s)'].iloc[idx]
-
-                    voltage_0_vec = voltage_0 * np.ones(np.size(voltage_vec))
-                    capacity_0_vec = capacity_0 * np.ones(np.size(voltage_vec))
-
-                    curr_dict = dict()
-                    curr_dict['voltage_v'] = voltage_vec
-                    curr_dict['current_a'] = current_vec
-                    curr_dict['time_s'] = time_vec
-                    curr_dict['voltage_0_v'] = voltage_0_vec
-                    curr_dict['capacity_0_ah'] = capacity_0_vec
-                    curr_df_raw = pd.DataFrame(curr_dict)
-                    df_raw_list.append(curr_df_raw)
-
-                    # Pulses that did not last 10 seconds could indicate a fault
-                    # in the test. We want to code to fail a this point so we
-                    # can look more carefully at what is going on.
-                    assert (np.abs(time_vec.iloc[-1] - 10) < 0.1), \
-                        "Pulse did not last 10 seconds."
-
-                    voltage_at_1_sec  = np.interp(1, time_vec, voltage_vec)
-                    voltage_at_3_sec  = np.interp(3, time_vec, voltage_vec)
-                    voltage_at_10_sec = np.interp(10, time_vec, voltage_vec, right=voltage_vec.iloc[-1])
-
-                    # Use the mean current throughout the pulse to reduce noise
-                    current_mean = np.abs(np.mean(current_vec))
-
-                    result = dict()
-                    result['capacity'] = capacity_0
-                    result['voltage'] = voltage_0
-                    result['resistance_1s_ohm']  = (voltage_0 - voltage_at_1_sec) / current_mean
-                    result['resistance_3s_ohm']  = (voltage_0 - voltage_at_3_sec) / current_mean
-                    result['resistance_10s_ohm'] = (voltage_0 - voltage_at_10_sec) / current_mean
-                    result['current'] = current_mean
-
-                    pulse_list.append(result)
-
-            df_raw_all = pd.concat(df_raw_list)
+        Parameters
+        ---------
+        stream (default=False): process the aging test one cycle at a time
+          from the raw CSV file, bounding memory by the largest cycle
 
-            curr_result = dict()
-            curr_result['cycle_index'] = curr_cyc
-            curr_result['data'] = pd.DataFrame(pulse_list)
-            curr_result['raw_pulses'] = df_raw_all
-            curr_result['raw_all'] = curr_df
-            results_list.append(curr_result)
+        Outputs:
+        ---------
+        A list of dictionaries. Each dictionary holds:
+          - key: cycle index containing the HPPC cycle
+          - value: a Pandas DataFrame
+        """
 
-        return results_list
+        return self._get_hppc_results('discharge', stream)
 
 
     def __str__(self):
@@ -1401,6 +1854,222 @@ def export_all_c20_data():
         cell.export_diagnostic_c20_data()
 
 
+def check_raw_data_files(cellid_list=range(1, NUM_TOTAL_CELLS + 1)):
+    """
+    Reports cells with missing or duplicate raw data files in each dataset
+    directory.
+
+    Returns a dict holding, for each dataset, a dict with:
+      - missing: list of cell numbers with no file
+      - duplicates: dict holding the files of cells with more than one file
+    """
+
+    report = dict()
+
+    for dataset, (path_name, pattern) in RAW_DATA_FILES.items():
+
+        path = get_path(path_name)
+
+        manifest = get_manifest(path, pattern)
+
+        missing = [cellid for cellid in cellid_list
+                   if not manifest.get_files(cellid)]
+        duplicates = {cellid: files
+                      for cellid, files in manifest.get_duplicates().items()
+                      if cellid in cellid_list}
+
+        for cellid in missing:
+            print(f'Cell {cellid}: no {dataset} file matching "{path}/'
+                  f'{pattern.format(cellid=cellid)}"')
+
+        for cellid, files in duplicates.items():
+            print(f'Cell {cellid}: {len(files)} {dataset} files: '
+                  + ', '.join(os.path.basename(f) for f in files))
+
+        report[dataset] = {'missing': missing, 'duplicates': duplicates}
+
+    return report
+
+
+def report_load_times(cellid_list=range(1, NUM_TOTAL_CELLS + 1), refresh=False):
+    """
+    Measure cold and warm load times of the raw data for a list of cells.
+
+    Each cell is loaded twice: the first load populates the columnar cache
+    (cold, unless the cache already existed) and the second load reads from
+    the cache (warm).
+
+    Args:
+      cellid_list (list of int): cells to load
+      refresh (bool): clear the cached copies first to force cold loads
+
+    Returns:
+      a Pandas DataFrame with one row per cell and dataset
+    """
+
+    loaders = {'formation': '_load_formation_data',
+               'timeseries': '_load_aging_data_timeseries',
+               'cycles': '_load_aging_data_cycles'}
+
+    records = []
+
+    for cellid in cellid_list:
+
+        cold_cell = FormationCell(cellid)
+        warm_cell = FormationCell(cellid)
+
+        for dataset, loader in loaders.items():
+
+            if refresh:
+                clear_cache(cold_cell._find_file(dataset), get_path('PATH_CACHE'))
+
+            getattr(cold_cell, loader)()
+            getattr(warm_cell, loader)()
+
+            cold = cold_cell.get_load_times()[dataset]
+            warm = warm_cell.get_load_times()[dataset]
+
+            records.append({'cellid': cellid,
+                            'dataset': dataset,
+                            'cold_s': cold['seconds'],
+                            'cold_cached': cold['cached'],
+                            'warm_s': warm['seconds'],
+                            'warm_cached': warm['cached']})
+
+    return pd.DataFrame(records)
+
+
+def report_memory_savings(cellid_list=range(1, NUM_TOTAL_CELLS + 1)):
+    """
+    Compare the memory used by full-width and compact (schema-projected,
+    downcast) loads of the raw data for a list of cells.
+
+    Args:
+      cellid_list (list of int): cells to load
+
+    Returns:
+      a Pandas DataFrame with one row per cell and dataset, in bytes
+    """
+
+    records = []
+
+    for cellid in cellid_list:
+
+        full_cell = FormationCell(cellid)
+        compact_cell = FormationCell(cellid, compact=True)
+
+        for dataset, getter in DATASET_GETTERS.items():
+
+            full_bytes = get_memory_usage(getattr(full_cell, getter)())
+            compact_bytes = get_memory_usage(getattr(compact_cell, getter)())
+
+            print(f'Cell {cellid}, {dataset}: {full_bytes/1e6:.1f} MB -> '
+                  f'{compact_bytes/1e6:.1f} MB '
+                  f'({1 - compact_bytes/full_bytes:.0%} saved)')
+
+            records.append({'cellid': cellid,
+                            'dataset': dataset,
+                            'full_bytes': full_bytes,
+                            'compact_bytes': compact_bytes,
+                            'saved_bytes': full_bytes - compact_bytes})
+
+    return pd.DataFrame(records)
+
+
+def load_datasets(cellid_list=range(1, NUM_TOTAL_CELLS + 1),
+                  datasets=('formation', 'timeseries', 'cycles'),
+                  max_workers=MAX_LOAD_WORKERS, use_cache=True, compact=False):
+    """
+    Read the raw data of many cells concurrently and combine each dataset
+    into a single table.
+
+    Reading is I/O bound, so cells are loaded by a pool of worker threads.
+    Each combined table has a leading 'cellid' column, so cross-cell analyses
+    can run as a single groupby over the table.
+
+    Args:
+      cellid_list (list of int): cells to load
+      datasets (list of str): any of 'formation', 'timeseries' and 'cycles'
+      max_workers (int): number of cells read at once
+      use_cache (bool): read through the columnar on-disk cache
+      compact (bool): read only the columns in SCHEMAS, downcast
+
+    Returns:
+      a dict holding one Pandas DataFrame per dataset, with the cells in the
+      order of `cellid_list`
+    """
+
+    for dataset in datasets:
+        assert dataset in DATASET_GETTERS, f'Unknown dataset "{dataset}"'
+
+    def load_cell(cellid):
+
+        cell = FormationCell(cellid, use_cache=use_cache, compact=compact)
+
+        return {dataset: getattr(cell, DATASET_GETTERS[dataset])()
+                for dataset in datasets}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        cell_data = list(executor.map(load_cell, cellid_list))
+
+    results = dict()
+
+    for dataset in datasets:
+
+        frames = [data.pop(dataset) for data in cell_data]
+        lengths = [len(frame) for frame in frames]
+
+        df = pd.concat(frames, ignore_index=True)
+        df.insert(0, 'cellid', np.repeat(list(cellid_list), lengths))
+
+        results[dataset] = df
+
+    return results
+
+
+def fit_hppc_ecm_cells(cellid_list=range(1, NUM_TOTAL_CELLS + 1), num_rc=2,
+                       max_workers=None, use_cache=True):
+    """
+    Fit the equivalent circuit model to the HPPC pulses of many cells and
+    combine the results into a single table.
+
+    Fitting is CPU bound, so cells are spread over a pool of worker
+    processes; each cell is fit as one batch (see FormationCell.fit_hppc_ecm).
+
+    Args:
+      cellid_list (list of int): cells to fit
+      num_rc (int): number of RC pairs
+      max_workers (int): number of worker processes; defaults to the number
+                         of CPUs, and 1 fits the cells in this process
+      use_cache (bool): read through the columnar on-disk cache
+
+    Returns:
+      a Pandas DataFrame with a leading 'cellid' column and the columns of
+      FormationCell.fit_hppc_ecm, with the cells in the order of `cellid_list`
+    """
+
+    args = (cellid_list, repeat(num_rc), repeat(use_cache))
+
+    if max_workers == 1:
+        frames = list(map(_fit_cell_hppc_ecm, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(_fit_cell_hppc_ecm, *args))
+
+    df = pd.concat(frames, ignore_index=True)
+    df.insert(0, 'cellid', np.repeat(list(cellid_list), [len(f) for f in frames]))
+
+    return df
+
+
+def _fit_cell_hppc_ecm(cellid, num_rc, use_cache):
+    """
+    Worker of fit_hppc_ecm_cells
+    """
+
+    return FormationCell(cellid, use_cache=use_cache).fit_hppc_ecm(num_rc)
+
+
 def find_cycles_to_target_retention(retention, cyc_number, target_retention):
     """
     Returns first cycle to go below target retention
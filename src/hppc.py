@@ -0,0 +1,261 @@
+"""
+Array operations for segmenting and characterizing HPPC pulses.
+
+An HPPC cycle holds a series of current pulses, each logged as a run of rows
+under the pulse step index. Pulses are located by run-length encoding the
+step index sequence, and per-pulse quantities are computed over all pulses
+at once on the concatenated pulse rows.
+"""
+
+import numpy as np
+
+
+def find_pulses(step_index, pulse_step):
+    """
+    Locate pulses as row ranges of a step index sequence.
+
+    A pulse starts on a row that enters `pulse_step` (the first row is never
+    a start) and ends on the first row outside `pulse_step`, counting from
+    two rows after the start, so each pulse holds at least two rows.
+
+    Parameters
+    ---------
+    step_index (array-like): step index of each row
+    pulse_step (int): step index of the pulses
+
+    Returns
+    ---------
+    a tuple of arrays (starts, stops) holding the first row and one past the
+    last row of each pulse
+    """
+
+    step_index = np.asarray(step_index)
+    num_rows = len(step_index)
+
+    is_pulse = step_index == pulse_step
+
+    starts = np.flatnonzero(is_pulse[1:] & ~is_pulse[:-1]) + 1
+
+    # First row at or after each row that is outside the pulse step
+    next_outside = np.where(is_pulse, num_rows, np.arange(num_rows))
+    next_outside = np.minimum.accumulate(next_outside[::-1])[::-1]
+    next_outside = np.append(next_outside, num_rows)
+
+    stops = next_outside[np.minimum(starts + 2, num_rows)]
+
+    assert np.all(stops < num_rows), 'Pulse does not end before the end of the data.'
+
+    return starts, stops
+
+
+def get_pulse_rows(starts, stops):
+    """
+    Returns the row positions of all pulses, concatenated in order
+    """
+
+    lengths = stops - starts
+
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+
+    return np.arange(lengths.sum()) + offsets
+
+
+def interp_pulses(x, time, values, lengths):
+    """
+    Evaluate `np.interp(x, time_p, values_p)` for every pulse p at once.
+
+    Gives the same results as calling `np.interp` on each pulse, including
+    the handling of points outside a pulse, which take the first or last
+    value of that pulse.
+
+    Parameters
+    ---------
+    x (float or array): point, or points, at which to interpolate
+    time (array): concatenated, per-pulse non-decreasing sample times
+    values (array): concatenated sample values
+    lengths (array of int): number of samples in each pulse
+
+    Returns
+    ---------
+    an array holding the interpolated value of each pulse, of shape
+    (number of pulses, number of points) if `x` is an array
+    """
+
+    time = np.asarray(time, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    is_scalar = np.ndim(x) == 0
+    points = np.atleast_1d(np.asarray(x, dtype=np.float64))
+    num_pulses, num_points = len(lengths), len(points)
+
+    offsets = (np.cumsum(lengths) - lengths)[:, np.newaxis]
+    last = offsets + lengths[:, np.newaxis] - 1
+
+    # Number of samples at or before each point within each pulse, from a
+    # single search of all sample times among the sorted points: a sample is
+    # at or before the k-th smallest point iff at most k points lie below it
+    order = np.argsort(points, kind='stable')
+    rank = np.searchsorted(points[order], time, side='left')
+    pulse_id = np.repeat(np.arange(num_pulses), lengths)
+    hist = np.bincount(pulse_id * (num_points + 1) + rank,
+                       minlength=num_pulses * (num_points + 1))
+
+    count = np.empty((num_pulses, num_points), dtype=np.int64)
+    count[:, order] = np.cumsum(hist.reshape(num_pulses, num_points + 1), axis=1)[:, :-1]
+    count[:, np.isnan(points)] = 0
+
+    # Last sample at or before each point within each pulse
+    j = offsets + count - 1
+
+    offsets = np.broadcast_to(offsets, j.shape)
+    last = np.broadcast_to(last, j.shape)
+    points = np.broadcast_to(points, j.shape)
+
+    result = values[last]
+
+    before = j < offsets
+    result[before] = values[offsets[before]]
+
+    exact = ~before & (j < last) & (time[np.minimum(j, last)] == points)
+    result[exact] = values[j[exact]]
+
+    inside = ~before & (j < last) & ~exact
+    j = j[inside]
+    points = points[inside]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        slope = (values[j + 1] - values[j]) / (time[j + 1] - time[j])
+        interp = slope * (points - time[j]) + values[j]
+
+        # Same fallbacks as np.interp for non-finite slopes
+        is_nan = np.isnan(interp)
+        interp[is_nan] = slope[is_nan] * (points[is_nan] - time[j + 1][is_nan]) \
+                         + values[j + 1][is_nan]
+        is_flat = np.isnan(interp) & (values[j] == values[j + 1])
+        interp[is_flat] = values[j][is_flat]
+
+    result[inside] = interp
+
+    return result[:, 0] if is_scalar else result
+
+
+def mean_pulses(values, lengths):
+    """
+    Returns the mean of the values in each pulse.
+
+    All pulses are summed at once with a segmented reduction over the pulse
+    offsets, accumulated in float64 and returned in the precision of
+    `values`. The sums are sequential rather than pairwise, so a mean can
+    differ from `Series.mean` of the same samples in the last bit.
+    """
+
+    values = np.asarray(values)
+    lengths = np.asarray(lengths, dtype=np.int64)
+
+    if len(lengths) == 0:
+        return np.array([], dtype=values.dtype)
+
+    offsets = np.cumsum(lengths) - lengths
+    sums = np.add.reduceat(values, offsets, dtype=np.float64)
+
+    return (sums / lengths).astype(values.dtype)
+
+
+class PulseStore:
+    """
+    Samples of many pulses held as one ragged array: the samples of all
+    pulses are concatenated, and pulse i holds the `lengths[i]` samples
+    starting at `offsets[i]`.
+
+    Pulse times are relative to the first sample of each pulse.
+    """
+
+    def __init__(self, time, voltage, current, lengths):
+        """
+        Parameters
+        ---------
+        time (array): concatenated sample times, from 0 at each pulse start
+        voltage (array): concatenated sample voltages
+        current (array): concatenated sample currents
+        lengths (array of int): number of samples in each pulse
+        """
+
+        self.time = np.asarray(time, dtype=np.float64)
+        self.voltage = np.asarray(voltage)
+        self.current = np.asarray(current)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.cumsum(self.lengths) - self.lengths
+
+        assert len(self.time) == len(self.voltage) == len(self.current) \
+            == self.lengths.sum(), 'Sample arrays do not match the pulse lengths.'
+
+
+    @classmethod
+    def concat(cls, stores):
+        """
+        Join several stores into one, keeping the order of the pulses
+        """
+
+        return cls(np.concatenate([s.time for s in stores]),
+                   np.concatenate([s.voltage for s in stores]),
+                   np.concatenate([s.current for s in stores]),
+                   np.concatenate([s.lengths for s in stores]))
+
+
+    def __repr__(self):
+
+        return f'PulseStore({len(self)} pulses, {len(self.time)} samples)'
+
+
+    def __len__(self):
+
+        return len(self.lengths)
+
+
+    def get_pulse(self, i):
+        """
+        Returns the samples of one pulse as a dict of arrays
+        """
+
+        rows = slice(self.offsets[i], self.offsets[i] + self.lengths[i])
+
+        return {'time_s': self.time[rows],
+                'voltage_v': self.voltage[rows],
+                'current_a': self.current[rows]}
+
+
+    def get_duration(self):
+        """
+        Returns the time of the last sample of each pulse
+        """
+
+        return self.time[self.offsets + self.lengths - 1]
+
+
+    def get_mean_current(self):
+        """
+        Returns the mean current of each pulse
+        """
+
+        return mean_pulses(self.current, self.lengths)
+
+
+    def interp_voltage(self, times):
+        """
+        Interpolate the voltage of every pulse at a list of times.
+
+        All times are evaluated for all pulses at once, with the same results
+        as `np.interp` on each pulse.
+
+        Parameters
+        ---------
+        times (array-like): times from the start of the pulses, in seconds
+
+        Returns
+        ---------
+        an array of shape (number of pulses, number of times)
+        """
+
+        return interp_pulses(np.atleast_1d(times), self.time, self.voltage, self.lengths)
@@ -0,0 +1,214 @@
+"""
+Manifest of the data files belonging to each cell.
+
+Looking up a cell's file with `glob` lists and pattern-matches the whole
+directory on every load, which is slow on network filesystems holding
+thousands of files. A FileManifest lists a directory once, maps every file
+name to the cell numbers it belongs to, and only re-lists the directory when
+its modification time changes.
+"""
+
+import fnmatch
+import os
+import re
+import threading
+
+# Manifests built in this process, keyed by (directory, pattern)
+_manifests = dict()
+_manifests_lock = threading.Lock()
+
+
+class FileManifest:
+    """
+    Maps cell numbers to the files in a directory whose names match a glob
+    pattern with a `{cellid}` placeholder, e.g. 'cell_{cellid}_*.json'.
+
+    A file is assigned to a cell exactly when
+    `glob.glob(f'{path}/{pattern.format(cellid=cellid)}')` would return it,
+    so a file can belong to more than one cell if the pattern allows it.
+    """
+
+    def __init__(self, path, pattern):
+        """
+        Parameters
+        ---------
+        path (str): directory holding the files
+        pattern (str): glob pattern of the file names, with a `{cellid}`
+                       placeholder for the cell number
+        """
+
+        assert '{cellid}' in pattern, \
+            f'Pattern "{pattern}" must contain a {{cellid}} placeholder.'
+
+        self.path = path
+        self.pattern = pattern
+
+        self._mtime_ns = None
+        self._lock = threading.Lock()
+
+        # Cell numbers matched by each file name in the directory
+        self._names = dict()
+
+        # File paths belonging to each cell number
+        self._files = dict()
+
+
+    def __repr__(self):
+
+        return f'FileManifest("{self.path}/{self.pattern}", ' \
+               f'{len(self._names)} files, {len(self._files)} cells)'
+
+
+    def refresh(self, force=False):
+        """
+        Re-list the directory if it changed since the last scan.
+
+        Only file names not seen before are matched against the pattern.
+
+        Parameters
+        ---------
+        force (default=False): re-list even if the directory modification
+          time is unchanged, e.g. on filesystems with coarse timestamps
+
+        Returns
+        ---------
+        True if the directory was re-listed
+        """
+
+        with self._lock:
+
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+
+            if not force and self._mtime_ns is not None \
+                    and mtime_ns == self._mtime_ns:
+                return False
+
+            names = os.listdir(self.path) if mtime_ns is not None else []
+
+            self._names = {name: self._names[name] if name in self._names
+                                 else self._match(name)
+                           for name in names}
+
+            files = dict()
+            for name in sorted(self._names):
+                for cellid in self._names[name]:
+                    files.setdefault(cellid, []).append(f'{self.path}/{name}')
+
+            self._files = files
+            self._mtime_ns = mtime_ns
+
+        return True
+
+
+    def _match(self, name):
+        """
+        Returns the cell numbers whose glob pattern matches a file name
+        """
+
+        # Hidden files are never matched by glob wildcards
+        if name.startswith('.') and not self.pattern.startswith('.'):
+            return []
+
+        cellids = set()
+
+        # Every integer written in the name is a candidate cell number
+        for run in re.finditer(r'\d+', name):
+            digits = run.group()
+            for i in range(len(digits)):
+                for j in range(i + 1, len(digits) + 1):
+                    candidate = digits[i:j]
+                    if str(int(candidate)) != candidate:
+                        continue
+                    if fnmatch.fnmatchcase(name, self.pattern.format(cellid=candidate)):
+                        cellids.add(int(candidate))
+
+        return sorted(cellids)
+
+
+    def get_files(self, cellid):
+        """
+        Returns the sorted list of files belonging to a cell
+        """
+
+        self.refresh()
+
+        return list(self._files.get(cellid, []))
+
+
+    def get_file(self, cellid):
+        """
+        Returns the one file belonging to a cell, failing with the offending
+        file names if there are none or more than one
+        """
+
+        files = self.get_files(cellid)
+
+        assert len(files) > 0, \
+            f'No file found for cell {cellid}. ' \
+            f'Check "{self.path}/{self.pattern.format(cellid=cellid)}"'
+
+        assert len(files) == 1, \
+            f'{len(files)} files are associated with cell {cellid}: ' \
+            + ', '.join(os.path.basename(f) for f in files)
+
+        return files[0]
+
+
+    def get_cellids(self):
+        """
+        Returns the sorted list of cell numbers with at least one file
+        """
+
+        self.refresh()
+
+        return sorted(self._files)
+
+
+    def get_duplicates(self):
+        """
+        Returns a dict holding the files of each cell with more than one file
+        """
+
+        self.refresh()
+
+        return {cellid: list(files) for cellid, files in self._files.items()
+                if len(files) > 1}
+
+
+def get_manifest(path, pattern):
+    """
+    Returns the manifest of a directory and file name pattern, building it
+    on first use. Manifests are shared across the process.
+
+    Parameters
+    ---------
+    path (str): directory holding the files
+    pattern (str): glob pattern of the file names, with a `{cellid}`
+                   placeholder
+
+    Returns
+    ---------
+    a FileManifest
+    """
+
+    with _manifests_lock:
+
+        manifest = _manifests.get((path, pattern))
+
+        if manifest is None:
+            manifest = FileManifest(path, pattern)
+            _manifests[(path, pattern)] = manifest
+
+    return manifest
+
+
+def clear_manifests():
+    """
+    Drop all manifests built in this process
+    """
+
+    with _manifests_lock:
+        _manifests.clear()
@@ -0,0 +1,109 @@
+"""
+Process-wide registry of cell metadata from the cell tracker workbook.
+
+Parsing `cell_tracker.xlsx` through openpyxl is slow, and every FormationCell
+used to do it on its own. The registry reads the workbook once per process
+(through a binary on-disk copy when available) and serves each cell's record
+by a dictionary lookup.
+"""
+
+import os
+import threading
+
+import pandas as pd
+
+from src.storage import read_cached
+
+# Registries loaded in this process, keyed by workbook path
+_registries = dict()
+_registries_lock = threading.Lock()
+
+
+class MetadataRegistry:
+    """
+    Holds one metadata record (a dict) per cell number
+    """
+
+    def __init__(self, df):
+        """
+        Parameters
+        ---------
+        df (DataFrame): the cell tracker table, with one row per cell and a
+                        'cell_number' column
+        """
+
+        self._records = dict()
+
+        # Keep the first row if a cell number appears more than once
+        for record in df.to_dict('records'):
+            self._records.setdefault(record['cell_number'], record)
+
+
+    def __repr__(self):
+
+        return f'MetadataRegistry({len(self._records)} cells)'
+
+
+    def __len__(self):
+
+        return len(self._records)
+
+
+    def __contains__(self, cellid):
+
+        return cellid in self._records
+
+
+    def get(self, cellid):
+        """
+        Returns a copy of the metadata record for a cell
+        """
+
+        assert cellid in self._records, f'No metadata found for cell {cellid}.'
+
+        return dict(self._records[cellid])
+
+
+def get_metadata_registry(path_metadata, cache_dir):
+    """
+    Returns the metadata registry for a cell tracker workbook.
+
+    The workbook is parsed at most once per process and only re-read if the
+    file changes on disk. A pickled copy of the parsed table is kept in
+    `cache_dir` so that new processes can skip openpyxl as well.
+
+    Parameters
+    ---------
+    path_metadata (str): path to the cell tracker workbook
+    cache_dir (str): directory holding the cached copy
+
+    Returns
+    ---------
+    a MetadataRegistry
+    """
+
+    mtime_ns = os.stat(path_metadata).st_mtime_ns
+
+    with _registries_lock:
+
+        entry = _registries.get(path_metadata)
+
+        if entry is None or entry[0] != mtime_ns:
+
+            df, _ = read_cached(path_metadata, cache_dir,
+                                lambda f: pd.read_excel(f, engine='openpyxl'),
+                                fmt='pickle')
+
+            entry = (mtime_ns, MetadataRegistry(df))
+            _registries[path_metadata] = entry
+
+    return entry[1]
+
+
+def clear_metadata_registries():
+    """
+    Drop all registries loaded in this process
+    """
+
+    with _registries_lock:
+        _registries.clear()
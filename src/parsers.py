@@ -7,37 +7,57 @@ Andrew Weng
 2023/01/31
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
+import src.ecm as ecm
+import src.features as features
+import src.hppc as hppc
+import src.smoothing as smoothing
 import src.vas as vas
-from scipy import signal
 
-CYC_STEP_INDEX_CHARGE_CC      = 3
-CYC_STEP_INDEX_CHARGE_CV      = 4
-CYC_STEP_INDEX_CHARGE_REST    = 5
-CYC_STEP_INDEX_DISCHARGE_CC   = 6
-CYC_STEP_INDEX_DISCHARGE_REST = 7
+from src.schedules import UMBL2022FEB_SCHEDULE, get_schedule
+
+# Step semantics are declared in src.schedules; the step indices are kept
+# here for existing callers
+SCHEDULE = UMBL2022FEB_SCHEDULE.name
+
+CYC_STEP_INDEX_CHARGE_CC      = UMBL2022FEB_SCHEDULE.get_step('cycling_charge_cc')
+CYC_STEP_INDEX_CHARGE_CV      = UMBL2022FEB_SCHEDULE.get_step('cycling_charge_cv')
+CYC_STEP_INDEX_CHARGE_REST    = UMBL2022FEB_SCHEDULE.get_step('cycling_charge_rest')
+CYC_STEP_INDEX_DISCHARGE_CC   = UMBL2022FEB_SCHEDULE.get_step('cycling_discharge_cc')
+CYC_STEP_INDEX_DISCHARGE_REST = UMBL2022FEB_SCHEDULE.get_step('cycling_discharge_rest')
 
-RPT_STEP_INDEX_START          = 12 # long rest step before first HPPC pulse discharge
-RPT_STEP_INDEX_END            = 31
-RPT_STEP_INDEX_C20_CHARGE     = 26
-RPT_STEP_INDEX_C20_DISCHARGE  = 23
+RPT_STEP_INDEX_START          = UMBL2022FEB_SCHEDULE.get_step('rpt_start')
+RPT_STEP_INDEX_END            = UMBL2022FEB_SCHEDULE.get_step('rpt_end')
+RPT_STEP_INDEX_C20_CHARGE     = UMBL2022FEB_SCHEDULE.get_step('c20_charge')
+RPT_STEP_INDEX_C20_DISCHARGE  = UMBL2022FEB_SCHEDULE.get_step('c20_discharge')
 
 # Voltage decay after CV hold at 4.2V and 12 hours
-RPT_STEP_INDEX_VOLTAGE_RELAX_TOP_12HR = 27 
+RPT_STEP_INDEX_VOLTAGE_RELAX_TOP_12HR = UMBL2022FEB_SCHEDULE.get_step('rest_top_12hr')
 
 # Voltage rebound after CC discharge to 3.0V and 2.5 hours
-RPT_STEP_INDEX_VOLTAGE_RELAX_BOT_2P5HR = 13 
-RPT_STEP_INDEX_END_OF_HPPC             = 21
-
-HPPC_STEP_INDEX_PULSE_DISCHARGE        = 15
-HPPC_STEP_INDEX_PULSE_DISCHARGE_REST   = 16
-HPPC_STEP_INDEX_PULSE_CHARGE           = 17
-HPPC_STEP_INDEX_PULSE_CHARGE_REST      = 18
-HPPC_STEP_INDEX_CHARGE_UP              = 19
-HPPC_STEP_INDEX_CHARGE_UP_REST         = 13
+RPT_STEP_INDEX_VOLTAGE_RELAX_BOT_2P5HR = UMBL2022FEB_SCHEDULE.get_step('rest_bottom_2p5hr')
+RPT_STEP_INDEX_END_OF_HPPC             = UMBL2022FEB_SCHEDULE.get_step('hppc_end')
+
+HPPC_STEP_INDEX_PULSE_DISCHARGE        = UMBL2022FEB_SCHEDULE.get_step('hppc_pulse_discharge')
+HPPC_STEP_INDEX_PULSE_DISCHARGE_REST   = UMBL2022FEB_SCHEDULE.get_step('hppc_pulse_discharge_rest')
+HPPC_STEP_INDEX_PULSE_CHARGE           = UMBL2022FEB_SCHEDULE.get_step('hppc_pulse_charge')
+HPPC_STEP_INDEX_PULSE_CHARGE_REST      = UMBL2022FEB_SCHEDULE.get_step('hppc_pulse_charge_rest')
+HPPC_STEP_INDEX_CHARGE_UP              = UMBL2022FEB_SCHEDULE.get_step('hppc_charge_up')
+HPPC_STEP_INDEX_CHARGE_UP_REST         = UMBL2022FEB_SCHEDULE.get_step('rest_bottom_2p5hr')
 HPPC_PULSE_DURATION_TARGET_S           = 10
 
+# Step categories of the HPPC pulses in each direction
+HPPC_PULSE_CATEGORIES = {'discharge': 'hppc_pulse_discharge',
+                         'charge': 'hppc_pulse_charge'}
+
+# Step categories summarized by CyclingDataParser.get_cycling_info
+CYC_STEP_CATEGORIES = ['cycling_charge_cc', 'cycling_charge_cv', 'cycling_charge_rest',
+                       'cycling_discharge_cc', 'cycling_discharge_rest']
+
 """
 The standard RPT sequence can be embedded into different test protocols.
 Each test protocol will follow the same sequence of step (indices) for the RPT
@@ -46,37 +66,87 @@ sequence which will include an HPPC section and a C/20 discharge-charge section.
 However, what comes before and after the RPT block in each schedule could vary,
 which will introduce an offset in the step indices. In order to propely index
 into the right steps then, we can define a step index offset for each test type.
+The offset shifts the 'rpt' block of the schedule and all steps after it.
 """
 FORM_BASE_RPT_STEP_INDEX_OFFS = -2
 
+# The RPT ends with a 12 hour rest at the top of charge; the last datapoint
+# of the rest may be logged up to a minute before the step ends
+RPT_REST_TOP_MIN_DURATION_S = 12 * 3600 - 60
+
+# Number of devices fetched and parsed at once by get_formation_features
+MAX_FETCH_WORKERS = 4
+
 class CyclingDataParser:
     
-    def __init__(self, device_name, vas_helper, key='CYC', offs=0):
+    def __init__(self, device_name, vas_helper, key='CYC', offs=0, checkpoint_file=None,
+                 stitch=False):
         """
         Use VAS to initialize a parser object
-        """
         
-        test_list, _ = vas_helper.get_test_names(device_name)
-        
-        cycle_test_list = []
+        Parameters
+        ---------
+        device_name (str): the name of a device
+        vas_helper (vas.VasHelper): the VAS helper used to fetch the data
+        key (str): keyword identifying the test among those of the device
+        offs (int): step index offset (schedule file specific)
+        checkpoint_file (str): if given, work incrementally: the tables saved
+                               in this file by `save_checkpoint` are kept, and
+                               only the datapoints logged since are fetched and
+                               processed, along with the cycles that may still
+                               change (see `save_checkpoint`). In this mode
+                               `df`, `df_cyc` and `df_rpt` hold those rows only.
+        stitch (bool): join all tests of the device matching `key`, e.g. a
+                       test and its continuation records after restarts,
+                       into one timeline (see `stitch_records`)
+        """
         
-        for test_name in test_list:
-            if key in test_name:
-                cycle_test_list.append(test_name)
+        cycle_test_list = _find_test_names(vas_helper, device_name, key)
                 
         assert not len(cycle_test_list) == 0, 'No cycling test found.'
-        assert not len(cycle_test_list) > 1, 'More than one cycling test found.'
+        assert stitch or not len(cycle_test_list) > 1, \
+            'More than one cycling test found; use stitch=True to join them.'
+        assert not (stitch and checkpoint_file), \
+            'Checkpoints work on a single test record.'
 
         cycle_test_name = cycle_test_list[0]
         
+        # When stitching, replaced by the name of the earliest record below
         self.cycle_test_name = cycle_test_name
+        self.cycle_test_names = cycle_test_list
+        self.offs = offs
+        self.checkpoint_file = checkpoint_file
         
-        print(f'Working on "{cycle_test_name}"...')
-        
-        self.df = vas_helper.get_cycler_data(cycle_test_name)
-        self.df_cyc = self.df[self.df['step_index'] < RPT_STEP_INDEX_START + offs]
-        self.df_rpt = self.df[(self.df['step_index'] >= RPT_STEP_INDEX_START + offs) & \
-                              (self.df['step_index'] <= RPT_STEP_INDEX_END + offs)]       
+        if stitch:
+            print(f'Working on {len(cycle_test_list)} records: {cycle_test_list}...')
+        else:
+            print(f'Working on "{cycle_test_name}"...')
+
+        self._checkpoint = self._load_checkpoint()
+        self._tables = None
+
+        if stitch:
+            with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+                frames = list(executor.map(vas_helper.get_cycler_data, cycle_test_list))
+            self.df = stitch_records(frames)
+            # Name the stitched test after the record that starts first
+            self.cycle_test_name = min(
+                [(df['datetime'].iloc[0], name)
+                 for name, df in zip(cycle_test_list, frames) if len(df)])[1]
+        elif self._checkpoint is None:
+            self.df = vas_helper.get_cycler_data(cycle_test_name)
+        else:
+            print(f'Resuming from cycle {self._checkpoint["last_cycle_index"]} '
+                  f'({self._checkpoint["last_datetime"]})...')
+            self.df = self._append_new_rows(vas_helper.get_cycler_data(
+                cycle_test_name, start_time=self._checkpoint['last_datetime']))
+
+        # Label every row with its step category once
+        self.schedule = get_schedule(SCHEDULE, offs, 'rpt')
+        self.step_type = self.schedule.label(self.df['step_index'].values)
+
+        self.df_cyc = self.df[self.schedule.select(self.df['step_index'].values, 'cycling')]
+        self.df_rpt = self.df[self.schedule.select(self.df['step_index'].values, 'rpt')]
         
         self.df_agg = self.df.groupby('cycle_index').agg('max')
         
@@ -95,84 +165,218 @@ class CyclingDataParser:
         df_by_cyc['charge_energy_wh'] = self.df_agg['charge_energy_wh']
         df_by_cyc['discharge_capacity_ah'] = self.df_agg['discharge_capacity_ah']
         df_by_cyc['discharge_energy_wh'] = self.df_agg['discharge_energy_wh']
-        df_by_cyc['tot_charge_capacity_ah'] = self.df_agg['charge_capacity_ah'].cumsum()
-        df_by_cyc['tot_charge_energy_wh'] = self.df_agg['charge_energy_wh'].cumsum()
-        df_by_cyc['tot_discharge_capacity_ah'] = self.df_agg['discharge_capacity_ah'].cumsum()
-        df_by_cyc['tot_discharge_energy_wh'] = self.df_agg['discharge_energy_wh'].cumsum()
+
+        # Running totals continue from the cycles kept in the checkpoint
+        for column in ['charge_capacity_ah', 'charge_energy_wh',
+                       'discharge_capacity_ah', 'discharge_energy_wh']:
+            df_by_cyc[f'tot_{column}'] = self._cumsum(self.df_agg[column], f'tot_{column}')
 
         # Hide the data during RPTs
-        df_by_cyc['charge_capacity_ah'].loc[self.df_rpt['cycle_index'].unique()] = np.NaN
-        df_by_cyc['charge_energy_wh'].loc[self.df_rpt['cycle_index'].unique()] = np.NaN
-        df_by_cyc['discharge_capacity_ah'].loc[self.df_rpt['cycle_index'].unique()] = np.NaN
-        df_by_cyc['discharge_energy_wh'].loc[self.df_rpt['cycle_index'].unique()] = np.NaN
+        df_by_cyc.loc[self.df_rpt['cycle_index'].unique(), ['charge_capacity_ah',
+                                                             'charge_energy_wh',
+                                                             'discharge_capacity_ah',
+                                                             'discharge_energy_wh']] = np.nan
 
 
-        # Parse metrics by step type
-        charge_cc_time_s = []
-        charge_cv_time_s = []
-        charge_rest_delta_voltage_v = []
-        discharge_cc_time_s = []
-        discharge_rest_delta_voltage_v = []
+        # Parse metrics by step type, from the first and last row of each
+        # step in each cycle
+        is_step = np.isin(self.step_type, CYC_STEP_CATEGORIES)
 
-        for row in df_by_cyc.iterrows():
+        df_steps = self.df.loc[is_step, ['cycle_index', 'test_time_s', 'voltage_v']]
+        df_steps['step_type'] = np.asarray(self.step_type)[is_step]
 
-            this_df = self.df[self.df['cycle_index'] == row[0]]
+        by_step = df_steps.groupby(['cycle_index', 'step_type'])
 
-            # Charge CC
-            df_chgcc = this_df[this_df['step_index'] == CYC_STEP_INDEX_CHARGE_CC]
+        df_delta = by_step.tail(1).set_index(['cycle_index', 'step_type']) - \
+                   by_step.head(1).set_index(['cycle_index', 'step_type'])
 
-            if df_chgcc.empty:
-                charge_cc_time_s.append(np.NaN)
-            else:
-                charge_cc_time_s.append(df_chgcc['test_time_s'].tail(1).item() - \
-                                        df_chgcc['test_time_s'].head(1).item())
+        # Cycles without a step give NaN
+        delta_time_s = df_delta['test_time_s'].unstack().reindex(index=df_by_cyc.index,
+                                                                 columns=CYC_STEP_CATEGORIES)
+        delta_voltage_v = df_delta['voltage_v'].unstack().reindex(index=df_by_cyc.index,
+                                                                  columns=CYC_STEP_CATEGORIES)
 
-            # Charge CV
-            df_chgcv = this_df[this_df['step_index'] == CYC_STEP_INDEX_CHARGE_CV]
+        # Assign back to the DataFrame    
+        df_by_cyc['charge_cc_time_s'] = delta_time_s['cycling_charge_cc']
+        df_by_cyc['charge_cv_time_s'] = delta_time_s['cycling_charge_cv']
+        df_by_cyc['charge_rest_delta_voltage_v'] = delta_voltage_v['cycling_charge_rest']
+        df_by_cyc['discharge_cc_time_s'] = delta_time_s['cycling_discharge_cc']
+        df_by_cyc['discharge_rest_delta_voltage_v'] = delta_voltage_v['cycling_discharge_rest']
 
-            if df_chgcv.empty:
-                charge_cv_time_s.append(np.NaN)
-            else:
-                charge_cv_time_s.append(df_chgcv['test_time_s'].tail(1).item() - \
-                                        df_chgcv['test_time_s'].head(1).item())
+        if self._checkpoint is not None:
+            df_saved = self._checkpoint['df_by_cyc']
+            df_by_cyc = pd.concat([df_saved[df_saved.index < self.df_agg.index.min()],
+                                   df_by_cyc])
 
-            # Charge Rest
-            df_chgrest = this_df[this_df['step_index'] == CYC_STEP_INDEX_CHARGE_REST]
+        return df_by_cyc
 
-            if df_chgrest.empty:
-                charge_rest_delta_voltage_v.append(np.NaN)
-            else:
-                charge_rest_delta_voltage_v.append(df_chgrest['voltage_v'].tail(1).item() - \
-                                                   df_chgrest['voltage_v'].head(1).item())
 
-            # Discharge CC
-            df_dchcc = this_df[this_df['step_index'] == CYC_STEP_INDEX_DISCHARGE_CC]
+    def get_tables(self):
+        """
+        Returns the derived tables of the test as a dict of DataFrames:
+          - 'cycling': per-cycle info, from `get_cycling_info`
+          - 'rpt': per-RPT info, from `RptDataParser.get_rpt_info`
+          - 'hppc': HPPC info, from `RptDataParser.get_hppc_info`
 
-            if df_dchcc.empty:
-                discharge_cc_time_s.append(np.NaN)
-            else:
-                discharge_cc_time_s.append(df_dchcc['test_time_s'].tail(1).item() - \
-                                           df_dchcc['test_time_s'].head(1).item())
+        RPTs that have not finished yet are left out of the RPT table (see
+        `_get_complete_rpts`), and RPTs whose HPPC has not finished yet are
+        left out of the HPPC table. With a checkpoint, the saved rows are merged with those of the new
+        data. The tables are computed once per parser.
+        """
 
+        if self._tables is not None:
+            return self._tables
 
-            # Discharge Rest
-            df_dchrest = this_df[this_df['step_index'] == CYC_STEP_INDEX_DISCHARGE_REST]
+        rpt = RptDataParser(self.df_rpt)
+        rpt_start_cycle_list = rpt.get_rpt_start_cycles(self.offs)
 
-            if df_dchrest.empty:
-                discharge_rest_delta_voltage_v.append(np.NaN)
-            else:
-                discharge_rest_delta_voltage_v.append(df_dchrest['voltage_v'].tail(1).item() - \
-                                                      df_dchrest['voltage_v'].head(1).item())
+        # The HPPC must reach its end step within 81 cycles of the RPT start
+        end_cycles = self.df['cycle_index'][self.step_type == 'hppc_end'].unique()
+        hppc_start_cycle_list = [cycle for cycle in rpt_start_cycle_list
+                                 if np.any((end_cycles > cycle) & (end_cycles <= cycle + 81))]
 
+        tables = {'cycling': self.get_cycling_info(),
+                  'rpt': rpt.get_rpt_info(self._get_complete_rpts(rpt_start_cycle_list),
+                                          self.offs),
+                  'hppc': rpt.get_hppc_info(hppc_start_cycle_list, self.offs)}
 
-        # Assign back to the DataFrame    
-        df_by_cyc['charge_cc_time_s'] = charge_cc_time_s
-        df_by_cyc['charge_cv_time_s'] = charge_cv_time_s
-        df_by_cyc['charge_rest_delta_voltage_v'] = charge_rest_delta_voltage_v
-        df_by_cyc['discharge_cc_time_s'] = discharge_cc_time_s
-        df_by_cyc['discharge_rest_delta_voltage_v'] = discharge_rest_delta_voltage_v
+        if self._checkpoint is not None:
+            first_cycle = self.df['cycle_index'].min()
+            for name, key in [('rpt', 'df_by_rpt'), ('hppc', 'df_hppc')]:
+                df_saved = self._checkpoint[key]
+                df_saved = df_saved[df_saved['cycle_index'] < first_cycle]
+                if len(df_saved) and len(tables[name]):
+                    tables[name] = pd.concat([df_saved, tables[name]], ignore_index=True)
+                elif len(df_saved):
+                    tables[name] = df_saved.reset_index(drop=True)
 
-        return df_by_cyc
+        self._tables = tables
+
+        return tables
+
+
+    def save_checkpoint(self):
+        """
+        Save the derived tables of the test with its high-water mark, the last
+        cycle index and datapoint time processed, to `checkpoint_file`.
+
+        The raw rows of the cycles that may still change are saved as well and
+        processed again with the new data on the next run: the last cycle,
+        which may be incomplete, and any RPT started within 81 cycles of it,
+        the longest an RPT and its HPPC may span. Their rows in the saved
+        tables are replaced on the next run.
+        """
+
+        assert self.checkpoint_file is not None, 'No checkpoint file given.'
+
+        tables = self.get_tables()
+
+        last_cycle_index = self.df['cycle_index'].iloc[-1]
+
+        rpt_start_cycle_list = RptDataParser(self.df_rpt).get_rpt_start_cycles(self.offs)
+        first_open_cycle = min([last_cycle_index] +
+                               [cycle for cycle in rpt_start_cycle_list
+                                if cycle >= last_cycle_index - 81])
+
+        checkpoint = {'test_name': self.cycle_test_name,
+                      'offs': self.offs,
+                      'last_cycle_index': last_cycle_index,
+                      'last_datetime': self.df['datetime'].iloc[-1],
+                      'last_row': self.df.index[-1],
+                      'df_tail': self.df[self.df['cycle_index'] >= first_open_cycle],
+                      'df_by_cyc': tables['cycling'],
+                      'df_by_rpt': tables['rpt'],
+                      'df_hppc': tables['hppc']}
+
+        tmp_file = f'{self.checkpoint_file}.tmp'
+        pd.to_pickle(checkpoint, tmp_file)
+        os.replace(tmp_file, self.checkpoint_file)
+
+        print(f'Saved checkpoint at cycle {last_cycle_index} to "{self.checkpoint_file}".')
+
+
+    def _get_complete_rpts(self, rpt_start_cycle_list):
+        """
+        Returns the start cycles of the RPTs whose 12 hour rest at the top of
+        charge, the last step summarized by `RptDataParser.get_rpt_info`, has
+        finished: a later datapoint follows the rest, or the rest lasted
+        RPT_REST_TOP_MIN_DURATION_S. The C/20 curves and voltage decays of
+        any other RPT, e.g. one still running, are incomplete.
+        """
+
+        cycle_index = self.df['cycle_index'].values
+        step_time_s = self.df['step_time_s'].values
+
+        rest_rows = np.flatnonzero(self.step_type == 'rest_top_12hr')
+
+        complete_rpt_list = []
+
+        for rpt_start_cycle in rpt_start_cycle_list:
+
+            # Same window of cycles as get_rpt_info
+            rows = rest_rows[(cycle_index[rest_rows] >= rpt_start_cycle) & \
+                             (cycle_index[rest_rows] <= rpt_start_cycle + 33)]
+
+            if len(rows) == 0:
+                continue
+
+            if rows[-1] < len(self.df) - 1 or \
+                    step_time_s[rows[-1]] >= RPT_REST_TOP_MIN_DURATION_S:
+                complete_rpt_list.append(rpt_start_cycle)
+
+        return complete_rpt_list
+
+
+    def _load_checkpoint(self):
+        """
+        Returns the saved checkpoint of this test, or None to start over
+        """
+
+        if self.checkpoint_file is None or not os.path.exists(self.checkpoint_file):
+            return None
+
+        checkpoint = pd.read_pickle(self.checkpoint_file)
+
+        assert checkpoint['test_name'] == self.cycle_test_name, \
+            f'Checkpoint is for another test: "{checkpoint["test_name"]}".'
+        assert checkpoint['offs'] == self.offs, \
+            'Checkpoint was made with another step index offset.'
+
+        return checkpoint
+
+
+    def _append_new_rows(self, df_new):
+        """
+        Returns the saved rows of the open cycles followed by the new rows,
+        labeled after the last row processed so that row labels match those
+        of a full read
+        """
+
+        df_new = df_new.copy()
+        df_new.index = pd.RangeIndex(self._checkpoint['last_row'] + 1,
+                                     self._checkpoint['last_row'] + 1 + len(df_new))
+
+        print(f'Found {len(df_new)} new datapoints.')
+
+        return pd.concat([self._checkpoint['df_tail'], df_new])
+
+
+    def _cumsum(self, values, column):
+        """
+        Returns the cumulative sum of per-cycle values, continued from the
+        total in the checkpoint before the first cycle
+        """
+
+        start = 0
+
+        if self._checkpoint is not None:
+            df_saved = self._checkpoint['df_by_cyc']
+            saved = df_saved.loc[df_saved.index < values.index.min(), column].dropna()
+            if len(saved):
+                start = saved.iloc[-1]
+
+        # Summing from the saved total gives the same result as summing all cycles
+        return pd.concat([pd.Series([start]), values]).cumsum().iloc[1:].values
         
     
 
@@ -188,6 +392,14 @@ class RptDataParser:
         """
         
         self.df = df_rpt
+
+        # Row positions sorted by cycle index, built on first use
+        self._cycle_order = None
+        self._sorted_cycles = None
+
+        # Step category of every row for each step index offset, built on
+        # first use
+        self._step_types = dict()
         
         
     def get_rpt_start_cycles(self, offs):
@@ -198,17 +410,14 @@ class RptDataParser:
         ----------
         offs (int): step index offset (schedule file specific)
         """
-    
-        rpt_start_cycle_list = []
-
-        unique_cycles = self.df['cycle_index'].unique()
 
-        for cycle in unique_cycles:
+        cycle_index = self.df['cycle_index'].values
+        is_start = self._get_step_type(offs) == 'rpt_start'
 
-            this_df = self.df[self.df['cycle_index'] == cycle]
+        unique_cycles = self.df['cycle_index'].unique()
 
-            if this_df['step_index'].isin([RPT_STEP_INDEX_START + offs]).any():
-                rpt_start_cycle_list.append(cycle)
+        rpt_start_cycle_list = list(unique_cycles[np.isin(unique_cycles,
+                                                          cycle_index[is_start])])
                 
         return rpt_start_cycle_list
         
@@ -234,60 +443,34 @@ class RptDataParser:
         c20_charge_capacity_ah_list = []
         throughput_ah_list = []
         dvdq_data_list = []
+        c20_curves_list = []
         voltage_decay_at_top_list = []
         voltage_decay_at_bot_list = []
 
+        step_type = self._get_step_type(offs)
+
         for rpt_start_cycle in rpt_start_cycle_list:
 
             # Create a DataFrame to hold the current RPT data only
-            this_rpt = self.df[(self.df['cycle_index'] >= rpt_start_cycle)]
-            this_rpt = this_rpt[this_rpt['cycle_index'] <= rpt_start_cycle + 33]
-            this_rpt['time_s'] = this_rpt['test_time_s'] - this_rpt['test_time_s'].iloc[0]
+            rows = self._get_cycle_rows(rpt_start_cycle, rpt_start_cycle + 33)
+            this_rpt = self.df.iloc[rows]
+            this_type = step_type[rows]
 
             # Extract the charge and discharge C/20 curves
-            c20_charge_capacity_ah = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_C20_CHARGE + offs]['charge_capacity_ah']
-            c20_charge_voltage_v   = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_C20_CHARGE + offs]['voltage_v']
-            c20_discharge_capacity_ah = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_C20_DISCHARGE + offs]['discharge_capacity_ah']
-            c20_discharge_voltage_v   = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_C20_DISCHARGE + offs]['voltage_v']
-
-            voltage_decay_at_top = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_VOLTAGE_RELAX_TOP_12HR + offs]['voltage_v']
-            voltage_decay_at_bot = this_rpt[this_rpt['step_index'] == \
-                                RPT_STEP_INDEX_VOLTAGE_RELAX_BOT_2P5HR + offs]['voltage_v']
+            c20_charge_capacity_ah = this_rpt[this_type == 'c20_charge']['charge_capacity_ah']
+            c20_charge_voltage_v   = this_rpt[this_type == 'c20_charge']['voltage_v']
+            c20_discharge_capacity_ah = this_rpt[this_type == 'c20_discharge']['discharge_capacity_ah']
+            c20_discharge_voltage_v   = this_rpt[this_type == 'c20_discharge']['voltage_v']
+
+            voltage_decay_at_top = this_rpt[this_type == 'rest_top_12hr']['voltage_v']
+            voltage_decay_at_bot = this_rpt[this_type == 'rest_bottom_2p5hr']['voltage_v']
 
             if len(c20_charge_capacity_ah) == 0:
                 continue
                 
-            # Calculate the filtered dV/dQ outputs
-            window_length = 101
-            polyorder = 2
-            Qf_d = signal.savgol_filter(c20_discharge_capacity_ah,window_length,polyorder)
-            dQ_d = signal.savgol_filter(c20_discharge_capacity_ah,window_length,polyorder,1)
-            Vf_d = signal.savgol_filter(c20_discharge_voltage_v,window_length,polyorder)
-            dV_d = signal.savgol_filter(c20_discharge_voltage_v,window_length,polyorder,1)
-            dVdQ_d = dV_d / dQ_d    
-            dQdV_d = dQ_d / dV_d
-
-            Qf_c = signal.savgol_filter(c20_charge_capacity_ah,window_length,polyorder)
-            dQ_c = signal.savgol_filter(c20_charge_capacity_ah,window_length,polyorder,1)
-            Vf_c = signal.savgol_filter(c20_charge_voltage_v,window_length,polyorder)
-            dV_c = signal.savgol_filter(c20_charge_voltage_v,window_length,polyorder,1)
-            dVdQ_c = dV_c / dQ_c    
-            dQdV_c = dQ_c / dV_c
-
-            this_dvdq_data = dict()
-            this_dvdq_data['dch_q'] = Qf_d
-            this_dvdq_data['dch_v'] = Vf_d
-            this_dvdq_data['dch_dvdq'] = dVdQ_d
-            this_dvdq_data['chg_q'] = Qf_c
-            this_dvdq_data['chg_v'] = Vf_c
-            this_dvdq_data['chg_dvdq'] = dVdQ_c
-
-            dvdq_data_list.append(this_dvdq_data)
+            # Keep the C/20 curves; dV/dQ is computed for all RPTs at once
+            c20_curves_list.append((c20_discharge_capacity_ah, c20_discharge_voltage_v,
+                                    c20_charge_capacity_ah, c20_charge_voltage_v))
             c20_discharge_capacity_ah_list.append(c20_discharge_capacity_ah.max())
             c20_charge_capacity_ah_list.append(c20_charge_capacity_ah.max())
             cycle_index_list.append(rpt_start_cycle)
@@ -296,7 +479,30 @@ class RptDataParser:
             voltage_decay_at_bot_list.append(voltage_decay_at_bot.tail(1).item() - \
                                              voltage_decay_at_bot.head(1).item())
 
-            
+
+        # Calculate the filtered dV/dQ outputs of the discharge and charge
+        # curves of all RPTs in one batch
+        window_length = 101
+        polyorder = 2
+
+        num_rpts = len(c20_curves_list)
+        dvdq_curves = smoothing.get_dvdq_curves(
+            [curves[0] for curves in c20_curves_list] + [curves[2] for curves in c20_curves_list],
+            [curves[1] for curves in c20_curves_list] + [curves[3] for curves in c20_curves_list],
+            window_length, polyorder)
+
+        for dch, chg in zip(dvdq_curves[:num_rpts], dvdq_curves[num_rpts:]):
+
+            this_dvdq_data = dict()
+            this_dvdq_data['dch_q'] = dch['q']
+            this_dvdq_data['dch_v'] = dch['v']
+            this_dvdq_data['dch_dvdq'] = dch['dvdq']
+            this_dvdq_data['chg_q'] = chg['q']
+            this_dvdq_data['chg_v'] = chg['v']
+            this_dvdq_data['chg_dvdq'] = chg['dvdq']
+
+            dvdq_data_list.append(this_dvdq_data)
+
         # Assemble the final DataFrame from the lists
         df_by_rpt = pd.DataFrame(list(zip(cycle_index_list, 
                                           c20_discharge_capacity_ah_list, 
@@ -319,96 +525,539 @@ class RptDataParser:
         """
         Return a DataFrame containing HPPC info extracted from the RPT
         
+        Pulses are located once for all RPTs by grouping the pulse rows by
+        cycle index, and the resistances of all HPPC cycles are computed
+        together.
+
         Parameters
         ----------
         rpt_start_cycle_list (list(int)) : list of cycle indices corresponding to RPTs
         offs (int): step index offset (schedule file specific)
         """
-                
-        resistance_charge_list = []
-        resistance_discharge_list = []
+
+        df_cycles = self._get_hppc_cycles(rpt_start_cycle_list, offs)
+
+        resistance = dict()
+
+        for direction, category in HPPC_PULSE_CATEGORIES.items():
+
+            df_pulses, rows = self._get_hppc_pulses(df_cycles['hppc_cycle_index'].unique(),
+                                                    category, offs)
+
+            V1 = hppc.interp_pulses(HPPC_PULSE_DURATION_TARGET_S,
+                                    self.df['step_time_s'].values[rows],
+                                    self.df['voltage_v'].values[rows],
+                                    df_pulses['length'].values)
+
+            R = (V1 - df_pulses['voltage_0'].values) / df_pulses['current'].values
+
+            # Cycles without the pulse step give NaN
+            resistance[direction] = pd.Series(R, index=df_pulses.index) \
+                                      .reindex(df_cycles['hppc_cycle_index']).values
+
+        # Package the lists as a DataFrame
+        df_hppc = pd.DataFrame(list(zip(df_cycles['cycle_index'],
+                              resistance['discharge'].tolist(),
+                              resistance['charge'].tolist(),
+                              df_cycles['capacity_ah'])), columns=['cycle_index', 
+                                                                   'resistance_discharge_ohms',
+                                                                   'resistance_charge_ohms',
+                                                                   'capacity_ah'])
+
+    
+        return df_hppc
+
+
+    def fit_hppc_ecm(self, rpt_start_cycle_list, offs=0, num_rc=2, **kwargs):
+        """
+        Fit an equivalent circuit model, a series resistance and `num_rc` RC
+        pairs, to every HPPC pulse of the RPTs (see src.ecm).
+
+        Pulses are referenced as in `get_hppc_info`: the voltage change from
+        the median of the 5 points before the pulse, divided by the median
+        pulse current. All pulses are fit as one batch, and each pulse is
+        warm started from the previous pulse of the same RPT and direction.
+
+        Parameters
+        ----------
+        rpt_start_cycle_list (list(int)) : list of cycle indices corresponding to RPTs
+        offs (int): step index offset (schedule file specific)
+        num_rc (int): number of RC pairs
+        kwargs: passed on to src.ecm.fit_pulses
+
+        Returns
+        ----------
+        a DataFrame with one row per pulse holding cycle_index (RPT start
+        cycle), hppc_cycle_index, direction, capacity_ah, the fitted
+        parameters (r0_ohm, r1_ohm, ..., tau1_s, ...), rmse_ohm and converged
+        """
+
+        df_cycles = self._get_hppc_cycles(rpt_start_cycle_list, offs)
+        df_cycles['order'] = np.arange(len(df_cycles))
+
+        frames = []
+        time_list = []
+        values_list = []
+        lengths_list = []
+
+        for direction, category in HPPC_PULSE_CATEGORIES.items():
+
+            df_pulses, rows = self._get_hppc_pulses(df_cycles['hppc_cycle_index'].unique(),
+                                                    category, offs)
+
+            lengths = df_pulses['length'].values
+
+            time_list.append(self.df['step_time_s'].values[rows])
+            values_list.append((self.df['voltage_v'].values[rows]
+                                - np.repeat(df_pulses['voltage_0'].values, lengths))
+                               / np.repeat(df_pulses['current'].values, lengths))
+            lengths_list.append(lengths)
+
+            # One pulse per HPPC cycle of each RPT holding the pulse step;
+            # a cycle shared by overlapping RPTs is fit once per RPT
+            df = df_cycles.join(pd.DataFrame({'pulse': np.arange(len(df_pulses))},
+                                             index=df_pulses.index),
+                                on='hppc_cycle_index', how='inner')
+            df['direction'] = direction
+            df['pulse'] += sum(len(l) for l in lengths_list[:-1])
+
+            frames.append(df)
+
+        # Discharge before charge within each cycle
+        df = pd.concat(frames).sort_values('order', kind='stable').reset_index(drop=True)
+
+        if df.empty:
+            return df[['cycle_index', 'hppc_cycle_index', 'direction', 'capacity_ah']]
+
+        # Gather the samples of each fitted pulse
+        time = np.concatenate(time_list)
+        values = np.concatenate(values_list)
+        all_lengths = np.concatenate(lengths_list)
+        lengths = all_lengths[df['pulse'].values]
+        starts = (np.cumsum(all_lengths) - all_lengths)[df['pulse'].values]
+        rows = hppc.get_pulse_rows(starts, starts + lengths)
+
+        sweeps = df.groupby(['cycle_index', 'direction'], sort=False)
+
+        params, rmse, converged = ecm.fit_pulse_sequences(
+            time[rows], values[rows], lengths, sweeps.ngroup().values,
+            sweeps.cumcount().values, num_rc, **kwargs)
+
+        df = df[['cycle_index', 'hppc_cycle_index', 'direction', 'capacity_ah']]
+        df = pd.concat([df, ecm.get_params_table(params, num_rc)], axis=1)
+        df['rmse_ohm'] = rmse
+        df['converged'] = converged
+
+        return df
+
+
+    def _get_cycle_rows(self, first_cycle, last_cycle):
+        """
+        Returns the positions of the rows with cycle indices from
+        `first_cycle` to `last_cycle`, in their original order
+
+        Rows are located by binary search in the cycle indices, sorted once,
+        so the cost depends on the number of rows returned rather than on the
+        length of the test.
+        """
+
+        if self._cycle_order is None:
+            cycle_index = self.df['cycle_index'].values
+            self._cycle_order = np.argsort(cycle_index, kind='stable')
+            self._sorted_cycles = cycle_index[self._cycle_order]
+
+        start = np.searchsorted(self._sorted_cycles, first_cycle, side='left')
+        stop = np.searchsorted(self._sorted_cycles, last_cycle, side='right')
+
+        return np.sort(self._cycle_order[start:stop])
+
+
+    def _get_step_type(self, offs=0):
+        """
+        Returns the step category of every row, labeled once for each step
+        index offset (see src.schedules)
+        """
+
+        if offs not in self._step_types:
+            schedule = get_schedule(SCHEDULE, offs, 'rpt')
+            self._step_types[offs] = schedule.label(self.df['step_index'].values)
+
+        return self._step_types[offs]
+
+
+    def _get_hppc_cycles(self, rpt_start_cycle_list, offs=0):
+        """
+        Returns the HPPC cycles of each RPT as a DataFrame with columns
+        cycle_index (RPT start cycle), hppc_cycle_index, and capacity_ah, the
+        capacity charged since the start of the HPPC before each cycle
+
+        The HPPC of an RPT spans the cycles from the one after the RPT start
+        up to the first cycle, within 81 cycles, that reaches the end of HPPC
+        step. Cycles are taken in order of appearance.
+        """
+
+        cycle_index = self.df['cycle_index'].values
+        step_type = self._get_step_type(offs)
+
+        cycles = pd.unique(cycle_index)
+        end_cycles = cycle_index[step_type == 'hppc_end']
+
+        # Amp-hours moved by the charge-up step of each cycle
+        is_chg_up = step_type == 'hppc_charge_up'
+        df_chg_up = self.df['charge_capacity_ah'][is_chg_up] \
+                        .groupby(cycle_index[is_chg_up]).agg(['max', 'min'])
+        delta_ah = df_chg_up['max'] - df_chg_up['min']
+
         cycle_index_list = []
-        throughput_ah_list = []
+        hppc_cycle_index_list = []
         capacity_ah_list = []
 
         for rpt_start_cycle in rpt_start_cycle_list:
 
             hppc_start_cycle = rpt_start_cycle + 1
-            
-            # Create a DataFrame to hold the current HPPC data only
-            this_rpt = self.df[(self.df['cycle_index'] >= hppc_start_cycle)]
 
-            # First overshoot a bit...
-            this_rpt = this_rpt[this_rpt['cycle_index'] <= hppc_start_cycle + 80]
+            # First overshoot a bit, then trim at the end of the HPPC
+            hppc_end_cycle = end_cycles[(end_cycles >= hppc_start_cycle) & \
+                                        (end_cycles <= hppc_start_cycle + 80)][0]
 
-            # ...then trim
-            hppc_end_cycle  = this_rpt[this_rpt['step_index'] == \
-                                       RPT_STEP_INDEX_END_OF_HPPC + offs]['cycle_index'].iloc[0]
-            this_rpt = this_rpt[this_rpt['cycle_index'] <= hppc_end_cycle]
+            hppc_cycles = cycles[(cycles >= hppc_start_cycle) & (cycles <= hppc_end_cycle)]
 
             # Reset the capacity counter for each RPT; use this to convert to SOC later
-            capacity_ah_counter = 0
-
-            # Break out each sequence by cycle index    
-            for hppc_cycle_index in this_rpt['cycle_index'].unique():
-
-                curr_hppc = this_rpt[this_rpt['cycle_index'] == hppc_cycle_index].copy()
-                curr_hppc['time_s'] = curr_hppc['test_time_s'] - curr_hppc['test_time_s'].iloc[0]
-
-                # Process the discharge pulse
-                df_dch_pulse = curr_hppc[curr_hppc['step_index'] == \
-                                         HPPC_STEP_INDEX_PULSE_DISCHARGE + offs]
-                if df_dch_pulse.empty:
-                    R_dch = np.NaN
-                else:
-                    V0 = self.df['voltage_v'].loc[np.arange(df_dch_pulse.index[0] - \
-                                                                5, df_dch_pulse.index[0])].median()
-                    V1 = np.interp(HPPC_PULSE_DURATION_TARGET_S, \
-                                   df_dch_pulse['step_time_s'], df_dch_pulse['voltage_v'])
-                    I = df_dch_pulse['current_a'].median()
-                    R_dch = (V1 - V0)/I
-
-                # Process the charge pulse
-                df_chg_pulse = curr_hppc[curr_hppc['step_index'] == \
-                                         HPPC_STEP_INDEX_PULSE_CHARGE + offs]
-                if df_chg_pulse.empty:
-                    R_chg = np.NaN
-                else:
-                    V0 = self.df['voltage_v'].loc[np.arange(df_chg_pulse.index[0] - \
-                                                                5, df_chg_pulse.index[0])].median()
-                    V1 = np.interp(HPPC_PULSE_DURATION_TARGET_S, \
-                                   df_chg_pulse['step_time_s'], df_chg_pulse['voltage_v'])
-                    I = df_chg_pulse['current_a'].median()
-                    R_chg = (V1 - V0)/I
-
-                resistance_discharge_list.append(R_dch)
-                resistance_charge_list.append(R_chg)
-                cycle_index_list.append(rpt_start_cycle)
-                capacity_ah_list.append(capacity_ah_counter)
-
-                # Update the amp-hours moved
-                df_chg_up = curr_hppc[curr_hppc['step_index'] == \
-                                      HPPC_STEP_INDEX_CHARGE_UP + offs]
-                capacity_ah_counter += df_chg_up['charge_capacity_ah'].max() - \
-                                       df_chg_up['charge_capacity_ah'].min()
+            capacity_ah = np.cumsum(delta_ah.reindex(hppc_cycles[:-1]).values)
 
+            cycle_index_list += [rpt_start_cycle] * len(hppc_cycles)
+            hppc_cycle_index_list += list(hppc_cycles)
+            capacity_ah_list += [0] + capacity_ah.tolist()
 
-        # Package the lists as a DataFrame
-        df_hppc = pd.DataFrame(list(zip(cycle_index_list,
-                              resistance_discharge_list,
-                              resistance_charge_list,
-                              capacity_ah_list)), columns=['cycle_index', 
-                                                            'resistance_discharge_ohms',
-                                                            'resistance_charge_ohms',
-                                                            'capacity_ah'])
+        return pd.DataFrame({'cycle_index': cycle_index_list,
+                             'hppc_cycle_index': hppc_cycle_index_list,
+                             'capacity_ah': np.array(capacity_ah_list, dtype=np.float64)})
 
-    
-        return df_hppc
+
+    def _get_hppc_pulses(self, cycles, category, offs=0):
+        """
+        Locate the rows of a pulse step category in each of the given cycles
+
+        Returns a tuple of
+          - a DataFrame indexed by the cycles holding the step, with the number
+            of pulse rows (length), the median of the 5 voltages before the
+            first pulse row (voltage_0) and the median pulse current (current)
+          - the row positions of the pulses, grouped by cycle in the order of
+            the DataFrame
+        """
+
+        cycle_index = self.df['cycle_index'].values
+
+        rows = np.flatnonzero((self._get_step_type(offs) == category) & \
+                              np.isin(cycle_index, cycles))
+        rows = rows[np.argsort(cycle_index[rows], kind='stable')]
+
+        pulse_cycles, first, lengths = np.unique(cycle_index[rows], return_index=True,
+                                                 return_counts=True)
+
+        # The 5 rows before the first pulse row, by label
+        labels = self.df.index.values[rows[first], np.newaxis] + np.arange(-5, 0)
+        positions = self.df.index.get_indexer(labels.ravel())
+
+        assert np.all(positions >= 0), \
+            'Rows before a pulse are missing from the data.'
+
+        voltage_0 = self.df['voltage_v'].values[positions].reshape(-1, 5)
+
+        current = self.df['current_a'].iloc[rows] \
+                      .groupby(np.repeat(pulse_cycles, lengths)).median()
+
+        df_pulses = pd.DataFrame({'length': lengths,
+                                  'voltage_0': np.nanmedian(voltage_0, axis=1),
+                                  'current': current.values},
+                                 index=pulse_cycles)
+
+        return df_pulses, rows
     
     
 class FormationParser:
     
-    
-    def __init__():
-        
-        pass
\ No newline at end of file
+    def __init__(self, device_name, vas_helper, key='FORM', schedule='formation_baseline'):
+        """
+        Use VAS to initialize a parser for a formation test
+
+        Parameters
+        ---------
+        device_name (str): the name of a device
+        vas_helper (vas.VasHelper): the VAS helper used to fetch the data
+        key (str): keyword identifying the formation test among those of the
+                   device
+        schedule (str): name of the formation protocol in src.schedules
+        """
+
+        test_list = _find_test_names(vas_helper, device_name, key)
+
+        assert not len(test_list) == 0, 'No formation test found.'
+        assert not len(test_list) > 1, 'More than one formation test found.'
+
+        self.device_name = device_name
+        self.test_name = test_list[0]
+
+        print(f'Working on "{self.test_name}"...')
+
+        self.df = vas_helper.get_cycler_data(self.test_name)
+
+        # Label every row with its step category once
+        self.schedule = get_schedule(schedule)
+        self.step_type = self.schedule.label(self.df['step_index'].values)
+
+        self._df_steps = None
+
+        print(f'Initialization complete.')
+
+
+    def get_step_table(self):
+        """
+        Returns a DataFrame with one row per step of each cycle, indexed by
+        cycle_index and step_type (step category), holding the first, last
+        and maximum values of the test time, voltage and capacities
+
+        Built once, by one groupby over all rows.
+        """
+
+        if self._df_steps is not None:
+            return self._df_steps
+
+        keys = ['cycle_index', 'step_type']
+        columns = ['test_time_s', 'voltage_v', 'charge_capacity_ah', 'discharge_capacity_ah']
+
+        df = self.df[['cycle_index'] + columns].assign(step_type=self.step_type)
+
+        by_step = df.groupby(keys, observed=True, sort=False)
+
+        # First and last rows rather than first and last valid values
+        self._df_steps = pd.concat({'first': by_step.head(1).set_index(keys),
+                                    'last': by_step.tail(1).set_index(keys),
+                                    'max': by_step[columns].max()}, axis=1)
+
+        return self._df_steps
+
+
+    def get_formation_features(self):
+        """
+        Returns the formation features of the test as a dict, named as in
+        `FormationCell.get_formation_test_summary_statistics`: first cycle
+        capacities and efficiency, final discharge capacity, capacity below
+        3.2V on the first discharge, first CV hold capacity, 6-hour rest
+        voltage decay and C/20 charge dV/dQ peak-to-peak capacity
+        """
+
+        df_steps = self.get_step_table()
+
+        # Maximum capacities of each cycle, over its steps
+        df_cycles = df_steps['max'].groupby(level='cycle_index').max()
+
+        first_cycle = self.schedule.get_cycle('first_cycle')
+        last_cycle = self.schedule.get_cycle('final', df_cycles.index.max())
+
+        res_dict = dict()
+
+        # Capacity below 3.2V during first discharge, a proxy for low-SOC resistance
+        is_below_3p2v = (self.step_type == 'first_discharge') & \
+                        (self.df['voltage_v'].values < 3.2)
+        cap_vec_below_3p2v = self.df['discharge_capacity_ah'].values[is_below_3p2v]
+
+        res_dict['form_first_discharge_capacity_below_3p2v_ah'] = \
+            cap_vec_below_3p2v[-1] - cap_vec_below_3p2v[0]
+
+        res_dict['form_first_charge_capacity_ah'] = \
+            df_cycles.loc[first_cycle, 'charge_capacity_ah']
+        res_dict['form_first_discharge_capacity_ah'] = \
+            df_cycles.loc[first_cycle, 'discharge_capacity_ah']
+        res_dict['form_first_cycle_efficiency'] = res_dict['form_first_discharge_capacity_ah'] / \
+                                                  res_dict['form_first_charge_capacity_ah']
+        res_dict['form_final_discharge_capacity_ah'] = \
+            df_cycles.loc[last_cycle, 'discharge_capacity_ah']
+
+        # Voltage decay during the 6-hour rest at 100% SOC
+        df_rest = self._get_step_rows(self.schedule.get_cycle('six_hour_rest'), 'six_hour_rest')
+        res_dict.update(features.get_rest_decay_features(df_rest['step_time_s'].values,
+                                                          df_rest['voltage_v'].values))
+
+        # Capacity of the first CV hold
+        cv_hold = df_steps.loc[(self.schedule.get_cycle('first_cv_hold'), 'first_cv_hold')]
+        res_dict['form_first_cv_hold_capacity_ah'] = cv_hold[('last', 'charge_capacity_ah')] - \
+                                                     cv_hold[('first', 'charge_capacity_ah')]
+
+        # dV/dQ peak-to-peak capacity of the final C/20 charge
+        df_c20_charge = self._get_step_rows(last_cycle, 'c20_charge')
+        capacity, _, idx_peaks, peak_heights = features.get_dvdq_peaks(
+            df_c20_charge['charge_capacity_ah'].values, df_c20_charge['voltage_v'].values)
+
+        res_dict['form_c20_charge_qpp_ah'] = capacity[idx_peaks[-1]] - capacity[idx_peaks[0]]
+        res_dict['form_c20_charge_right_peak_v_per_ah'] = peak_heights[-1]
+
+        return res_dict
+
+
+    def _get_step_rows(self, cycle_index, category):
+        """
+        Returns the rows of a step category in one cycle
+        """
+
+        return self.df[(self.df['cycle_index'].values == cycle_index) & \
+                       (self.step_type == category)]
+
+
+def get_formation_features(device_name_list, vas_helper, key='FORM',
+                           schedule='formation_baseline', max_workers=MAX_FETCH_WORKERS):
+    """
+    Compute the formation features of many devices and combine them into a
+    single table.
+
+    Fetching the tests from VAS is I/O bound, so devices are parsed by a pool
+    of worker threads sharing one VAS helper.
+
+    Parameters
+    ---------
+    device_name_list (list of str): devices to parse
+    vas_helper (vas.VasHelper): the VAS helper used to fetch the data
+    key, schedule: as in FormationParser
+    max_workers (int): number of devices parsed at once
+
+    Returns
+    ---------
+    a DataFrame with one row per device, in the order of `device_name_list`,
+    holding device_name and the features of FormationParser.get_formation_features
+    """
+
+    def parse_device(device_name):
+
+        return FormationParser(device_name, vas_helper, key, schedule).get_formation_features()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        feature_list = list(executor.map(parse_device, device_name_list))
+
+    df = pd.DataFrame(feature_list)
+    df.insert(0, 'device_name', list(device_name_list))
+
+    return df
+
+
+def stitch_records(frames):
+    """
+    Join the cycler data of several test records of one device, e.g. a test
+    and its continuation records after restarts, into one timeline.
+
+    Records are taken in order of their first datapoint. The rows of a record
+    logged at or before the last datapoint of the records before it, e.g. the
+    end of a test exported again in its continuation record, are dropped, so
+    that the records follow one another and their concatenation is in time
+    order. Each record's test time is shifted to continue from the previous
+    record, keeping the wall clock gap between them, and its cycle indices
+    are shifted to follow the last cycle of the previous record, as a
+    restarted test starts a new cycle. A record whose dropped rows end within
+    a cycle instead resumes that cycle, the last cycle of the previous record,
+    and its first rows are merged into it. Capacity and energy counters
+    restart with every cycle, so they need no shifting; the running totals of
+    `CyclingDataParser.get_cycling_info` continue across records.
+
+    Each column of the result is allocated once and filled record by record,
+    without intermediate copies of the records.
+
+    Parameters
+    ---------
+    frames (list of pd.DataFrame): records from `VasHelper.get_cycler_data`,
+                                   each in time order
+
+    Returns
+    ---------
+    a DataFrame with the columns and dtypes of the records and a fresh
+    RangeIndex
+    """
+
+    frames = sorted([df for df in frames if len(df)], key=lambda df: df['datetime'].iloc[0])
+
+    assert len(frames) > 0, 'No data to stitch.'
+
+    columns = list(frames[0].columns)
+
+    for df in frames:
+        assert list(df.columns) == columns, 'Records have different columns.'
+
+    # Keep the rows of each record logged after the records before it, with
+    # their datapoint times as integer nanoseconds
+    records = []
+    last_time = None
+
+    for df in frames:
+
+        times = df['datetime'].dt.tz_convert('UTC').dt.tz_localize(None) \
+                  .values.astype('datetime64[ns]').view(np.int64)
+
+        assert np.all(np.diff(times) >= 0), 'Record is not in time order.'
+
+        # Whether the record's first kept row is within a cycle it began in
+        # the dropped rows
+        resumes_cycle = False
+
+        if last_time is not None and times[0] <= last_time:
+            is_new = times > last_time
+            print(f'Dropping {np.sum(~is_new)} datapoints overlapping the previous records.')
+            if np.any(is_new):
+                first_new = np.argmax(is_new)
+                resumes_cycle = df['cycle_index'].iloc[first_new] \
+                                == df['cycle_index'].iloc[first_new - 1]
+            df, times = df[is_new], times[is_new]
+
+        if len(df):
+            records.append((df, times, resumes_cycle))
+            last_time = times[-1]
+
+    lengths = np.array([len(df) for df, _, _ in records])
+    starts = np.cumsum(lengths) - lengths
+    num_rows = lengths.sum()
+
+    # Shift of the test time and cycle index of each record
+    time_offset = np.zeros(len(records))
+    cycle_offset = np.zeros(len(records), dtype=np.int64)
+
+    for i in range(1, len(records)):
+
+        (prev, prev_times, _), (this, this_times, resumes_cycle) = records[i - 1], records[i]
+        gap_s = (this_times[0] - prev_times[-1]) / 1e9
+
+        time_offset[i] = time_offset[i - 1] + prev['test_time_s'].iloc[-1] + gap_s \
+                         - this['test_time_s'].iloc[0]
+        cycle_offset[i] = cycle_offset[i - 1] + prev['cycle_index'].max() \
+                          - this['cycle_index'].min() + (0 if resumes_cycle else 1)
+
+    offsets = {'test_time_s': time_offset, 'cycle_index': cycle_offset}
+
+    data = dict()
+
+    for column in columns:
+
+        if column == 'datetime':
+            times = np.concatenate([times for _, times, _ in records])
+            data[column] = pd.to_datetime(times, utc=True) \
+                             .tz_convert(frames[0]['datetime'].dt.tz) \
+                             .astype(frames[0]['datetime'].dtype)
+            continue
+
+        values = np.empty(num_rows, dtype=np.result_type(*[df[column].dtype for df in frames]))
+
+        for i, ((df, _, _), start) in enumerate(zip(records, starts)):
+            rows = slice(start, start + len(df))
+            values[rows] = df[column].values
+            if column in offsets:
+                values[rows] += offsets[column][i]
+
+        data[column] = values
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def _find_test_names(vas_helper, device_name, key):
+    """
+    Returns the names of the cycler tests of a device containing `key`
+    """
+
+    test_list, _ = vas_helper.get_test_names(device_name)
+
+    return [test_name for test_name in test_list if key in test_name]
@@ -0,0 +1,277 @@
+"""
+Registry of the step schedules of the test protocols.
+
+Each protocol runs a schedule file in which every step index has a fixed
+meaning, e.g. step 13 of the aging test is the C/20 charge of the RPT. A
+StepSchedule declares these meanings once as named step categories and
+compiles them into a lookup table indexed by step index, so that all rows of
+a test are labeled with their category, or selected by category, with a
+single array lookup.
+"""
+
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Category of the rows whose step is not declared in the schedule
+OTHER = 'other'
+
+
+class StepSchedule:
+    """
+    Step categories, blocks and named cycles of one test protocol
+    """
+
+    def __init__(self, name, steps, blocks=None, cycles=None):
+        """
+        Parameters
+        ---------
+        name (str): name of the protocol
+        steps (dict): step index, or list of step indices, of each category;
+                      None for a category the protocol does not run
+        blocks (dict): (start, stop) range of step indices, stop excluded, of
+                       each block of the schedule, e.g. the RPT
+        cycles (dict): cycle index of each named cycle; values below 1 count
+                       back from the last cycle of the test, 0 being the last
+        """
+
+        self.name = name
+        self.steps = {category: [] if value is None else list(np.atleast_1d(value))
+                      for category, value in steps.items()}
+        self.blocks = dict(blocks or {})
+        self.cycles = dict(cycles or {})
+
+        assert OTHER not in self.steps, f'"{OTHER}" is a reserved category.'
+        assert not set(self.steps) & set(self.blocks), \
+            'Categories and blocks must have different names.'
+
+        all_steps = [step for steps in self.steps.values() for step in steps]
+
+        assert len(all_steps) == len(set(all_steps)), \
+            f'A step belongs to more than one category in schedule "{name}".'
+
+        self.categories = [OTHER] + list(self.steps)
+
+        # Category code of each step index; the last entry holds steps beyond
+        # the schedule
+        size = max(all_steps + [stop for _, stop in self.blocks.values()] + [0]) + 2
+        self._lookup = np.zeros(size, dtype=np.int16)
+
+        for code, steps in enumerate(self.steps.values(), start=1):
+            self._lookup[steps] = code
+
+        self._lookup.flags.writeable = False
+
+
+    def __repr__(self):
+
+        return f'StepSchedule("{self.name}", {len(self.steps)} categories)'
+
+
+    def label(self, step_index):
+        """
+        Returns the category of every row
+
+        Parameters
+        ---------
+        step_index (array-like): step index of each row
+
+        Returns
+        ---------
+        a pd.Categorical holding one category per row, 'other' for steps not
+        declared in the schedule
+        """
+
+        codes = self._lookup[self._get_positions(step_index)]
+
+        return pd.Categorical.from_codes(codes, categories=self.categories)
+
+
+    def select(self, step_index, *names):
+        """
+        Returns a boolean mask of the rows in any of the named categories or
+        blocks
+
+        Parameters
+        ---------
+        step_index (array-like): step index of each row
+        names (str): categories or blocks
+        """
+
+        is_selected = np.zeros(len(self._lookup), dtype=bool)
+
+        for name in names:
+            is_selected[self.get_steps(name)] = True
+
+        return is_selected[self._get_positions(step_index)]
+
+
+    def get_steps(self, name):
+        """
+        Returns the step indices of a category or block as a list
+        """
+
+        if name in self.blocks:
+            start, stop = self.blocks[name]
+            return list(range(max(start, 0), stop))
+
+        assert name in self.steps, f'No step category "{name}" in schedule "{self.name}".'
+
+        return self.steps[name]
+
+
+    def get_step(self, category):
+        """
+        Returns the step index of a category run as a single step
+        """
+
+        steps = self.get_steps(category)
+
+        assert len(steps) == 1, f'Category "{category}" does not hold exactly one step.'
+
+        return steps[0]
+
+
+    def get_cycle(self, name, last_cycle=None):
+        """
+        Returns the cycle index of a named cycle
+
+        Parameters
+        ---------
+        name (str): name of the cycle
+        last_cycle (int): last cycle index of the test, needed for cycles
+                          counted back from the end
+        """
+
+        assert name in self.cycles, f'No cycle "{name}" in schedule "{self.name}".'
+
+        cycle = self.cycles[name]
+
+        if cycle < 1:
+            assert last_cycle is not None, f'Cycle "{name}" is counted from the last cycle.'
+            cycle += last_cycle
+
+        return cycle
+
+
+    def shift(self, offs, block):
+        """
+        Returns the schedule with the steps from the start of a block onward
+        moved by `offs`, as when the block is embedded in another protocol
+        after a different number of steps
+
+        Parameters
+        ---------
+        offs (int): step index offset
+        block (str): first block to move
+        """
+
+        if offs == 0:
+            return self
+
+        first_step = self.blocks[block][0]
+
+        def move(step):
+            return step + offs if step >= first_step else step
+
+        return StepSchedule(f'{self.name}{offs:+d}',
+                            {category: [move(step) for step in steps]
+                             for category, steps in self.steps.items()},
+                            {name: (move(start), move(stop))
+                             for name, (start, stop) in self.blocks.items()},
+                            self.cycles)
+
+
+    def _get_positions(self, step_index):
+        """
+        Returns the lookup table position of each step index
+        """
+
+        step_index = np.asarray(step_index)
+        size = len(self._lookup)
+
+        return np.where((step_index >= 0) & (step_index < size), step_index, size - 1)
+
+
+# Aging test of the 2021 formation study: the cycles between RPTs and the
+# steps of the RPT
+AGING_SCHEDULE = StepSchedule('aging', steps={
+    'c3_charge':              7,
+    'c3_discharge':           10,
+    'c20_charge':             13,
+    'rest_top_4p2v':          15, # voltage decay after the C/20 charge to 4.2V
+    'c20_discharge':          16,
+    'hppc_pulse_charge':      22,
+    'hppc_pulse_discharge':   24,
+    'cycling_charge_cc':      30,
+    'cycling_charge_cv':      31,
+    'cycling_charge_rest':    32,
+    'cycling_discharge_cc':   33,
+    'cycling_discharge_rest': 34,
+})
+
+# Formation protocols of the 2021 formation study. The fast protocol has no
+# rest after the first discharge and ends one cycle after its final C/10
+# cycle.
+FORMATION_BASELINE_SCHEDULE = StepSchedule('formation_baseline', steps={
+    'first_cv_hold':        4,
+    'first_discharge':      6,
+    'first_discharge_rest': 7,
+    'c20_charge':           10,
+    'six_hour_rest':        12,
+    'c20_discharge':        13,
+}, cycles={'first_cycle': 1, 'first_cv_hold': 1, 'six_hour_rest': 3, 'final': 0})
+
+FORMATION_FAST_SCHEDULE = StepSchedule('formation_fast', steps={
+    'first_cv_hold':        5,
+    'first_discharge':      9,
+    'first_discharge_rest': None,
+    'c20_charge':           11,
+    'six_hour_rest':        13,
+    'c20_discharge':        14,
+}, cycles={'first_cycle': 1, 'first_cv_hold': 1, 'six_hour_rest': 7, 'final': -1})
+
+# Cycling test with embedded RPTs of project 'UMBL2022FEB'. Protocols that
+# run the RPT after a different number of steps shift the 'rpt' block.
+UMBL2022FEB_SCHEDULE = StepSchedule('umbl2022feb', steps={
+    'cycling_charge_cc':      3,
+    'cycling_charge_cv':      4,
+    'cycling_charge_rest':    5,
+    'cycling_discharge_cc':   6,
+    'cycling_discharge_rest': 7,
+    'rpt_start':              12, # long rest before the first HPPC pulse
+    'rest_bottom_2p5hr':      13, # voltage rebound after CC discharge to 3.0V
+    'hppc_pulse_discharge':   15,
+    'hppc_pulse_discharge_rest': 16,
+    'hppc_pulse_charge':      17,
+    'hppc_pulse_charge_rest': 18,
+    'hppc_charge_up':         19,
+    'hppc_end':               21,
+    'c20_discharge':          23,
+    'c20_charge':             26,
+    'rest_top_12hr':          27, # voltage decay after CV hold at 4.2V
+    'rpt_end':                31,
+}, blocks={'cycling': (0, 12), 'rpt': (12, 32)})
+
+SCHEDULES = {schedule.name: schedule for schedule in [AGING_SCHEDULE,
+                                                      FORMATION_BASELINE_SCHEDULE,
+                                                      FORMATION_FAST_SCHEDULE,
+                                                      UMBL2022FEB_SCHEDULE]}
+
+
+@functools.lru_cache(maxsize=None)
+def get_schedule(name, offs=0, block=None):
+    """
+    Returns a registered schedule, optionally with its steps from `block`
+    onward shifted by `offs` (see `StepSchedule.shift`)
+    """
+
+    assert name in SCHEDULES, f'No schedule named "{name}".'
+
+    if offs == 0:
+        return SCHEDULES[name]
+
+    assert block is not None, 'A block is needed to shift the schedule.'
+
+    return SCHEDULES[name].shift(offs, block)
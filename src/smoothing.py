@@ -0,0 +1,216 @@
+"""
+Savitzky-Golay smoothing and differentiation of many curves at once.
+
+`scipy.signal.savgol_filter` recomputes its coefficients on every call and
+filters one curve at a time. Here the coefficients of each (window, order,
+derivative) are computed once and cached, and a batch of curves of any
+lengths is filtered with one convolution over the concatenated samples: a
+window centered on an interior point never crosses into a neighboring curve,
+and the points near the ends of each curve, where it would, are replaced by
+the values of a polynomial fitted to the first or last window of the curve,
+as in the 'interp' mode of `savgol_filter`.
+"""
+
+import functools
+from collections import namedtuple
+
+import numpy as np
+
+# Number of distinct kernels kept in memory
+SAVGOL_CACHE_SIZE = 32
+
+SavgolKernel = namedtuple('SavgolKernel', ['coeffs', 'edge_start', 'edge_stop'])
+
+
+@functools.lru_cache(maxsize=SAVGOL_CACHE_SIZE)
+def get_savgol_kernel(window_length, polyorder, deriv=0):
+    """
+    Returns the cached coefficients of a Savitzky-Golay filter.
+
+    Parameters
+    ---------
+    window_length (int): length of the filter window, odd
+    polyorder (int): order of the fitted polynomial
+    deriv (int): order of the derivative, 0 to smooth only
+
+    Returns
+    ---------
+    a SavgolKernel holding read-only arrays:
+      - coeffs: convolution coefficients for interior points
+      - edge_start: maps the first window of a curve to the outputs of its
+        first `window_length // 2` points
+      - edge_stop: maps the last window of a curve to the outputs of its
+        last `window_length // 2` points
+    """
+
+    from scipy.signal import savgol_coeffs
+
+    assert window_length % 2 == 1, 'window_length must be odd.'
+    assert polyorder < window_length, 'polyorder must be less than window_length.'
+
+    halflen = window_length // 2
+
+    coeffs = savgol_coeffs(window_length, polyorder, deriv=deriv, use='conv')
+
+    # Least squares polynomial fit over a window, in powers of the position
+    # from the window center
+    position = np.arange(window_length) - halflen
+    powers = np.arange(polyorder + 1)
+    fit = np.linalg.pinv(position[:, np.newaxis] ** powers)
+
+    # Derivative of each power at each position
+    factor = np.ones(polyorder + 1)
+    for k in range(deriv):
+        factor *= powers - k
+    exponent = np.maximum(powers - deriv, 0)
+
+    def get_edge(positions):
+        return (factor * positions[:, np.newaxis] ** exponent) @ fit
+
+    kernel = SavgolKernel(coeffs, get_edge(position[:halflen]),
+                          get_edge(position[window_length - halflen:]))
+
+    for array in kernel:
+        array.flags.writeable = False
+
+    return kernel
+
+
+def savgol_filter(x, window_length, polyorder, deriv=0, delta=1.0):
+    """
+    Apply a Savitzky-Golay filter to one curve, with the results of
+    `scipy.signal.savgol_filter` in its default 'interp' mode.
+
+    Parameters
+    ---------
+    x (array-like): the curve
+    window_length, polyorder, deriv: as in `get_savgol_kernel`
+    delta (float): sample spacing, used for derivatives
+
+    Returns
+    ---------
+    the filtered curve as an array
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+
+    return _filter(x, np.array([len(x)]), window_length, polyorder, deriv, delta)
+
+
+def savgol_filter_many(curves, window_length, polyorder, deriv=0, delta=1.0):
+    """
+    Apply a Savitzky-Golay filter to many curves in one batch, with the
+    results of `scipy.signal.savgol_filter` on each.
+
+    Parameters
+    ---------
+    curves (list of array-like): curves of any lengths, each at least
+                                 `window_length` long
+    window_length, polyorder, deriv: as in `get_savgol_kernel`
+    delta (float): sample spacing, used for derivatives
+
+    Returns
+    ---------
+    a list holding the filtered curves
+    """
+
+    values, lengths = _concatenate(curves)
+
+    return _split(_filter(values, lengths, window_length, polyorder, deriv, delta),
+                  lengths)
+
+
+def get_dvdq_curves(capacity_list, voltage_list, window_length=101, polyorder=2):
+    """
+    Smooth and differentiate many voltage-capacity curves in one batch.
+
+    Capacity and voltage are smoothed and differentiated with respect to the
+    sample number, and the derivatives are divided to give dV/dQ and dQ/dV.
+
+    Parameters
+    ---------
+    capacity_list (list of array-like): capacity of each curve
+    voltage_list (list of array-like): voltage of each curve
+    window_length, polyorder: as in `get_savgol_kernel`
+
+    Returns
+    ---------
+    a list holding one dict per curve with arrays 'q', 'v' (smoothed),
+    'dvdq' and 'dqdv'
+    """
+
+    assert len(capacity_list) == len(voltage_list), \
+        'Capacity and voltage must hold the same number of curves.'
+
+    values, lengths = _concatenate(list(capacity_list) + list(voltage_list))
+
+    smoothed = _filter(values, lengths, window_length, polyorder, 0, 1.0)
+    derivative = _filter(values, lengths, window_length, polyorder, 1, 1.0)
+
+    num_curves = len(capacity_list)
+    num_rows = lengths[:num_curves].sum()
+
+    assert np.array_equal(lengths[:num_curves], lengths[num_curves:]), \
+        'Capacity and voltage curves must have the same lengths.'
+
+    q, v = smoothed[:num_rows], smoothed[num_rows:]
+    dq, dv = derivative[:num_rows], derivative[num_rows:]
+
+    curves = {'q': q, 'v': v, 'dvdq': dv / dq, 'dqdv': dq / dv}
+    curves = {key: _split(value, lengths[:num_curves]) for key, value in curves.items()}
+
+    return [{key: value[i] for key, value in curves.items()} for i in range(num_curves)]
+
+
+def _concatenate(curves):
+    """
+    Returns the concatenated samples and the lengths of a list of curves
+    """
+
+    curves = [np.asarray(curve, dtype=np.float64) for curve in curves]
+    lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+
+    values = np.concatenate(curves) if curves else np.array([])
+
+    return values, lengths
+
+
+def _split(values, lengths):
+
+    return np.split(values, np.cumsum(lengths)[:-1]) if len(lengths) else []
+
+
+def _filter(values, lengths, window_length, polyorder, deriv, delta):
+    """
+    Filter concatenated curves with a cached kernel
+    """
+
+    from scipy.ndimage import convolve1d
+
+    assert np.all(lengths >= window_length), \
+        'window_length must be less than or equal to the length of each curve.'
+
+    kernel = get_savgol_kernel(window_length, polyorder, deriv)
+
+    halflen = window_length // 2
+    starts = np.cumsum(lengths) - lengths
+    stops = starts + lengths
+
+    scale = delta ** deriv
+    coeffs = kernel.coeffs if deriv == 0 else kernel.coeffs / scale
+
+    filtered = convolve1d(values, coeffs, mode='constant')
+
+    if halflen == 0 or len(lengths) == 0:
+        return filtered
+
+    # Replace the ends of each curve by the fitted polynomials
+    window = np.arange(window_length)
+    edge = np.arange(halflen)
+
+    filtered[(starts[:, np.newaxis] + edge).ravel()] = \
+        (values[starts[:, np.newaxis] + window] @ kernel.edge_start.T / scale).ravel()
+    filtered[(stops[:, np.newaxis] - halflen + edge).ravel()] = \
+        (values[stops[:, np.newaxis] - window_length + window] @ kernel.edge_stop.T / scale).ravel()
+
+    return filtered
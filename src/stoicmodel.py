@@ -8,7 +8,6 @@ The functions defined here are used by
 
 import numpy as np
 from scipy import interpolate
-from matplotlib import pyplot as plt
 
 # Plot aesthetics
 COLOR_BASE = np.array([0, 0, 0])
@@ -605,6 +604,8 @@ def compute_useful_metrics(res, min_voltage, max_voltage, soc_target=0.05):
 def plot_shift_animate(shift_mah, pos_shrink, neg_shrink, res_orig, metrics_orig,
                target_soc, min_voltage, max_voltage, xlims):
 
+    from matplotlib import pyplot as plt
+
     res = voltage_resistance_transform(res_orig, shift_mah / 1000,
                                        pos_shrink_loc='bottom',
                                        neg_shrink_loc='top',
@@ -678,6 +679,8 @@ def plot_shift_animate(shift_mah, pos_shrink, neg_shrink, res_orig, metrics_orig
 def plot_shift(shift_mah, pos_shrink, neg_shrink, res_orig, metrics_orig,
                target_soc, min_voltage, max_voltage, xlims):
 
+    from matplotlib import pyplot as plt
+
     res = voltage_resistance_transform(res_orig, shift_mah / 1000,
                                        pos_shrink_loc='bottom',
                                        neg_shrink_loc='top',
@@ -0,0 +1,763 @@
+"""
+On-disk storage helpers for the raw test data.
+
+Parsing the raw cycler exports with `pd.read_csv` dominates the time it takes
+to load a cell. The helpers here keep a columnar (Feather) copy of each parsed
+CSV file next to a small JSON sidecar describing the source file. The copy is
+reused for as long as the source file is unchanged.
+
+A schema (a dict mapping column names to NumPy dtypes) can be used to read
+only the columns a feature extractor needs, at the narrowest dtype that keeps
+enough precision.
+
+For tests too large to hold in memory, `load_column_store` keeps selected
+columns as flat binary files that are memory-mapped on load.
+
+`RecordCache` keeps Feather copies of tables fetched from a remote source,
+such as the test records of Voltaiq Analytic Studio, so that repeat analyses
+run offline.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Bump this whenever the layout of the cached files changes
+CACHE_FORMAT_VERSION = 1
+
+# Read the source files in 16 MB blocks when hashing
+HASH_BLOCK_SIZE = 1 << 24
+
+# Functions reading back the cached copies for each supported format
+CACHE_READERS = {'feather': pd.read_feather,
+                 'pickle': pd.read_pickle}
+
+# Number of CSV rows parsed at a time when building a column store
+COLUMN_STORE_CHUNK_ROWS = 1_000_000
+
+
+def read_csv_cached(file, cache_dir, variant='', verify_hash=False, **kwargs):
+    """
+    Read a CSV file through a columnar on-disk cache.
+
+    The first read parses the CSV and writes a Feather copy into `cache_dir`.
+    Later reads load the Feather copy instead. The copy is rebuilt when the
+    source file changes size or content. A change in modification time alone
+    triggers a content hash; if the hash still matches, the copy is kept.
+
+    Parameters
+    ---------
+    file (str): path to the source CSV file
+    cache_dir (str): directory holding the cached copies
+    variant (str): extra tag for the cache key, e.g. to separate different
+                   parse options applied to the same source file
+    verify_hash (bool): always compare content hashes, even if size and
+                        modification time match
+    **kwargs: passed through to `pd.read_csv` on a cache miss
+
+    Returns
+    ---------
+    a tuple of (DataFrame, bool) where the bool is True on a cache hit
+    """
+
+    return read_cached(file, cache_dir, lambda f: pd.read_csv(f, **kwargs),
+                       variant=variant, verify_hash=verify_hash)
+
+
+def read_csv_schema(file, schema, cache_dir=None):
+    """
+    Read only the columns listed in a schema, parsed directly into the
+    schema's dtypes.
+
+    Parameters
+    ---------
+    file (str): path to the source CSV file
+    schema (dict): maps column names to NumPy dtypes
+    cache_dir (str): if given, read through the columnar cache; the schema
+                     is part of the cache key
+
+    Returns
+    ---------
+    a tuple of (DataFrame, bool) where the bool is True on a cache hit
+    """
+
+    kwargs = {'usecols': list(schema), 'dtype': schema}
+
+    if cache_dir is None:
+        return pd.read_csv(file, **kwargs), False
+
+    return read_csv_cached(file, cache_dir, variant=get_schema_key(schema), **kwargs)
+
+
+def get_schema_key(schema):
+    """
+    Returns a string identifying the columns and dtypes of a schema
+    """
+
+    return ','.join(f'{name}:{np.dtype(dtype).str}' for name, dtype in schema.items())
+
+
+def get_memory_usage(df):
+    """
+    Returns the memory used by a DataFrame in bytes, including the contents
+    of object (e.g. string) columns
+    """
+
+    return int(df.memory_usage(deep=True).sum())
+
+
+def read_cached(file, cache_dir, read_function, variant='', verify_hash=False,
+                fmt='feather'):
+    """
+    Read a file into a DataFrame through an on-disk binary cache.
+
+    Same caching rules as `read_csv_cached`, for any reader function.
+
+    Parameters
+    ---------
+    file (str): path to the source file
+    cache_dir (str): directory holding the cached copies
+    read_function (function): parses the source file into a DataFrame
+    variant (str): extra tag for the cache key
+    verify_hash (bool): always compare content hashes
+    fmt (str): 'feather' (columnar, needs pyarrow) or 'pickle' (for tables
+               with mixed-type columns that Feather cannot hold)
+
+    Returns
+    ---------
+    a tuple of (DataFrame, bool) where the bool is True on a cache hit
+    """
+
+    assert fmt in CACHE_READERS, f'Unknown cache format "{fmt}"'
+
+    cache_file, meta_file = _get_cache_files(file, cache_dir, variant,
+                                             suffix=f'.{fmt}')
+
+    stat = os.stat(file)
+
+    if _is_cache_valid(file, stat, cache_file, meta_file, verify_hash):
+        return CACHE_READERS[fmt](cache_file), True
+
+    df = read_function(file)
+
+    try:
+        _write_cache(df, file, stat, cache_file, meta_file, fmt)
+    except ImportError:
+        print('pyarrow is not installed; skipping the on-disk cache.')
+
+    return df, False
+
+
+def load_column_store(file, cache_dir, dtypes, transform=None, variant=''):
+    """
+    Open a memory-mapped column store built from a CSV file.
+
+    The first call parses the CSV in chunks and appends each requested column
+    to its own flat binary file, so the full table is never held in memory.
+    Later calls map the existing files. The store is rebuilt when the source
+    file changes, following the same rules as `read_csv_cached`.
+
+    Parameters
+    ---------
+    file (str): path to the source CSV file
+    cache_dir (str): directory holding the cached copies
+    dtypes (dict): maps each column to keep to its NumPy dtype
+    transform (function): applied to each parsed chunk before writing,
+                          e.g. to shift the cycle numbers
+    variant (str): extra tag for the cache key; the column layout is always
+                   part of the key
+
+    Returns
+    ---------
+    a tuple of (ColumnStore, bool) where the bool is True on a cache hit
+    """
+
+    store_dir, meta_file = _get_cache_files(file, cache_dir,
+                                            f'{get_schema_key(dtypes)}|{variant}',
+                                            suffix='.columns')
+
+    stat = os.stat(file)
+
+    if _is_cache_valid(file, stat, store_dir, meta_file, False):
+        return ColumnStore.open(store_dir), True
+
+    _write_column_store(file, stat, store_dir, meta_file, dtypes, transform)
+
+    return ColumnStore.open(store_dir), False
+
+
+class ColumnStore:
+    """
+    A table held as one typed array per column.
+
+    Arrays are usually memory-mapped from disk, so only the pages that are
+    touched get read. Selecting a column or slicing a range of rows returns
+    views without copying data; `to_frame` materializes a DataFrame.
+    """
+
+    def __init__(self, columns, offset=0):
+        """
+        Parameters
+        ---------
+        columns (dict): maps column names to equal-length 1-D arrays
+        offset (int): row position of the first row, used as the starting
+                      index label in `to_frame`
+        """
+
+        lengths = {len(arr) for arr in columns.values()}
+        assert len(lengths) <= 1, 'All columns must have the same length.'
+
+        self._columns = columns
+        self._num_rows = lengths.pop() if lengths else 0
+        self.offset = offset
+
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Memory-map a column store written by `load_column_store`
+        """
+
+        with open(os.path.join(directory, 'columns.json')) as f:
+            layout = json.load(f)
+
+        columns = dict()
+
+        for name, info in layout['columns'].items():
+
+            path = os.path.join(directory, info['file'])
+
+            if layout['num_rows'] == 0:
+                columns[name] = np.empty(0, dtype=info['dtype'])
+            else:
+                columns[name] = np.memmap(path, dtype=info['dtype'], mode='r',
+                                          shape=(layout['num_rows'],))
+
+        return cls(columns)
+
+
+    def __repr__(self):
+
+        return f'ColumnStore({self._num_rows} rows, columns={self.columns})'
+
+
+    def __len__(self):
+
+        return self._num_rows
+
+
+    def __getitem__(self, column):
+
+        return self._columns[column]
+
+
+    def __contains__(self, column):
+
+        return column in self._columns
+
+
+    @property
+    def columns(self):
+
+        return list(self._columns)
+
+
+    @property
+    def empty(self):
+
+        return self._num_rows == 0
+
+
+    def slice(self, rows):
+        """
+        Returns a ColumnStore holding views over a range of rows
+
+        Parameters
+        ---------
+        rows (slice): row positions, relative to this store
+        """
+
+        start, _, step = rows.indices(self._num_rows)
+        assert step == 1, 'Only contiguous row ranges are supported.'
+
+        return ColumnStore({name: arr[rows] for name, arr in self._columns.items()},
+                           offset=self.offset + start)
+
+
+    def to_frame(self, columns=None):
+        """
+        Copy the store (or a subset of columns) into a DataFrame.
+
+        The index holds the row positions within the original store, which
+        matches the default index of the source CSV file.
+        """
+
+        columns = self.columns if columns is None else columns
+
+        index = pd.RangeIndex(self.offset, self.offset + self._num_rows)
+
+        return pd.DataFrame({name: np.array(self._columns[name]) for name in columns},
+                            index=index)
+
+
+    def take_slices(self, slices):
+        """
+        Select rows by a list of row slices and return them as a DataFrame
+        """
+
+        if len(slices) == 0:
+            return self.slice(slice(0, 0)).to_frame()
+
+        frames = [self.slice(s).to_frame() for s in slices]
+
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+class RecordCache:
+    """
+    Read-through cache of tables fetched from a remote source.
+
+    Each table is stored as a Feather file keyed by the record name and the
+    set of columns read, next to a JSON sidecar holding the record version it
+    was fetched at (e.g. a last-modified time or datapoint count). A cached
+    table is reused for as long as the caller reports the same version; a
+    record without a version is always fetched. `get` returns the cached
+    table of any version, e.g. to work offline. Once the cached files exceed
+    `max_bytes`, the least recently used tables are removed.
+
+    The hit and miss counts are kept under a lock, so that one cache can be
+    shared by concurrent readers.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        Parameters
+        ---------
+        cache_dir (str): directory holding the cached tables
+        max_bytes (int): size limit of the cached tables; None for no limit
+        """
+
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+
+    def __repr__(self):
+
+        return f'RecordCache("{self.cache_dir}", hits={self.hits}, misses={self.misses})'
+
+
+    def read(self, name, keys, read_function, version=None):
+        """
+        Returns the cached table of a record, fetching it on a miss
+
+        Parameters
+        ---------
+        name (str): name of the record
+        keys (list): names of the columns read from the record
+        read_function (function): fetches the table, called without arguments
+        version (str): current version of the record; None if the source does
+                       not report one, in which case the record is fetched
+                       and its copy is only served by `get`
+
+        Returns
+        ---------
+        a tuple of (DataFrame, bool) where the bool is True on a cache hit
+        """
+
+        data_file, meta_file = self._get_files(name, keys)
+
+        meta = _read_json(meta_file)
+
+        if version is not None and meta is not None and os.path.exists(data_file) \
+                and meta.get('version') == CACHE_FORMAT_VERSION \
+                and meta['record_version'] == version:
+            return self._load(data_file, meta_file, meta), True
+
+        with self._lock:
+            self.misses += 1
+
+        df = read_function()
+
+        try:
+            self._write(df, name, keys, version, data_file, meta_file)
+        except ImportError:
+            print('pyarrow is not installed; skipping the on-disk cache.')
+
+        return df, False
+
+
+    def get(self, name, keys):
+        """
+        Returns the cached table of a record whatever version it was fetched
+        at, e.g. to work offline, or None if there is none
+
+        Parameters
+        ---------
+        name (str): name of the record
+        keys (list): names of the columns read from the record
+        """
+
+        data_file, meta_file = self._get_files(name, keys)
+
+        meta = _read_json(meta_file)
+
+        if meta is None or not os.path.exists(data_file) \
+                or meta.get('version') != CACHE_FORMAT_VERSION:
+            return None
+
+        return self._load(data_file, meta_file, meta)
+
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counts and the number and total size of the
+        cached tables
+        """
+
+        entries = self._get_entries()
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(entries),
+                'bytes': sum(meta['bytes'] for _, meta in entries)}
+
+
+    def clear(self, name=None, keys=None):
+        """
+        Remove one cached table, or all of them if no name is given
+        """
+
+        if name is not None:
+            files = self._get_files(name, keys)
+        else:
+            files = [path for meta_file, meta in self._get_entries()
+                          for path in (meta['file'], meta_file)]
+
+        for path in files:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def _load(self, data_file, meta_file, meta):
+        """
+        Returns a cached table, counted as a hit and marked as just used
+        """
+
+        df = pd.read_feather(data_file)
+
+        if meta['index']:
+            df = df.set_index(meta['index'])
+            df.index.names = meta['index_names']
+
+        meta['last_used'] = time.time()
+        _write_json(meta, meta_file)
+
+        with self._lock:
+            self.hits += 1
+
+        return df
+
+
+    def _get_files(self, name, keys):
+        """
+        Returns the (data, sidecar) paths of a cached table
+        """
+
+        keys = ','.join(sorted(keys or []))
+        key = hashlib.sha1(f'{name}|{keys}'.encode()).hexdigest()[:12]
+        safe_name = re.sub(r'[^\w.-]', '_', name)
+
+        return (os.path.join(self.cache_dir, f'{safe_name}-{key}.feather'),
+                os.path.join(self.cache_dir, f'{safe_name}-{key}.json'))
+
+
+    def _get_entries(self):
+        """
+        Returns (sidecar path, sidecar) of every cached table
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+
+        for file in sorted(os.listdir(self.cache_dir)):
+            if file.endswith('.json'):
+                meta_file = os.path.join(self.cache_dir, file)
+                meta = _read_json(meta_file)
+                if meta is not None and 'last_used' in meta:
+                    entries.append((meta_file, meta))
+
+        return entries
+
+
+    def _write(self, df, name, keys, version, data_file, meta_file):
+        """
+        Write a table and its sidecar, then evict tables over the size limit
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Feather only holds a default index; any other index is stored as
+        # columns and restored on read
+        if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 \
+                and df.index.step == 1 and df.index.name is None:
+            index, index_names = [], []
+            table = df.reset_index(drop=True)
+        else:
+            index_names = list(df.index.names)
+            table = df.reset_index()
+            index = list(table.columns[:len(index_names)])
+
+        tmp_file = f'{data_file}.tmp'
+        table.to_feather(tmp_file)
+        os.replace(tmp_file, data_file)
+
+        meta = dict()
+        meta['version'] = CACHE_FORMAT_VERSION
+        meta['name'] = name
+        meta['keys'] = sorted(keys or [])
+        meta['record_version'] = version
+        meta['file'] = data_file
+        meta['bytes'] = os.path.getsize(data_file)
+        meta['index'] = index
+        meta['index_names'] = index_names
+        meta['last_used'] = time.time()
+
+        _write_json(meta, meta_file)
+
+        self._evict(keep=meta_file)
+
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used tables until the cache fits in
+        `max_bytes`, never removing the sidecar `keep` and its table
+        """
+
+        if self.max_bytes is None:
+            return
+
+        entries = sorted(self._get_entries(), key=lambda entry: entry[1]['last_used'])
+        total = sum(meta['bytes'] for _, meta in entries)
+
+        for meta_file, meta in entries:
+
+            if total <= self.max_bytes:
+                break
+
+            if meta_file == keep:
+                continue
+
+            for path in (meta['file'], meta_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            total -= meta['bytes']
+
+
+def clear_cache(file, cache_dir, variant=''):
+    """
+    Remove the cached copy of a source file, if it exists
+    """
+
+    for path in _get_cache_files(file, cache_dir, variant):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def hash_file(file):
+    """
+    Returns the SHA-1 hex digest of a file's contents
+    """
+
+    sha = hashlib.sha1()
+
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+class Timer:
+    """
+    Context manager measuring wall time in seconds, e.g.
+
+    with Timer() as timer:
+        do_work()
+
+    print(timer.seconds)
+    """
+
+    def __enter__(self):
+
+        self._start = time.perf_counter()
+        self.seconds = 0.0
+
+        return self
+
+
+    def __exit__(self, *args):
+
+        self.seconds = time.perf_counter() - self._start
+
+
+def _get_cache_files(file, cache_dir, variant, suffix='.feather'):
+    """
+    Returns the (data, sidecar) paths of the cached copy of a source file
+    """
+
+    source = str(Path(file).resolve())
+    key = hashlib.sha1(f'{source}|{variant}'.encode()).hexdigest()[:12]
+    stem = f'{Path(file).stem}-{key}'
+
+    return (os.path.join(cache_dir, f'{stem}{suffix}'),
+            os.path.join(cache_dir, f'{stem}.json'))
+
+
+def _is_cache_valid(file, stat, cache_file, meta_file, verify_hash):
+    """
+    Check the sidecar of a cached copy against the current source file
+    """
+
+    if not (os.path.exists(cache_file) and os.path.exists(meta_file)):
+        return False
+
+    with open(meta_file) as f:
+        meta = json.load(f)
+
+    if meta.get('version') != CACHE_FORMAT_VERSION:
+        return False
+
+    if meta['size'] != stat.st_size:
+        return False
+
+    if meta['mtime_ns'] == stat.st_mtime_ns and not verify_hash:
+        return True
+
+    if meta['sha1'] != hash_file(file):
+        return False
+
+    # Same content under a new timestamp (e.g. the file was copied); record
+    # the new timestamp so the next read skips the hash
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _write_json(meta, meta_file)
+
+    return True
+
+
+def _write_cache(df, file, stat, cache_file, meta_file, fmt):
+    """
+    Write the cached copy and its sidecar
+    """
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+    # Write under a temporary name so that an interrupted or concurrent write
+    # never leaves a truncated copy next to a valid sidecar
+    tmp_file = f'{cache_file}.tmp'
+
+    if fmt == 'feather':
+        df.reset_index(drop=True).to_feather(tmp_file)
+    else:
+        df.to_pickle(tmp_file, compression=None)
+
+    os.replace(tmp_file, cache_file)
+
+    _write_meta(file, stat, meta_file)
+
+
+def _write_column_store(file, stat, store_dir, meta_file, dtypes, transform):
+    """
+    Parse a CSV file in chunks and write the selected columns as flat
+    binary files, plus the sidecar
+    """
+
+    tmp_dir = f'{store_dir}.tmp'
+
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    layout = {'num_rows': 0, 'columns': dict()}
+    handles = dict()
+
+    for idx, (name, dtype) in enumerate(dtypes.items()):
+        layout['columns'][name] = {'file': f'column_{idx}.bin',
+                                   'dtype': np.dtype(dtype).str}
+        handles[name] = open(os.path.join(tmp_dir, f'column_{idx}.bin'), 'wb')
+
+    try:
+        for chunk in pd.read_csv(file, usecols=list(dtypes),
+                                 chunksize=COLUMN_STORE_CHUNK_ROWS):
+
+            if transform is not None:
+                chunk = transform(chunk)
+
+            for name, dtype in dtypes.items():
+                chunk[name].to_numpy(dtype=dtype).tofile(handles[name])
+
+            layout['num_rows'] += len(chunk)
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    _write_json(layout, os.path.join(tmp_dir, 'columns.json'))
+
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+
+    _write_meta(file, stat, meta_file)
+
+
+def _write_meta(file, stat, meta_file):
+    """
+    Write the sidecar describing the source file of a cached copy
+    """
+
+    meta = dict()
+    meta['version'] = CACHE_FORMAT_VERSION
+    meta['source'] = str(Path(file).resolve())
+    meta['size'] = stat.st_size
+    meta['mtime_ns'] = stat.st_mtime_ns
+    meta['sha1'] = hash_file(file)
+
+    _write_json(meta, meta_file)
+
+
+def _read_json(file):
+    """
+    Returns the contents of a JSON file, or None if it does not exist
+    """
+
+    try:
+        with open(file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(data, file):
+    """
+    Write a JSON file atomically
+    """
+
+    tmp_file = f'{file}.tmp'
+
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f)
+
+    os.replace(tmp_file, file)
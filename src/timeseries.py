@@ -0,0 +1,208 @@
+"""
+Utilities for indexing into raw cycler timeseries data.
+
+Cycler data is logged in time order, so each (cycle number, step index) pair
+occupies one or more contiguous runs of rows. Finding these runs once lets us
+pull out a cycle or a step as a slice instead of masking the whole table on
+every lookup.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Rows read per chunk when streaming a CSV file
+STREAM_CHUNK_ROWS = 100_000
+
+
+class StepRowIndex:
+    """
+    Maps cycle numbers and (cycle number, step index) pairs to the contiguous
+    row ranges holding them.
+
+    Ranges are stored as Python slices over row positions (not labels), so
+    they can be used directly with `DataFrame.iloc` or to slice arrays.
+    """
+
+    def __init__(self, cycle_number, step_index):
+        """
+        Parameters
+        ---------
+        cycle_number (array-like): cycle number of each row
+        step_index (array-like): step index of each row
+        """
+
+        cycle_number = np.asarray(cycle_number)
+        step_index = np.asarray(step_index)
+
+        assert len(cycle_number) == len(step_index), \
+            'Cycle number and step index must have the same length.'
+
+        self.num_rows = len(cycle_number)
+
+        # Run-length encode the (cycle, step) sequence
+        is_boundary = (cycle_number[1:] != cycle_number[:-1]) | \
+                      (step_index[1:] != step_index[:-1])
+        boundaries = np.flatnonzero(is_boundary) + 1
+
+        self.run_start = np.concatenate(([0], boundaries)).astype(np.int64)
+        self.run_stop = np.concatenate((boundaries, [self.num_rows])).astype(np.int64)
+
+        if self.num_rows == 0:
+            self.run_start = self.run_start[:0]
+            self.run_stop = self.run_stop[:0]
+
+        self.run_cycle = cycle_number[self.run_start]
+        self.run_step = step_index[self.run_start]
+
+        self._step_slices = dict()
+        self._cycle_slices = dict()
+
+        for start, stop, cycle, step in zip(self.run_start, self.run_stop,
+                                            self.run_cycle, self.run_step):
+
+            self._step_slices.setdefault((cycle, step), []).append(slice(start, stop))
+
+            # Merge runs that belong to the same cycle and touch each other
+            cycle_slices = self._cycle_slices.setdefault(cycle, [])
+            if cycle_slices and cycle_slices[-1].stop == start:
+                cycle_slices[-1] = slice(cycle_slices[-1].start, stop)
+            else:
+                cycle_slices.append(slice(start, stop))
+
+
+    def __repr__(self):
+
+        return f'StepRowIndex({self.num_rows} rows, {len(self.run_start)} runs, ' \
+               f'{len(self._cycle_slices)} cycles)'
+
+
+    def get_cycles(self):
+        """
+        Returns a sorted array of all cycle numbers
+        """
+
+        return np.unique(self.run_cycle)
+
+
+    def get_cycles_with_step(self, step_index):
+        """
+        Returns a sorted array of the cycle numbers containing a step index
+        """
+
+        return np.unique(self.run_cycle[self.run_step == step_index])
+
+
+    def get_cycle_slices(self, cycle_number):
+        """
+        Returns a list of row slices covering a cycle
+        """
+
+        return self._cycle_slices.get(cycle_number, [])
+
+
+    def get_step_slices(self, cycle_number, step_index):
+        """
+        Returns a list of row slices covering a step within a cycle; steps
+        that repeat within a cycle (e.g. HPPC pulses) give one slice per
+        repetition
+        """
+
+        return self._step_slices.get((cycle_number, step_index), [])
+
+
+def take_slices(df, slices):
+    """
+    Select rows of a DataFrame by a list of row slices.
+
+    A single slice is returned as an `iloc` view, without copying. Multiple
+    slices are concatenated in order.
+
+    Parameters
+    ---------
+    df (DataFrame): the DataFrame the slices were built on
+    slices (list of slice): row ranges, e.g. from StepRowIndex
+
+    Returns
+    ---------
+    a DataFrame holding the selected rows with the original index labels
+    """
+
+    if len(slices) == 0:
+        return df.iloc[0:0]
+
+    if len(slices) == 1:
+        return df.iloc[slices[0]]
+
+    return pd.concat([df.iloc[s] for s in slices])
+
+
+def iter_csv_cycles(file, chunksize=STREAM_CHUNK_ROWS, transform=None, **kwargs):
+    """
+    Read a timeseries CSV in chunks and yield it one cycle at a time.
+
+    Only the current chunk and the rows of the cycle being assembled are held
+    in memory, so peak memory is bounded by the largest cycle rather than the
+    whole file. Rows keep their position in the file as index labels.
+
+    Parameters
+    ---------
+    file (str): path to the CSV file
+    chunksize (int): number of rows read per chunk
+    transform (callable): applied to each chunk after reading, e.g. to shift
+                          cycle numbers
+    **kwargs: passed on to `pd.read_csv`, e.g. `usecols` and `dtype`
+
+    Yields
+    ---------
+    (cycle number, DataFrame holding the rows of that cycle)
+    """
+
+    pending = []
+    last_cycle = None
+
+    def join(pieces):
+
+        nonlocal last_cycle
+
+        cycle = pieces[0]['Cycle Number'].iat[0]
+
+        assert last_cycle is None or cycle > last_cycle, \
+            f'Cycle {cycle} follows cycle {last_cycle}; cycle numbers ' \
+            f'must increase through the file to be streamed.'
+
+        last_cycle = cycle
+
+        df = pieces[0] if len(pieces) == 1 else pd.concat(pieces)
+
+        return cycle, df
+
+    for chunk in pd.read_csv(file, chunksize=chunksize, **kwargs):
+
+        if transform is not None:
+            chunk = transform(chunk)
+
+        cycle_number = chunk['Cycle Number'].to_numpy()
+
+        if len(cycle_number) == 0:
+            continue
+
+        # The previous chunk ended exactly on a cycle boundary
+        if pending and pending[-1]['Cycle Number'].iat[-1] != cycle_number[0]:
+            yield join(pending)
+            pending = []
+
+        boundaries = np.flatnonzero(cycle_number[1:] != cycle_number[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(chunk)]))
+
+        for start, stop in zip(starts, stops):
+
+            pending.append(chunk.iloc[start:stop])
+
+            # Every run but the last is known to be complete
+            if stop < len(chunk):
+                yield join(pending)
+                pending = []
+
+    if pending:
+        yield join(pending)
@@ -1,27 +1,55 @@
 import numpy as np
 import pandas as pd
-import yaml
 
+from src.config import get_path
+from src.export import write_diagnostic_results
 from src.formation import FormationCell
 
-paths = yaml.load(open('paths.yaml', 'r'), Loader=yaml.FullLoader)
+# Paths resolved on first use (see src.config), by their names in this module
+_PATH_NAMES = {'PATH_OUTPUT': 'PATH_OUTPUT',
+               'PATH_ESOH': 'PATH_ESOH_SUMMARY',
+               'PATH_CORR': 'PATH_CORR'}
+
+
+def __getattr__(name):
+
+    if name in _PATH_NAMES:
+        return get_path(_PATH_NAMES[name])
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
-PATH_OUTPUT = paths['outputs']
-PATH_ESOH = paths['outputs'] + 'summary_esoh_table.csv'
-PATH_CORR = paths['outputs'] + 'correlation_data.csv'
 IDX_ESOH_FRESH_CYCLE = 3
 IDX_ESOH_AGED_CYCLE = 56
 
-def export_hppc_data(cellid):
+def export_hppc_data(cellid, direction='discharge', file=None):
     """
     Exports HPPC data for a given cellid
+
+    Parameters
+    ---------
+    cellid: cell number
+    direction (default='discharge'): either 'charge' or 'discharge' pulses
+    file (default=None): if given, write all cycles into this HDF5 container
+      instead of three csv files per cycle (see src.export)
     """
 
     assert cellid > 0 and cellid <= 40
+    assert direction in ('charge', 'discharge'), \
+        'Direction must be either "charge" or "discharge"'
 
     formation_cell = FormationCell(cellid)
 
-    res_list = formation_cell.process_diagnostic_hppc_data()
+    if direction == 'discharge':
+        res_list = formation_cell.process_diagnostic_hppc_discharge_data()
+    else:
+        res_list = formation_cell.process_diagnostic_hppc_charge_data()
+
+    if file is not None:
+        write_diagnostic_results(file, cellid, f'hppc_{direction}', res_list)
+        return
+
+    prefix = 'hppc_data' if direction == 'discharge' else 'hppc_charge_data'
 
     for res in res_list:
 
@@ -29,13 +57,13 @@ def export_hppc_data(cellid):
         print(f'Exporting HPPC data for cell {cellid}, cycle {cycle_index}...')
 
         data = res['data']
-        data.to_csv(f'hppc_data_cell_{cellid}_processed_cycle_{cycle_index}.csv')
+        data.to_csv(f'{prefix}_cell_{cellid}_processed_cycle_{cycle_index}.csv')
 
         raw_pulses = res['raw_pulses']
-        raw_pulses.to_csv(f'hppc_data_cell_{cellid}_raw_pulses_cycle_{cycle_index}.csv')
+        raw_pulses.to_csv(f'{prefix}_cell_{cellid}_raw_pulses_cycle_{cycle_index}.csv')
 
         raw_all = res['raw_all']
-        raw_all.to_csv(f'hppc_data_cell_{cellid}_raw_all_cycle_{cycle_index}.csv')
+        raw_all.to_csv(f'{prefix}_cell_{cellid}_raw_all_cycle_{cycle_index}.csv')
 
 
 def append_esoh_metrics_to_correlations_table():
@@ -44,8 +72,8 @@ def append_esoh_metrics_to_correlations_table():
     correlations table
     """
 
-    df_esoh = pd.read_csv(PATH_ESOH)
-    df_corr = pd.read_csv(PATH_CORR)
+    df_esoh = pd.read_csv(get_path('PATH_ESOH_SUMMARY'))
+    df_corr = pd.read_csv(get_path('PATH_CORR'))
 
     df_esoh_fresh = df_esoh[df_esoh['cycle_number'] == IDX_ESOH_FRESH_CYCLE]
     df_esoh_fresh = df_esoh_fresh.add_suffix(f'_c{IDX_ESOH_FRESH_CYCLE}')
@@ -57,7 +85,7 @@ def append_esoh_metrics_to_correlations_table():
     df_merged_2 = pd.merge(df_merged_1, df_esoh_aged,
                     how='left', left_on='cellid', right_on=f'cellid_c{IDX_ESOH_AGED_CYCLE}')
 
-    df_merged_2.to_csv(f'{PATH_OUTPUT}/correlation_data_with_esoh.csv')
+    df_merged_2.to_csv(f"{get_path('PATH_OUTPUT')}/correlation_data_with_esoh.csv")
 
     print('Export complete.')
 
@@ -152,19 +180,22 @@ def get_label_registry():
     return label_registry
 
 
-def export_correlation_table(output_path=PATH_CORR):
+def export_correlation_table(output_path=None):
     """
     Export the table of correlation features
 
     Parameters
     ---------
-    output_path: path for saving file
+    output_path: path for saving file; defaults to PATH_CORR
 
     Returns
     ---------
     None
     """
 
+    if output_path is None:
+        output_path = get_path('PATH_CORR')
+
     df = build_correlation_table()
     df.to_csv(f'{output_path}')
 
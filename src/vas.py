@@ -9,9 +9,244 @@ Andrew Weng
 
 
 import voltaiq_studio as vs
+import bisect
 import pandas as pd
+import re
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
+from src.storage import RecordCache
+
+# Characters separating the parts of test record and device names, after
+# which a keyword may match (see NameIndex)
+SEPARATOR = re.compile(r'[^0-9A-Za-z]')
+
+# Traces read from the cycler test records
+CYCLER_TRACE_KEYS = ('h_test_time',
+                     'h_datapoint_time',
+                     'h_current',
+                     'h_potential',
+                     'h_step_index',
+                     'h_step_time',
+                     'h_charge_capacity',
+                     'h_charge_energy',
+                     'h_discharge_capacity',
+                     'h_discharge_energy')
+
+CYCLER_INFO_KEYS = ('i_cycle_num',)
+
+# Traces read from the AuxData test records
+AUX_TRACE_KEYS = ('h_test_time',
+                  'aux_vdf_ldcref_none_0',
+                  'aux_vdf_ambientrh_percent_0',
+                  'aux_vdf_ldcsensor_none_0',
+                  'aux_vdf_temperature_celsius_0',
+                  'aux_vdf_ambienttemperature_celsius_0',
+                  'aux_vdf_timestamp_datetime_0',
+                  'aux_vdf_current_amp_0')
+
+# Attributes of a test record object that change when new data is logged.
+# Those the record exposes make up the record version that validates a cached
+# copy, taken from the record list without fetching any data. A record
+# exposing none of them is fetched on every read, unless the helper is
+# offline.
+RECORD_VERSION_ATTRS = ('last_modified', 'datapoint_count')
+
+# Trace holding the logging time of each datapoint, in ms since the epoch.
+# Reads of the new data of a running test filter on it in VAS, so that only
+# datapoints logged after the last one seen are fetched.
+DATAPOINT_TIME_KEY = 'h_datapoint_time'
+
+# Limits on fetching several AuxData records from VAS at once: concurrent
+# requests, sustained requests per second, and retries of a failed request
+# after a backoff that doubles each time
+AUX_FETCH_WORKERS = 4
+AUX_FETCH_RATE = 1.0
+AUX_FETCH_RETRIES = 3
+AUX_FETCH_BACKOFF_S = 5.0
+
+# Errors taken to be transient: a dropped connection or a timeout, raised
+# by Python or by the Arrow Flight client the VAS reader fetches through. A
+# request failing with any other error, including other OSErrors such as
+# PermissionError, is not retried.
+try:
+    from pyarrow.flight import FlightTimedOutError, FlightUnavailableError
+    FLIGHT_RETRY_ERRORS = (FlightUnavailableError, FlightTimedOutError)
+except ImportError:
+    FLIGHT_RETRY_ERRORS = ()
+
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError) + FLIGHT_RETRY_ERRORS
+
+AUX_FETCH_RETRY_ERRORS = TRANSIENT_ERRORS
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter with retries, shared by the threads fetching
+    from VAS.
+
+    The bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second; every request, including each retry, takes one token. A request
+    failing with one of `retry_errors` is retried after `backoff_s`, doubled
+    on every further attempt; any other error is raised at once.
+    """
+
+    def __init__(self, rate=AUX_FETCH_RATE, burst=AUX_FETCH_WORKERS,
+                 retries=AUX_FETCH_RETRIES, backoff_s=AUX_FETCH_BACKOFF_S,
+                 retry_errors=AUX_FETCH_RETRY_ERRORS,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        Parameters
+        ---------
+        rate (float): sustained requests per second
+        burst (int): requests that can be made at once after an idle period
+        retries (int): attempts after the first before giving up
+        backoff_s (float): wait before the first retry
+        retry_errors (tuple): exception types after which a request is retried
+        clock (function): returns the current time in seconds
+        sleep (function): waits for a number of seconds
+        """
+
+        assert rate > 0, 'The rate must be positive.'
+        assert burst >= 1, 'The burst must allow at least one request.'
+
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.retry_errors = retry_errors
+
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+
+
+    def acquire(self):
+        """
+        Take a token, waiting for the bucket to refill if it is empty
+        """
+
+        while True:
+
+            with self._lock:
+
+                now = self._clock()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_s = (1 - self._tokens) / self.rate
+
+            self._sleep(wait_s)
+
+
+    def call(self, function):
+        """
+        Returns the result of `function()`, called once a token is available
+        and retried with backoff if it raises one of `retry_errors`
+        """
+
+        for attempt in range(self.retries + 1):
+
+            self.acquire()
+
+            try:
+                return function()
+            except self.retry_errors as e:
+                if attempt == self.retries:
+                    raise
+
+                wait_s = self.backoff_s * 2**attempt
+                print(f'Request failed ({e}); retrying in {wait_s:.0f} s...')
+                self._sleep(wait_s)
+
+
+class NameIndex:
+    """
+    Lookup of named VAS objects (test records, devices) by exact name or by
+    keyword, built once from the object list.
+
+    A keyword matches a name that contains it at the start of the name or
+    right after a separator, any character other than a letter or digit,
+    e.g. 'CELL151805' matches both 'UMBL2022FEB_CELL151805_CYC_1C1CR1' and
+    'UMBL2022FEB-CELL151805-01-005'.
+    Every such suffix of every name is kept in one sorted list, so the names
+    matching a keyword are found by binary search. A keyword that matches no
+    name this way, e.g. 'L1518', falls back to a scan for the names that
+    contain it anywhere.
+    """
+
+    def __init__(self, items):
+        """
+        Parameters
+        ---------
+        items (list): objects with a `name` attribute
+        """
+
+        self.items = list(items)
+
+        # Last object of each name, as found by a linear scan
+        self._by_name = {item.name: item for item in self.items}
+
+        suffixes = []
+
+        for position, item in enumerate(self.items):
+            suffixes.append((item.name, position))
+            for separator in SEPARATOR.finditer(item.name):
+                if separator.end() < len(item.name):
+                    suffixes.append((item.name[separator.end():], position))
+
+        suffixes.sort()
+
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._positions = [position for _, position in suffixes]
+
+
+    def __len__(self):
+
+        return len(self.items)
+
+
+    def get(self, name):
+        """
+        Returns the object with this exact name, or None
+        """
+
+        return self._by_name.get(name)
+
+
+    def find(self, keyword):
+        """
+        Returns the objects whose names match a keyword, in list order
+
+        Names containing the keyword at the start of the name or after a
+        separator match; if there are none, names containing the keyword
+        anywhere match.
+        """
+
+        if not keyword:
+            return list(self.items)
+
+        # Suffixes starting with the keyword sort between the keyword and the
+        # keyword with its last character incremented
+        start = bisect.bisect_left(self._suffixes, keyword)
+        stop = bisect.bisect_left(self._suffixes, keyword[:-1] + chr(ord(keyword[-1]) + 1))
+
+        positions = sorted(set(self._positions[start:stop]))
+
+        if not positions:
+            return [item for item in self.items if keyword in item.name]
+
+        return [self.items[position] for position in positions]
+
 
 class VasHelper:
     """ 
@@ -22,37 +257,97 @@ class VasHelper:
     """
     
     
-    def __init__(self):
+    def __init__(self, cache_dir=None, cache_max_bytes=None, offline=False):
+        """
+        Parameters
+        ---------
+        cache_dir (str): if given, keep a local copy of every test record
+                         read, reused until the record changes on VAS (see
+                         RECORD_VERSION_ATTRS). If VAS cannot be reached,
+                         the local copy is used with a warning.
+        cache_max_bytes (int): size limit of the local copies; the least
+                               recently used ones are removed beyond it
+        offline (bool): use the local copies without checking them against
+                        VAS, e.g. to repeat an analysis without network
+                        access; records without a copy are still fetched
+        """
         
         print('Initializing Voltaiq Analytic Studio Helper...')
+
+        assert cache_dir is not None or not offline, 'Working offline needs a cache_dir.'
+
+        self.cache = None if cache_dir is None else RecordCache(cache_dir, cache_max_bytes)
+        self.offline = offline
+        
+        self.refresh()
         
+        print('Done.')
+
+
+    @property
+    def trs(self):
+        """
+        List of test records; setting it rebuilds the name index
+        """
+
+        return self._trs_index.items
+
+
+    @trs.setter
+    def trs(self, test_records):
+
+        self._trs_index = NameIndex(test_records)
+
+
+    @property
+    def devices(self):
+        """
+        List of devices; setting it rebuilds the name index
+        """
+
+        return self._devices_index.items
+
+
+    @devices.setter
+    def devices(self, devices):
+
+        self._devices_index = NameIndex(devices)
+
+
+    def refresh(self):
+        """
+        Fetch the lists of test records and devices from VAS again, e.g. to
+        pick up new tests or the new versions of running ones, and rebuild
+        their name indexes
+        """
+
         print('Initializing test records...')
         self.trs = vs.get_test_records()
         
         print('Initializing devices...')
         self.devices = vs.get_devices()
         
-        print('Done.')
-        
     
     def filter_devices(self, keyword):
         """
         Return a filtered list of device names based on keyword
+
+        The keyword matches at the start of a name or after a separator such
+        as '_' or '-'; if no name matches that way, names containing the
+        keyword anywhere are returned (see NameIndex).
         """
     
-        device_list = []
-        
-        for device in self.devices:        
-            if keyword in device.name:
-                device_list.append(device.name)
-                
-        return device_list
+        return [device.name for device in self._devices_index.find(keyword)]
     
     
     
     def get_test_names(self, device_name):
         """
         Retrieve the test names for a given device.
+
+        Test names match the device name at their start or after a separator
+        such as '_' or '-'; if none match that way, names containing the
+        device name anywhere are returned (see NameIndex).
         
         Returns:
           - 'cycler_list' : from cycler ([str])
@@ -62,39 +357,38 @@ class VasHelper:
         cycler_list = []
         aux_list = []
 
-        for test_record in self.trs:
+        for test_record in self._trs_index.find(device_name):
 
-            if device_name in test_record.name:
-
-                if 'AuxDat' in test_record.name:
-                    aux_list.append(test_record.name)
-                else:
-                    cycler_list.append(test_record.name)
+            if 'AuxDat' in test_record.name:
+                aux_list.append(test_record.name)
+            else:
+                cycler_list.append(test_record.name)
 
         return cycler_list, aux_list
     
         
-    def get_cycler_data(self, test_name):
+    def get_cycler_data(self, test_name, start_time=None):
         """
         Return a Pandas DataFrame from a test name corresponding with cycler data
+        
+        Parameters
+        ---------
+        test_name (str): the name of a test
+        start_time (pd.Timestamp): if given, only datapoints logged after this
+                                   time are fetched and returned, e.g. to pick
+                                   up the new data of a running test. These
+                                   partial reads skip the local cache.
         """
-            
-        test_record = self._get_test_record(test_name)
 
-        reader = test_record.make_time_series_reader()
-        reader.add_trace_keys('h_test_time',
-                              'h_datapoint_time',
-                              'h_current', 
-                              'h_potential', 
-                              'h_step_index',
-                              'h_step_time',
-                              'h_charge_capacity',
-                              'h_charge_energy',
-                              'h_discharge_capacity',
-                              'h_discharge_energy')
-        reader.add_info_keys('i_cycle_num')
-
-        df = reader.read_pandas()
+        if start_time is None:
+            after = None
+        else:
+            # Rounding of the datapoint times can at worst let the last row
+            # seen through again; the exact cut is made on the datetime below
+            after = (DATAPOINT_TIME_KEY, start_time.value / 10**6)
+
+        df = self._read_time_series(test_name, CYCLER_TRACE_KEYS, CYCLER_INFO_KEYS,
+                                    after=after)
         df['h_datapoint_datetime'] = pd.to_datetime(df['h_datapoint_time'], unit='ms')\
                                        .dt.tz_localize('UTC')\
                                        .dt.tz_convert('US/Eastern')
@@ -113,10 +407,13 @@ class VasHelper:
 
         df = df.drop(columns=['h_datapoint_time'])
 
+        if start_time is not None:
+            df = df[df['datetime'] > start_time]
+
         return df
     
         
-    def get_aux_data(self, test_name):
+    def get_aux_data(self, test_name, limiter=None):
         """
         Return a Pandas DataFrame from a file containing 'aux'iliary data, which includes
         the LDC expansion sensor data, temperature sensor data, and others.
@@ -124,23 +421,11 @@ class VasHelper:
         Parameters
         ---------
         test_name (str): the name of a test
+        limiter (RateLimiter): if given, paces and retries the request to VAS;
+                               reads served by the local cache skip it
         """
 
-        test_record = self._get_test_record(test_name)
-
-        reader = test_record.make_time_series_reader()
-
-        reader.add_trace_keys('h_test_time',
-                              'aux_vdf_ldcref_none_0',
-                              'aux_vdf_ambientrh_percent_0',
-                              'aux_vdf_ldcsensor_none_0',
-                              'aux_vdf_temperature_celsius_0',
-                              'aux_vdf_ambienttemperature_celsius_0',
-                              'aux_vdf_timestamp_datetime_0',
-                              'aux_vdf_current_amp_0'
-                              )
-
-        df = reader.read_pandas()
+        df = self._read_time_series(test_name, AUX_TRACE_KEYS, limiter=limiter)
         df['h_datapoint_datetime'] = pd.to_datetime(df['aux_vdf_timestamp_datetime_0'], unit='ms')\
                                        .dt.tz_localize('UTC')\
                                        .dt.tz_convert('US/Eastern')
@@ -159,48 +444,135 @@ class VasHelper:
         return df
     
     
-    def get_aux_data_compiled(self, device_name):
+    def get_aux_data_compiled(self, device_name, max_workers=AUX_FETCH_WORKERS,
+                              limiter=None):
         """
         Returns a single DataFrame holding the AuxData for a device,
         stitched together and sorted by time
+
+        The records are fetched concurrently, paced by a shared rate limiter.
         
         Parameters
         ---------
         device_name (str): the name of a device
+        max_workers (int): number of records fetched at once
+        limiter (RateLimiter): paces and retries the requests to VAS; defaults
+                               to the AUX_FETCH_* limits
         """
         
         _, aux_list = self.get_test_names(device_name)
-        
-        df = pd.DataFrame()
-        
-        for test_record in aux_list:
-            
-            print(f'Processing {test_record}')
-            
-            df = pd.concat([df, self.get_aux_data(test_record)])
-            
-            time.sleep(5)
+
+        assert len(aux_list) > 0, f'No AuxData records found for {device_name}.'
+
+        if limiter is None:
+            limiter = RateLimiter(burst=max_workers)
+
+        def fetch(test_name):
+
+            print(f'Processing {test_name}')
+
+            return self.get_aux_data(test_name, limiter=limiter)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(fetch, aux_list))
+
+        df = pd.concat(frames)
             
         # Sort and trim values
         df = df.sort_values(by=['datetime'])
         df = df[df['datetime'].between('2020', '2040')]
                               
         return df
-                              
-                              
-        
+
+
+    def _read_time_series(self, test_name, trace_keys, info_keys=(), limiter=None,
+                          after=None):
+        """
+        Read the traces of a test record, through the local cache if there
+        is one, and through the rate limiter if one is given
+
+        `after` is an optional (trace key, value) pair; if given, only the
+        datapoints whose trace is above the value are fetched, and the local
+        cache, which holds whole records, is skipped.
+        """
+
+        test_record = self._get_test_record(test_name)
+        keys = trace_keys + info_keys
+
+        def fetch():
+
+            reader = test_record.make_time_series_reader()
+            reader.add_trace_keys(*trace_keys)
+            if info_keys:
+                reader.add_info_keys(*info_keys)
+            if after is not None:
+                add_trace_filter(reader, *after)
+
+            return reader.read_pandas()
+
+        def read():
+
+            return fetch() if limiter is None else limiter.call(fetch)
+
+        if self.cache is None or after is not None:
+            return read()
+
+        if self.offline:
+            df = self.cache.get(test_name, keys)
+            if df is not None:
+                return df
+
+        try:
+            df, _ = self.cache.read(test_name, keys, read,
+                                    version=get_record_version(test_record))
+        except TRANSIENT_ERRORS as e:
+            df = self.cache.get(test_name, keys)
+            if df is None:
+                raise
+            print(f'Warning: could not reach VAS ({e}); using the local copy of '
+                  f'"{test_name}", which may be out of date.')
+
+        return df
+
+
     def _get_test_record(self, test_name):
         """
         Retrieve a test record object matching a test name
         """
 
-        tr_target = 0
-
-        for tr in self.trs:
-            if tr.name == test_name:
-                tr_target = tr
+        tr_target = self._trs_index.get(test_name)
 
-        assert not tr_target == 0, 'Test record not found!'
+        assert tr_target is not None, 'Test record not found!'
 
         return tr_target
-    
\ No newline at end of file
+
+
+def add_trace_filter(reader, trace_key, value):
+    """
+    Restrict a time series reader to the datapoints whose trace is above a
+    value, so that VAS only sends those. A reader without trace filters
+    fetches the whole record; the caller must filter the rows itself.
+    """
+
+    operation = getattr(getattr(vs, 'TraceFilterOperation', None), 'GREATER_THAN', None)
+
+    if operation is None or not hasattr(reader, 'filter_trace'):
+        print(f'Warning: the VAS reader cannot filter on {trace_key}; '
+              f'fetching the whole record.')
+        return
+
+    reader.filter_trace(trace_key, operation, value)
+
+
+def get_record_version(test_record):
+    """
+    Returns a string identifying the state of a test record's data, made of
+    the attributes in RECORD_VERSION_ATTRS it exposes; None if it exposes
+    none of them, in which case its local copy is only used offline or when
+    VAS cannot be reached
+    """
+
+    values = [f'{attr}={getattr(test_record, attr)}'
+              for attr in RECORD_VERSION_ATTRS if getattr(test_record, attr, None) is not None]
+
+    return '|'.join(values) if values else None
@@ -0,0 +1,45 @@
+"""
+Check that paths are resolved lazily and can be overridden
+"""
+
+import pytest
+
+from src import config
+
+
+@pytest.fixture
+def config_file(tmp_path):
+
+    file = tmp_path / 'paths.yaml'
+    file.write_text("data: '/lab/data/'\noutputs: '/lab/outputs/'\n"
+                    "documents: '/lab/documents/'\n")
+
+    config.use_config_file(str(file))
+
+    yield file
+
+    config.reset_paths()
+
+
+def test_named_paths(config_file):
+
+    assert config.get_path('PATH_TIMESERIES') == '/lab/data/2020-10-aging-test-timeseries'
+    assert config.get_path('PATH_CACHE') == '/lab/outputs/cache/'
+
+
+def test_overrides(config_file):
+
+    config.set_paths(outputs='/scratch/')
+
+    assert config.get_path('PATH_ESOH_SUMMARY') == '/scratch/summary_esoh_table.csv'
+    assert config.get_path('PATH_CACHE') == '/scratch/cache/'
+    assert config.get_path('PATH_METADATA') == '/lab/documents/cell_tracker.xlsx'
+
+
+def test_module_attributes(config_file):
+
+    from src import formation
+
+    config.set_paths(data='/mnt/data/')
+
+    assert formation.PATH_CYCLE == '/mnt/data/2020-10-aging-test-cycles'
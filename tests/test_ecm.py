@@ -0,0 +1,92 @@
+"""
+Check the batched equivalent circuit fitter on synthetic pulses
+"""
+
+import numpy as np
+import pytest
+
+from src.ecm import evaluate_pulses, fit_pulse_sequences, fit_pulses, get_params_table
+
+
+@pytest.fixture
+def pulses():
+
+    rng = np.random.default_rng(0)
+
+    num_pulses = 30
+    lengths = rng.integers(60, 120, num_pulses)
+    time = np.concatenate([np.linspace(0, 10, n) for n in lengths])
+
+    params = np.column_stack([rng.uniform(0.02, 0.05, num_pulses),
+                              rng.uniform(0.005, 0.01, num_pulses),
+                              rng.uniform(0.005, 0.02, num_pulses),
+                              rng.uniform(0.2, 0.8, num_pulses),
+                              rng.uniform(3, 8, num_pulses)])
+
+    return time, lengths, params
+
+
+def test_evaluate_pulses(pulses):
+
+    time, lengths, params = pulses
+
+    values = evaluate_pulses(time, lengths, params)
+
+    start = lengths[0]
+    R0, R1, R2, tau1, tau2 = params[1]
+    t = time[start:start + lengths[1]]
+
+    np.testing.assert_allclose(values[start:start + lengths[1]],
+                               R0 + R1 * (1 - np.exp(-t / tau1)) + R2 * (1 - np.exp(-t / tau2)))
+
+
+def test_fit_recovers_parameters(pulses):
+
+    time, lengths, params = pulses
+
+    values = evaluate_pulses(time, lengths, params)
+
+    fitted, rmse, converged = fit_pulses(time, values, lengths, num_rc=2)
+
+    assert converged.all()
+    assert np.all(rmse < 1e-8)
+    np.testing.assert_allclose(fitted, params, rtol=1e-4)
+
+
+def test_fit_pulse_sequences(pulses):
+
+    time, lengths, params = pulses
+
+    values = evaluate_pulses(time, lengths, params)
+
+    # Three sweeps of ten pulses, stored interleaved
+    sequence = np.tile([7, 8, 9], 10)
+    position = np.repeat(np.arange(10), 3)
+
+    fitted, rmse, converged = fit_pulse_sequences(time, values, lengths,
+                                                  sequence, position, num_rc=2)
+
+    assert converged.all()
+    np.testing.assert_allclose(fitted, params, rtol=1e-4)
+
+
+def test_fit_pulse_sequences_duplicate_positions(pulses):
+
+    time, lengths, params = pulses
+
+    values = evaluate_pulses(time, lengths, params)
+
+    # The last two pulses both claim position 1 of sequence 8
+    sequence = np.r_[np.tile([7, 8, 9], 9), 7, 8, 8]
+    position = np.r_[np.repeat(np.arange(9), 3), 9, 1, 1]
+
+    with pytest.raises(AssertionError, match='sequence, position'):
+        fit_pulse_sequences(time, values, lengths, sequence, position, num_rc=2)
+
+
+def test_params_table():
+
+    df = get_params_table(np.ones((4, 5)), num_rc=2)
+
+    assert list(df.columns) == ['r0_ohm', 'r1_ohm', 'r2_ohm', 'tau1_s', 'tau2_s']
+    assert len(df) == 4
@@ -0,0 +1,78 @@
+"""
+Check the HDF5 diagnostic export using small synthetic results
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.export import read_diagnostic_results, write_diagnostic_results
+
+
+@pytest.fixture
+def hppc_results():
+
+    results = []
+
+    for cycle in [3, 56, 159]:
+
+        raw_all = pd.DataFrame({'Potential (V)': np.linspace(3, 4, 10) + cycle,
+                                'Date Time': ['2020-10-01 00:00:00'] * 10})
+
+        results.append({'cycle_index': cycle,
+                        'data': pd.DataFrame({'capacity': [0.1, 0.2],
+                                              'resistance_10s_ohm': [0.03, 0.02]}),
+                        'raw_pulses': raw_all[['Potential (V)']].iloc[2:5],
+                        'raw_all': raw_all})
+
+    return results
+
+
+def test_hppc_round_trip(hppc_results, tmp_path):
+
+    file = tmp_path / 'diagnostics.h5'
+
+    write_diagnostic_results(file, 1, 'hppc_discharge', hppc_results)
+
+    results = read_diagnostic_results(file, 1, 'hppc_discharge')
+
+    assert [res['cycle_index'] for res in results] == [3, 56, 159]
+
+    for expected, res in zip(hppc_results, results):
+        for name in ['data', 'raw_pulses', 'raw_all']:
+            pd.testing.assert_frame_equal(res[name], expected[name])
+
+
+def test_read_selected_cycles(hppc_results, tmp_path):
+
+    file = tmp_path / 'diagnostics.h5'
+
+    write_diagnostic_results(file, 1, 'hppc_discharge', hppc_results)
+    write_diagnostic_results(file, 2, 'hppc_discharge', hppc_results[:1])
+
+    results = read_diagnostic_results(file, 1, 'hppc_discharge', cycles=[56])
+
+    assert len(results) == 1
+    pd.testing.assert_frame_equal(results[0]['raw_all'], hppc_results[1]['raw_all'])
+
+    assert len(read_diagnostic_results(file, 2, 'hppc_discharge')) == 1
+    assert read_diagnostic_results(file, 2, 'hppc_charge') == []
+
+    with pytest.raises(AssertionError):
+        read_diagnostic_results(file, 2, 'hppc_discharge', cycles=[56])
+
+
+def test_c20_round_trip(tmp_path):
+
+    file = tmp_path / 'diagnostics.h5'
+
+    curve = pd.Series(np.linspace(0, 2.3, 5))
+    result = {'cycle_index': 3,
+              'chg_capacity': curve, 'chg_voltage': curve + 3, 'chg_dvdq': curve,
+              'dch_capacity': curve, 'dch_voltage': curve + 3, 'dch_dvdq': curve}
+
+    write_diagnostic_results(file, 1, 'c20', [result])
+
+    res = read_diagnostic_results(file, 1, 'c20')[0]
+
+    assert list(res['dch_voltage']) == list(curve + 3)
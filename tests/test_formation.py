@@ -1,5 +1,8 @@
+import numpy as np
 import pytest
 from src.formation import FormationCell as FormationCell
+from src.formation import COMPACT_FEATURE_RTOL, SCHEMA_TIMESERIES, TIMESERIES_STORE_DTYPES, \
+    fit_hppc_ecm_cells, load_datasets
 
 @pytest.fixture
 def sample_baseline_formation_cell():
@@ -194,3 +197,126 @@ class TestParametrized:
         data_list = this_cell.get_esoh_fitting_data()
 
         assert len(data_list) >= 1
+
+
+@pytest.mark.parametrize("cellid", [11, 33])
+def test_compact_load_parity(cellid):
+
+    full_cell = FormationCell(cellid)
+    compact_cell = FormationCell(cellid, compact=True)
+
+    for method in ['get_formation_test_summary_statistics',
+                   'get_aging_test_summary_statistics']:
+
+        full_stats = getattr(full_cell, method)()
+        compact_stats = getattr(compact_cell, method)()
+
+        assert full_stats.keys() == compact_stats.keys()
+
+        for key, value in full_stats.items():
+            if np.isscalar(value):
+                assert np.isclose(compact_stats[key], value,
+                                  rtol=COMPACT_FEATURE_RTOL, equal_nan=True), key
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_mmap_backend_precision(compact):
+
+    cell = FormationCell(11, backend='mmap', compact=compact)
+    store = cell.get_aging_data_timeseries()
+
+    dtypes = SCHEMA_TIMESERIES if compact else TIMESERIES_STORE_DTYPES
+
+    for name, dtype in dtypes.items():
+        assert store[name].dtype == dtype, name
+
+
+def test_streamed_diagnostics_match_loaded(sample_baseline_formation_cell):
+
+    cell = sample_baseline_formation_cell
+
+    for method in ['process_diagnostic_c20_data',
+                   'process_diagnostic_hppc_discharge_data']:
+
+        loaded = getattr(cell, method)()
+        streamed = getattr(cell, method)(stream=True)
+
+        assert len(loaded) == len(streamed)
+
+        for result_loaded, result_streamed in zip(loaded, streamed):
+            assert result_loaded['cycle_index'] == result_streamed['cycle_index']
+
+    loaded = cell.process_diagnostic_4p2v_voltage_decay()
+    streamed = cell.process_diagnostic_4p2v_voltage_decay(stream=True)
+
+    assert loaded == streamed
+
+
+def test_load_datasets():
+
+    cellid_list = [11, 33]
+
+    results = load_datasets(cellid_list, datasets=['cycles'], max_workers=2)
+
+    df = results['cycles']
+
+    assert list(df.columns)[0] == 'cellid'
+    assert list(df['cellid'].unique()) == cellid_list
+
+    for cellid in cellid_list:
+        expected = FormationCell(cellid).get_aging_data_cycles()
+        assert (df['cellid'] == cellid).sum() == len(expected)
+
+
+def test_hppc_pulse_table(sample_baseline_formation_cell):
+
+    cell = sample_baseline_formation_cell
+
+    pulses = cell.get_hppc_pulses()
+
+    assert set(pulses['direction']) == {'charge', 'discharge'}
+
+    for direction, method in [('charge', 'process_diagnostic_hppc_charge_data'),
+                              ('discharge', 'process_diagnostic_hppc_discharge_data')]:
+
+        results = getattr(cell, method)()
+        completed = pulses[(pulses['direction'] == direction) & pulses['is_completed']]
+
+        assert sum(len(res['data']) for res in results) == len(completed)
+
+
+def test_hppc_resistance(sample_baseline_formation_cell):
+
+    cell = sample_baseline_formation_cell
+
+    pulses = cell.get_hppc_pulses()
+
+    assert len(cell.get_hppc_pulse_store()) == len(pulses)
+
+    resistance = cell.get_hppc_resistance([1, 3, 10, 0.1])
+
+    assert resistance.index.equals(pulses.index)
+    assert list(resistance.columns) == [1, 3, 10, 0.1]
+
+    for t in [1, 3, 10]:
+        assert list(resistance[t]) == list(pulses[f'resistance_{t}s_ohm'])
+
+
+def test_fit_hppc_ecm(sample_baseline_formation_cell):
+
+    cell = sample_baseline_formation_cell
+
+    pulses = cell.get_hppc_pulses()
+    df = cell.fit_hppc_ecm(num_rc=1)
+
+    assert df.index.equals(pulses.index)
+    assert list(df['pulse_number'][:3]) == [0, 1, 2]
+    assert {'r0_ohm', 'r1_ohm', 'tau1_s', 'rmse_ohm', 'converged'} <= set(df.columns)
+    assert np.all(df['rmse_ohm'] < 1e-3)
+
+
+def test_fit_hppc_ecm_cells():
+
+    df = fit_hppc_ecm_cells([11, 33], num_rc=1, max_workers=1)
+
+    assert list(df['cellid'].unique()) == [11, 33]
@@ -0,0 +1,119 @@
+"""
+Check the HPPC pulse array operations against per-pulse reference loops
+"""
+
+import numpy as np
+import pytest
+
+from src.hppc import (PulseStore, find_pulses, get_pulse_rows, interp_pulses,
+                      mean_pulses)
+
+
+def find_pulses_loop(step_index, pulse_step):
+
+    starts, stops = [], []
+
+    for idx in range(1, len(step_index)):
+        if step_index[idx] == pulse_step and step_index[idx-1] != pulse_step:
+            jdx = idx + 1
+            while True:
+                jdx += 1
+                if step_index[jdx] != pulse_step:
+                    break
+            starts.append(idx)
+            stops.append(jdx)
+
+    return starts, stops
+
+
+def test_find_pulses():
+
+    # Includes a pulse on the first row and a one-row pulse
+    step_index = np.array([24, 24, 23, 24, 24, 24, 23, 23, 24, 23, 22, 24, 24, 23])
+
+    starts, stops = find_pulses(step_index, 24)
+
+    assert (list(starts), list(stops)) == find_pulses_loop(step_index, 24)
+    assert list(get_pulse_rows(starts, stops)) == [3, 4, 5, 8, 9, 11, 12]
+
+
+def test_pulse_without_end():
+
+    with pytest.raises(AssertionError):
+        find_pulses(np.array([23, 24, 24, 24]), 24)
+
+
+@pytest.mark.parametrize("x", [-1, 0, 1, 3, 10, 12])
+def test_interp_pulses(x):
+
+    rng = np.random.default_rng(0)
+
+    lengths = np.array([1, 2, 50, 101, 7])
+    time = np.concatenate([np.cumsum(rng.uniform(0, 0.3, n)) - 0.1 for n in lengths])
+    time[20] = time[21] # repeated sample time
+    values = rng.normal(3.7, 0.1, lengths.sum())
+
+    expected = []
+    for start, length in zip(np.cumsum(lengths) - lengths, lengths):
+        expected.append(np.interp(x, time[start:start + length],
+                                  values[start:start + length]))
+
+    assert list(interp_pulses(x, time, values, lengths)) == expected
+
+
+def test_interp_pulses_at_many_points():
+
+    rng = np.random.default_rng(1)
+
+    lengths = np.array([1, 2, 50, 101, 7])
+    time = np.concatenate([np.cumsum(rng.uniform(0, 0.3, n)) - 0.1 for n in lengths])
+    time[20] = time[21] # repeated sample time
+    values = rng.normal(3.7, 0.1, lengths.sum())
+
+    # Unsorted, repeated, and exactly on a sample
+    points = np.array([10, -1, 3, 0, time[40], 1, 3, 12, time[20]])
+
+    result = interp_pulses(points, time, values, lengths)
+
+    assert result.shape == (5, 9)
+    for p, (start, length) in enumerate(zip(np.cumsum(lengths) - lengths, lengths)):
+        expected = np.interp(points, time[start:start + length], values[start:start + length])
+        assert list(result[p]) == list(expected)
+
+
+def test_mean_pulses():
+
+    values = np.random.default_rng(0).normal(2.36, 0.01, 300).astype(np.float32)
+    lengths = np.array([100, 13, 187])
+
+    expected = [np.mean(values[:100]), np.mean(values[100:113]), np.mean(values[113:])]
+    result = mean_pulses(values, lengths)
+
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, rtol=1e-6, atol=0)
+    assert len(mean_pulses(values[:0], lengths[:0])) == 0
+
+
+def test_pulse_store():
+
+    rng = np.random.default_rng(0)
+
+    lengths = np.array([3, 40, 12])
+    time = np.concatenate([np.cumsum(rng.uniform(0, 0.5, n)) for n in lengths])
+    voltage = rng.normal(3.7, 0.1, lengths.sum())
+    current = rng.normal(1.2, 0.01, lengths.sum())
+
+    store = PulseStore.concat([PulseStore(time[:3], voltage[:3], current[:3], lengths[:1]),
+                               PulseStore(time[3:], voltage[3:], current[3:], lengths[1:])])
+
+    assert len(store) == 3
+    assert list(store.get_pulse(1)['time_s']) == list(time[3:43])
+    assert list(store.get_duration()) == [time[2], time[42], time[-1]]
+
+    times = np.logspace(-1, 1, 9)
+    result = store.interp_voltage(times)
+
+    assert result.shape == (3, 9)
+    for p in range(3):
+        pulse = store.get_pulse(p)
+        assert list(result[p]) == list(np.interp(times, pulse['time_s'], pulse['voltage_v']))
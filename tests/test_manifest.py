@@ -0,0 +1,66 @@
+"""
+Check the file manifest against glob using a small synthetic directory
+"""
+
+import glob
+import os
+
+import pytest
+
+from src.manifest import FileManifest
+
+PATTERN = 'UM_Internal_0620_*_Cell_{cellid}.*.csv'
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+
+    for name in ['UM_Internal_0620_-_Cell_1.023.csv',
+                 'UM_Internal_0620_-_Cell_11.023.csv',
+                 'UM_Internal_0620_-_Cell_12.023.csv',
+                 'UM_Internal_0620_-_Cell_12.024.csv',
+                 'notes.txt']:
+        (tmp_path / name).touch()
+
+    return str(tmp_path)
+
+
+def test_matches_glob(data_dir):
+
+    manifest = FileManifest(data_dir, PATTERN)
+
+    for cellid in [1, 2, 11, 12, 23]:
+        expected = sorted(glob.glob(f'{data_dir}/{PATTERN.format(cellid=cellid)}'))
+        assert manifest.get_files(cellid) == expected
+
+    assert manifest.get_cellids() == [1, 11, 12]
+
+
+def test_duplicates_and_missing(data_dir):
+
+    manifest = FileManifest(data_dir, PATTERN)
+
+    assert list(manifest.get_duplicates()) == [12]
+
+    with pytest.raises(AssertionError, match='2 files'):
+        manifest.get_file(12)
+
+    with pytest.raises(AssertionError, match='No file found'):
+        manifest.get_file(2)
+
+
+def test_refresh_on_directory_change(data_dir):
+
+    manifest = FileManifest(data_dir, PATTERN)
+
+    assert manifest.refresh()
+    assert not manifest.refresh()
+
+    new_file = f'{data_dir}/UM_Internal_0620_-_Cell_2.023.csv'
+    open(new_file, 'w').close()
+
+    # Make sure the change is visible on filesystems with coarse timestamps
+    stat = os.stat(data_dir)
+    os.utime(data_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert manifest.get_file(2) == new_file
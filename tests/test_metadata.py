@@ -0,0 +1,49 @@
+"""
+Check the metadata registry using a small synthetic cell tracker
+"""
+
+import pandas as pd
+import pytest
+
+from src.metadata import clear_metadata_registries, get_metadata_registry
+
+
+@pytest.fixture
+def tracker(tmp_path):
+
+    df = pd.DataFrame({'cell_number': [1, 2],
+                       'formation_protocol': ['Baseline', 'Fast'],
+                       'aging_test': ['RT', 'HT'],
+                       'thickness_mm': [4.5, 4.6]})
+
+    file = tmp_path / 'cell_tracker.xlsx'
+    df.to_excel(file, index=False)
+
+    yield str(file)
+
+    clear_metadata_registries()
+
+
+def test_lookup(tracker, tmp_path):
+
+    registry = get_metadata_registry(tracker, tmp_path / 'cache')
+
+    assert len(registry) == 2
+    assert registry.get(2)['formation_protocol'] == 'Fast'
+    assert registry.get(1)['thickness_mm'] == 4.5
+
+
+def test_loaded_once_per_process(tracker, tmp_path):
+
+    registry_1 = get_metadata_registry(tracker, tmp_path / 'cache')
+    registry_2 = get_metadata_registry(tracker, tmp_path / 'cache')
+
+    assert registry_1 is registry_2
+
+
+def test_missing_cell(tracker, tmp_path):
+
+    registry = get_metadata_registry(tracker, tmp_path / 'cache')
+
+    with pytest.raises(AssertionError):
+        registry.get(3)
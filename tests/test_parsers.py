@@ -0,0 +1,597 @@
+"""
+Check the VAS parsers against synthetic test records served by a fake helper
+"""
+
+import importlib
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def parsers(monkeypatch):
+
+    # src.vas needs the VAS client, which is only available on VAS
+    monkeypatch.setitem(sys.modules, 'voltaiq_studio', types.ModuleType('voltaiq_studio'))
+    monkeypatch.delitem(sys.modules, 'src.vas', raising=False)
+    monkeypatch.delitem(sys.modules, 'src.parsers', raising=False)
+
+    return importlib.import_module('src.parsers')
+
+
+class FakeHelper:
+    """
+    Serves test records as vas.VasHelper does, with only the first
+    `num_rows` datapoints of each logged so far
+    """
+
+    def __init__(self, records, num_rows=None):
+
+        self.records = records
+        self.num_rows = num_rows
+
+
+    def get_test_names(self, device_name):
+
+        return [name for name in self.records if device_name in name], []
+
+
+    def get_cycler_data(self, test_name, start_time=None):
+
+        df = self.records[test_name].iloc[:self.num_rows].copy()
+
+        if start_time is not None:
+            df = df[df['datetime'] > start_time]
+
+        return df
+
+
+def make_cycling_record(num_rpt=2, cycles_between=40, seed=0, repeat_steps=False):
+    """
+    Returns a synthetic record of the UMBL2022FEB cycling test: cycles
+    between RPTs, each RPT holding its HPPC cycles and C/20 curves, and a
+    last cycle after the final RPT
+
+    With `repeat_steps`, the CC charge of every cycling cycle is interrupted
+    by a rest, and every HPPC cycle charges up twice, so that these steps
+    occur twice in a cycle.
+    """
+
+    rng = np.random.default_rng(seed)
+    frames = []
+
+    def add(cycle, step, n, current, voltage, slope=0):
+        k = np.arange(n)
+        charging = step in (3, 4, 19, 26)
+        discharging = step in (6, 23)
+        frames.append(pd.DataFrame({
+            'cycle_index': cycle,
+            'step_index': step,
+            'step_time_s': k + rng.uniform(-0.3, 0.3, n),
+            'voltage_v': np.round(voltage + 0.03 * current + slope * current * (1 - np.exp(-k / 3))
+                                  + rng.normal(0, 1e-3, n), 4),
+            'current_a': np.round(current + rng.normal(0, 1e-3, n), 3),
+            'charge_capacity_ah': 0.05 * k if charging else np.zeros(n),
+            'charge_energy_wh': 0.2 * k,
+            'discharge_capacity_ah': 0.05 * k if discharging else np.zeros(n),
+            'discharge_energy_wh': 0.1 * k}))
+
+    def add_cycle(cycle):
+        if repeat_steps:
+            add(cycle, 3, 8, 1, 3.7)
+            add(cycle, 5, 3, 0, 3.7)
+            add(cycle, 3, 12, 1, 3.8)
+        else:
+            add(cycle, 3, 20, 1, 3.8)
+        add(cycle, 4, 10, 0.5, 4.2)
+        add(cycle, 5, 5, 0, 4.1)
+        add(cycle, 6, 20, -1, 3.6)
+        add(cycle, 7, 5, 0, 3.4)
+
+    cycle = 1
+
+    for _ in range(num_rpt):
+
+        for _ in range(cycles_between):
+            add_cycle(cycle)
+            cycle += 1
+
+        add(cycle, 12, 10, 0, 3.5)
+        add(cycle, 13, 10, 0, 3.0)
+        cycle += 1
+
+        for _ in range(3):
+            add(cycle, 14, 6, 0, 3.5)
+            add(cycle, 15, 12, -1, 3.5, 0.01)
+            add(cycle, 16, 6, 0, 3.5)
+            add(cycle, 17, 12, 1, 3.5, 0.01)
+            add(cycle, 19, 5, 0.5, 3.6)
+            if repeat_steps:
+                add(cycle, 14, 4, 0, 3.6)
+                add(cycle, 19, 3, 0.5, 3.65)
+            cycle += 1
+
+        add(cycle, 21, 5, 0, 3.5)
+        add(cycle, 23, 150, -0.1, 3.5, -0.5)
+        add(cycle, 26, 150, 0.1, 3.5, 0.5)
+        add(cycle, 27, 20, 0, 4.2)
+        cycle += 1
+
+    add_cycle(cycle)
+
+    df = pd.concat(frames, ignore_index=True)
+    df['test_time_s'] = np.cumsum(rng.uniform(0.5, 1.5, len(df)))
+    df['datetime'] = pd.Timestamp('2023-03-01', tz='US/Eastern') \
+                     + pd.to_timedelta(df['test_time_s'], unit='s')
+
+    return df
+
+
+def assert_tables_equal(tables, expected):
+
+    assert tables.keys() == expected.keys()
+
+    for name in expected:
+        pd.testing.assert_frame_equal(tables[name].drop(columns='dvdq_data', errors='ignore'),
+                                      expected[name].drop(columns='dvdq_data', errors='ignore'),
+                                      check_exact=True)
+
+    for dvdq, dvdq_expected in zip(tables['rpt']['dvdq_data'], expected['rpt']['dvdq_data']):
+        for key in dvdq_expected:
+            assert np.array_equal(dvdq[key], dvdq_expected[key], equal_nan=True), key
+
+
+def get_split(df, step, rpt):
+    """
+    Returns the number of rows logged halfway through a step of an RPT
+    """
+
+    rows = np.flatnonzero(df['step_index'] == step)
+    rows = np.split(rows, np.flatnonzero(np.diff(rows) > 1) + 1)[rpt]
+
+    return rows[len(rows) // 2]
+
+
+def get_baseline_hppc_info(df, rpt_start_cycle_list):
+    """
+    Returns the HPPC table computed as RptDataParser.get_hppc_info did
+    before it was vectorized: one filter of the rows per RPT and per HPPC
+    cycle
+    """
+
+    resistance_charge_list = []
+    resistance_discharge_list = []
+    cycle_index_list = []
+    capacity_ah_list = []
+
+    for rpt_start_cycle in rpt_start_cycle_list:
+
+        hppc_start_cycle = rpt_start_cycle + 1
+
+        this_rpt = df[(df['cycle_index'] >= hppc_start_cycle)]
+        this_rpt = this_rpt[this_rpt['cycle_index'] <= hppc_start_cycle + 80]
+
+        hppc_end_cycle = this_rpt[this_rpt['step_index'] == 21]['cycle_index'].iloc[0]
+        this_rpt = this_rpt[this_rpt['cycle_index'] <= hppc_end_cycle]
+
+        capacity_ah_counter = 0
+
+        for hppc_cycle_index in this_rpt['cycle_index'].unique():
+
+            curr_hppc = this_rpt[this_rpt['cycle_index'] == hppc_cycle_index]
+
+            resistance = []
+
+            for pulse_step in [15, 17]:
+                df_pulse = curr_hppc[curr_hppc['step_index'] == pulse_step]
+                if df_pulse.empty:
+                    resistance.append(np.nan)
+                else:
+                    V0 = df['voltage_v'].loc[np.arange(df_pulse.index[0] - 5,
+                                                       df_pulse.index[0])].median()
+                    V1 = np.interp(10, df_pulse['step_time_s'], df_pulse['voltage_v'])
+                    I = df_pulse['current_a'].median()
+                    resistance.append((V1 - V0) / I)
+
+            resistance_discharge_list.append(resistance[0])
+            resistance_charge_list.append(resistance[1])
+            cycle_index_list.append(rpt_start_cycle)
+            capacity_ah_list.append(capacity_ah_counter)
+
+            df_chg_up = curr_hppc[curr_hppc['step_index'] == 19]
+            capacity_ah_counter += df_chg_up['charge_capacity_ah'].max() - \
+                                   df_chg_up['charge_capacity_ah'].min()
+
+    return pd.DataFrame(list(zip(cycle_index_list,
+                                 resistance_discharge_list,
+                                 resistance_charge_list,
+                                 capacity_ah_list)), columns=['cycle_index',
+                                                              'resistance_discharge_ohms',
+                                                              'resistance_charge_ohms',
+                                                              'capacity_ah'])
+
+
+@pytest.mark.parametrize("repeat_steps", [False, True])
+def test_hppc_info_matches_baseline(parsers, repeat_steps):
+
+    df = make_cycling_record(num_rpt=3, repeat_steps=repeat_steps)
+
+    # The full record, and the record cut during the C/20 charge of the last
+    # RPT and during its HPPC
+    for num_rows in [len(df), get_split(df, 26, 2), get_split(df, 17, 7)]:
+
+        parser = parsers.CyclingDataParser('CELL_1', FakeHelper({'CELL_1_CYC': df}, num_rows))
+        df_rpt = parser.df_rpt
+
+        rpt = parsers.RptDataParser(df_rpt)
+        rpt_start_cycle_list = rpt.get_rpt_start_cycles(0)
+
+        # Only RPTs whose HPPC has finished, as in get_tables
+        hppc_end_cycles = df_rpt['cycle_index'][df_rpt['step_index'] == 21].unique()
+        rpt_start_cycle_list = [cycle for cycle in rpt_start_cycle_list
+                                if np.any((hppc_end_cycles > cycle) & \
+                                          (hppc_end_cycles <= cycle + 81))]
+
+        df_hppc = rpt.get_hppc_info(rpt_start_cycle_list)
+
+        assert len(df_hppc) > 0
+        pd.testing.assert_frame_equal(df_hppc,
+                                      get_baseline_hppc_info(df_rpt, rpt_start_cycle_list),
+                                      check_exact=True)
+
+
+def get_baseline_cycling_info(df):
+    """
+    Returns the cycling table computed as CyclingDataParser.get_cycling_info
+    did before it was vectorized: one filter of the rows per cycle and per
+    step
+    """
+
+    df_agg = df.groupby('cycle_index').agg('max')
+    rpt_cycles = df['cycle_index'][(df['step_index'] >= 12) & (df['step_index'] <= 31)].unique()
+
+    df_by_cyc = pd.DataFrame()
+    df_by_cyc.index = df_agg.index
+
+    for column in ['charge_capacity_ah', 'charge_energy_wh',
+                   'discharge_capacity_ah', 'discharge_energy_wh']:
+        df_by_cyc[column] = df_agg[column]
+    for column in ['charge_capacity_ah', 'charge_energy_wh',
+                   'discharge_capacity_ah', 'discharge_energy_wh']:
+        df_by_cyc[f'tot_{column}'] = df_agg[column].cumsum()
+
+    df_by_cyc.loc[rpt_cycles, ['charge_capacity_ah', 'charge_energy_wh',
+                               'discharge_capacity_ah', 'discharge_energy_wh']] = np.nan
+
+    steps = {'charge_cc_time_s': (3, 'test_time_s'),
+             'charge_cv_time_s': (4, 'test_time_s'),
+             'charge_rest_delta_voltage_v': (5, 'voltage_v'),
+             'discharge_cc_time_s': (6, 'test_time_s'),
+             'discharge_rest_delta_voltage_v': (7, 'voltage_v')}
+
+    values = {name: [] for name in steps}
+
+    for cycle in df_by_cyc.index:
+
+        this_df = df[df['cycle_index'] == cycle]
+
+        for name, (step, column) in steps.items():
+            df_step = this_df[this_df['step_index'] == step]
+            if df_step.empty:
+                values[name].append(np.nan)
+            else:
+                values[name].append(df_step[column].tail(1).item() - \
+                                    df_step[column].head(1).item())
+
+    for name in steps:
+        df_by_cyc[name] = values[name]
+
+    return df_by_cyc
+
+
+@pytest.mark.parametrize("repeat_steps", [False, True])
+def test_cycling_info_matches_baseline(parsers, repeat_steps):
+
+    df = make_cycling_record(repeat_steps=repeat_steps)
+
+    # The full record, and the record cut during the CC charge of a cycle
+    # and during the C/20 charge of the last RPT
+    for num_rows in [len(df), get_split(df, 3, 60), get_split(df, 26, 1)]:
+
+        parser = parsers.CyclingDataParser('CELL_1', FakeHelper({'CELL_1_CYC': df}, num_rows))
+
+        pd.testing.assert_frame_equal(parser.get_cycling_info(),
+                                      get_baseline_cycling_info(parser.df),
+                                      check_exact=True)
+
+
+def get_baseline_rpt_info(df, rpt_start_cycle_list):
+    """
+    Returns the RPT start cycles and RPT table computed as RptDataParser did
+    before RPT windows were found by binary search: one filter of the rows
+    per cycle and per RPT
+    """
+
+    from scipy import signal
+
+    rpt_start_cycles = [cycle for cycle in df['cycle_index'].unique()
+                        if df[df['cycle_index'] == cycle]['step_index'].isin([12]).any()]
+
+    rows = []
+
+    for rpt_start_cycle in rpt_start_cycle_list:
+
+        this_rpt = df[(df['cycle_index'] >= rpt_start_cycle)]
+        this_rpt = this_rpt[this_rpt['cycle_index'] <= rpt_start_cycle + 33]
+
+        chg = this_rpt[this_rpt['step_index'] == 26]
+        dch = this_rpt[this_rpt['step_index'] == 23]
+        top = this_rpt[this_rpt['step_index'] == 27]['voltage_v']
+        bot = this_rpt[this_rpt['step_index'] == 13]['voltage_v']
+
+        if len(chg) == 0:
+            continue
+
+        dvdq_data = dict()
+        for prefix, df_c20, column in [('dch', dch, 'discharge_capacity_ah'),
+                                       ('chg', chg, 'charge_capacity_ah')]:
+            dQ = signal.savgol_filter(df_c20[column], 101, 2, 1)
+            dV = signal.savgol_filter(df_c20['voltage_v'], 101, 2, 1)
+            dvdq_data[f'{prefix}_q'] = signal.savgol_filter(df_c20[column], 101, 2)
+            dvdq_data[f'{prefix}_v'] = signal.savgol_filter(df_c20['voltage_v'], 101, 2)
+            dvdq_data[f'{prefix}_dvdq'] = dV / dQ
+
+        rows.append((rpt_start_cycle,
+                     dch['discharge_capacity_ah'].max(),
+                     chg['charge_capacity_ah'].max(),
+                     top.tail(1).item() - top.head(1).item(),
+                     bot.tail(1).item() - bot.head(1).item(),
+                     dvdq_data))
+
+    df_by_rpt = pd.DataFrame(rows, columns=['cycle_index',
+                                            'c20_discharge_capacity_ah',
+                                            'c20_charge_capacity_ah',
+                                            'deltav_4p2v_12hr',
+                                            'deltav_3p0v_2p5hr',
+                                            'dvdq_data'])
+
+    return rpt_start_cycles, df_by_rpt
+
+
+@pytest.mark.parametrize("repeat_steps", [False, True])
+def test_rpt_windows_match_baseline(parsers, repeat_steps):
+
+    df = make_cycling_record(num_rpt=3, repeat_steps=repeat_steps)
+
+    # The full record, and the record cut during the C/20 charge of the last
+    # RPT and during its rest at the top of charge
+    for num_rows, num_complete in [(len(df), 3), (get_split(df, 26, 2), 2),
+                                   (get_split(df, 27, 2), 2)]:
+
+        parser = parsers.CyclingDataParser('CELL_1', FakeHelper({'CELL_1_CYC': df}, num_rows))
+        df_rpt = parser.df_rpt
+        cycle_index = df_rpt['cycle_index'].values
+
+        rpt = parsers.RptDataParser(df_rpt)
+        rpt_start_cycle_list = rpt.get_rpt_start_cycles(0)
+
+        # RPTs with a C/20 charge, finished or not
+        started_rpt_list = [cycle for cycle in rpt_start_cycle_list
+                            if np.any((cycle_index >= cycle) & (cycle_index <= cycle + 33) & \
+                                      (df_rpt['step_index'].values == 27))]
+
+        expected_starts, expected = get_baseline_rpt_info(df_rpt, started_rpt_list)
+
+        assert rpt_start_cycle_list == expected_starts
+        assert parser._get_complete_rpts(rpt_start_cycle_list) == \
+            rpt_start_cycle_list[:num_complete]
+
+        for cycle in rpt_start_cycle_list:
+            assert np.array_equal(rpt._get_cycle_rows(cycle, cycle + 33),
+                                  np.flatnonzero((cycle_index >= cycle) & \
+                                                 (cycle_index <= cycle + 33)))
+
+        df_by_rpt = rpt.get_rpt_info(started_rpt_list)
+
+        pd.testing.assert_frame_equal(df_by_rpt.drop(columns='dvdq_data'),
+                                      expected.drop(columns='dvdq_data'),
+                                      check_exact=True)
+
+        for dvdq, dvdq_expected in zip(df_by_rpt['dvdq_data'], expected['dvdq_data']):
+            for key in dvdq_expected:
+                np.testing.assert_allclose(dvdq[key], dvdq_expected[key], rtol=1e-9, atol=1e-12)
+
+
+def test_running_rpt_is_skipped(parsers):
+
+    df = make_cycling_record()
+    helper = FakeHelper({'CELL_1_CYC': df})
+
+    full = parsers.CyclingDataParser('CELL_1', helper).get_tables()
+
+    assert list(full['rpt']['cycle_index']) == [41, 86]
+
+    # During the C/20 charge and the rest at the top of charge of the
+    # second RPT, and at its very last datapoint
+    for num_rows in [get_split(df, 26, 1), get_split(df, 27, 1),
+                     np.flatnonzero(df['step_index'] == 27)[-1] + 1]:
+
+        helper.num_rows = num_rows
+        tables = parsers.CyclingDataParser('CELL_1', helper).get_tables()
+
+        assert list(tables['rpt']['cycle_index']) == [41]
+        assert list(tables['hppc']['cycle_index'].unique()) == [41, 86]
+
+
+def test_checkpoint_resume(parsers, tmp_path):
+
+    df = make_cycling_record()
+    helper = FakeHelper({'CELL_1_CYC': df})
+
+    expected = parsers.CyclingDataParser('CELL_1', helper).get_tables()
+
+    # Halfway through cycling, the HPPC, the C/20 charge and the rest at the
+    # top of charge
+    for num_rows in [get_split(df, 6, 2), get_split(df, 17, 4),
+                     get_split(df, 26, 1), get_split(df, 27, 1)]:
+
+        checkpoint_file = tmp_path / f'checkpoint_{num_rows}.pkl'
+
+        helper.num_rows = num_rows
+        parser = parsers.CyclingDataParser('CELL_1', helper, checkpoint_file=checkpoint_file)
+        parser.save_checkpoint()
+
+        helper.num_rows = None
+        parser = parsers.CyclingDataParser('CELL_1', helper, checkpoint_file=checkpoint_file)
+
+        assert parser.df.index[0] > 0
+        assert_tables_equal(parser.get_tables(), expected)
+
+
+# Columns of the raw formation exports under their VAS names
+FORMATION_COLUMNS = {'Cycle Number': 'cycle_index',
+                     'Step Index': 'step_index',
+                     'Test Time (s)': 'test_time_s',
+                     'Step Time (s)': 'step_time_s',
+                     'Potential (V)': 'voltage_v',
+                     'Current (A)': 'current_a',
+                     'Charge Capacity (Ah)': 'charge_capacity_ah',
+                     'Discharge Capacity (Ah)': 'discharge_capacity_ah'}
+
+
+@pytest.mark.parametrize("cellid, schedule", [(11, 'formation_baseline'),
+                                              (33, 'formation_fast')])
+def test_formation_parser(parsers, cellid, schedule):
+
+    from src.formation import FormationCell
+
+    cell = FormationCell(cellid)
+    df = cell.get_formation_data()[list(FORMATION_COLUMNS)].rename(columns=FORMATION_COLUMNS)
+
+    helper = FakeHelper({f'CELL_{cellid}_FORM': df})
+    parser = parsers.FormationParser(f'CELL_{cellid}', helper, schedule=schedule)
+
+    expected = cell.get_formation_test_summary_statistics()
+    features = parser.get_formation_features()
+
+    assert len(features) == 23
+    assert set(features) <= set(expected)
+    for key, value in features.items():
+        assert value == expected[key], key
+
+    # One row per step of each cycle
+    df_steps = parser.get_step_table()
+    df_step = df[(df['cycle_index'] == 1) & \
+                 (df['step_index'] == parser.schedule.get_step('first_cv_hold'))]
+
+    assert df_steps.index.names == ['cycle_index', 'step_type']
+    assert len(df_steps) == len(set(zip(df['cycle_index'], parser.step_type)))
+
+    row = df_steps.loc[(1, 'first_cv_hold')]
+    assert row[('first', 'charge_capacity_ah')] == df_step['charge_capacity_ah'].iloc[0]
+    assert row[('last', 'charge_capacity_ah')] == df_step['charge_capacity_ah'].iloc[-1]
+    assert row[('max', 'voltage_v')] == df_step['voltage_v'].max()
+
+
+def make_record(num_cycles=6, rows_per_cycle=5, seed=0):
+    """
+    Returns a small cycler record with datapoints one second apart, in the
+    column layout of `VasHelper.get_cycler_data`
+    """
+
+    rng = np.random.default_rng(seed)
+    num_rows = num_cycles * rows_per_cycle
+
+    datapoint_time_ms = 1.6e12 + 1000 * np.arange(num_rows)
+
+    return pd.DataFrame({
+        'test_time_s': np.arange(num_rows, dtype=np.float64),
+        'current_a': rng.normal(1, 0.1, num_rows),
+        'voltage_v': rng.normal(3.7, 0.1, num_rows),
+        'step_index': np.tile(np.arange(rows_per_cycle, dtype=np.int64) + 3, num_cycles),
+        'cycle_index': np.repeat(np.arange(1, num_cycles + 1, dtype=np.int64), rows_per_cycle),
+        'datetime': pd.to_datetime(datapoint_time_ms, unit='ms').tz_localize('UTC')
+                      .tz_convert('US/Eastern')})
+
+
+def split_record(df, *rows):
+    """
+    Split a record into continuation records, each restarting its test time
+    and cycle count as after a restart of the test
+    """
+
+    records = []
+
+    for start, stop in zip((0,) + rows, rows + (len(df),)):
+        record = df.iloc[start:stop].reset_index(drop=True)
+        record['test_time_s'] -= record['test_time_s'].iloc[0]
+        record['cycle_index'] -= record['cycle_index'].iloc[0] - 1
+        records.append(record)
+
+    return records
+
+
+def test_stitch_records_out_of_order(parsers):
+
+    df = make_record()
+    records = split_record(df, 10, 20)
+
+    stitched = parsers.stitch_records(records[::-1])
+
+    # Each record continues the test time, one second after the last
+    # datapoint of the record before it
+    pd.testing.assert_frame_equal(stitched, df, check_exact=True)
+
+
+def test_stitch_records_gap(parsers):
+
+    df = make_record()
+    first, second = split_record(df, 15)
+    second['datetime'] += pd.Timedelta(hours=1)
+
+    stitched = parsers.stitch_records([first, second])
+
+    assert np.array_equal(stitched['cycle_index'], df['cycle_index'])
+    assert np.array_equal(np.diff(stitched['test_time_s']),
+                          np.where(np.arange(len(df) - 1) == 14, 3601.0, 1.0))
+
+
+@pytest.mark.parametrize('end, start', [(17, 14), (20, 17)])
+def test_stitch_records_overlap(parsers, end, start):
+
+    df = make_record()
+
+    # The second record starts 3 datapoints before the end of the first,
+    # within a cycle (17) or at the end of one (20, with 5 rows per cycle).
+    # A cycle continued across the records is kept as one.
+    first, _ = split_record(df, end)
+    _, second = split_record(df, start)
+
+    stitched = parsers.stitch_records([first, second])
+
+    pd.testing.assert_frame_equal(stitched, df, check_exact=True)
+
+
+def test_stitch_names_earliest_record(parsers):
+
+    df = make_cycling_record(num_rpt=1)
+    first, second = split_record(df, len(df) // 2)
+
+    helper = FakeHelper({'CELL_1_CYC_RESTART': second, 'CELL_1_CYC': first})
+    parser = parsers.CyclingDataParser('CELL_1', helper, stitch=True)
+
+    assert parser.cycle_test_name == 'CELL_1_CYC'
+    assert parser.cycle_test_names == ['CELL_1_CYC_RESTART', 'CELL_1_CYC']
+
+
+def test_stitch_records_dtypes(parsers):
+
+    df = make_record()
+
+    stitched = parsers.stitch_records(split_record(df, 12))
+
+    assert stitched.dtypes.to_dict() == df.dtypes.to_dict()
+    assert isinstance(stitched.index, pd.RangeIndex)
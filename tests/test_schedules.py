@@ -0,0 +1,70 @@
+"""
+Check the step schedule registry against direct step index comparisons
+"""
+
+import numpy as np
+import pytest
+
+from src.schedules import (AGING_SCHEDULE, FORMATION_FAST_SCHEDULE, SCHEDULES,
+                           StepSchedule, get_schedule)
+
+
+def test_label():
+
+    step_index = np.array([1, 7, 10, 13, 15, 16, 22, 24, 33, 0, 99, -1])
+
+    step_type = AGING_SCHEDULE.label(step_index)
+
+    assert list(step_type) == ['other', 'c3_charge', 'c3_discharge', 'c20_charge',
+                               'rest_top_4p2v', 'c20_discharge', 'hppc_pulse_charge',
+                               'hppc_pulse_discharge', 'cycling_discharge_cc',
+                               'other', 'other', 'other']
+
+    for category, steps in AGING_SCHEDULE.steps.items():
+        assert np.array_equal(step_type == category, np.isin(step_index, steps))
+
+
+def test_select_blocks():
+
+    schedule = get_schedule('umbl2022feb')
+    step_index = np.arange(-2, 40)
+
+    assert np.array_equal(schedule.select(step_index, 'cycling'),
+                          (step_index >= 0) & (step_index < 12))
+    assert np.array_equal(schedule.select(step_index, 'rpt'),
+                          (step_index >= 12) & (step_index <= 31))
+    assert np.array_equal(schedule.select(step_index, 'c20_charge', 'c20_discharge'),
+                          np.isin(step_index, [23, 26]))
+
+
+def test_shift():
+
+    schedule = get_schedule('umbl2022feb', -2, 'rpt')
+    step_index = np.arange(0, 40)
+
+    # Steps before the RPT keep their index
+    assert schedule.get_step('cycling_discharge_rest') == 7
+    assert schedule.get_step('rpt_start') == 10
+    assert schedule.get_step('hppc_end') == 19
+    assert np.array_equal(schedule.select(step_index, 'cycling'), step_index < 10)
+    assert np.array_equal(schedule.select(step_index, 'rpt'),
+                          (step_index >= 10) & (step_index <= 29))
+
+    assert get_schedule('umbl2022feb', -2, 'rpt') is schedule
+    assert get_schedule('umbl2022feb') is SCHEDULES['umbl2022feb']
+
+
+def test_cycles():
+
+    assert FORMATION_FAST_SCHEDULE.get_cycle('six_hour_rest') == 7
+    assert FORMATION_FAST_SCHEDULE.get_cycle('final', 10) == 9
+    assert FORMATION_FAST_SCHEDULE.get_steps('first_discharge_rest') == []
+
+    with pytest.raises(AssertionError):
+        FORMATION_FAST_SCHEDULE.get_cycle('final')
+
+
+def test_overlapping_categories():
+
+    with pytest.raises(AssertionError):
+        StepSchedule('bad', steps={'charge': [1, 2], 'rest': 2})
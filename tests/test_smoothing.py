@@ -0,0 +1,71 @@
+"""
+Check the batched Savitzky-Golay filter against scipy
+"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from src.smoothing import get_dvdq_curves, get_savgol_kernel, savgol_filter, \
+                          savgol_filter_many
+
+
+@pytest.fixture
+def curves():
+
+    rng = np.random.default_rng(0)
+
+    return [3.7 + np.cumsum(rng.normal(0, 1e-3, n)) for n in [41, 101, 250, 1000]]
+
+
+@pytest.mark.parametrize("window_length, polyorder, deriv",
+                         [(41, 3, 0), (41, 3, 1), (41, 3, 2), (5, 3, 0), (7, 0, 0)])
+def test_savgol_filter_many(curves, window_length, polyorder, deriv):
+
+    halflen = window_length // 2
+
+    for curve, filtered in zip(curves, savgol_filter_many(curves, window_length,
+                                                          polyorder, deriv)):
+
+        expected = signal.savgol_filter(curve, window_length, polyorder, deriv)
+
+        # Interior points use the same convolution as scipy
+        assert np.array_equal(filtered[halflen:-halflen], expected[halflen:-halflen])
+        np.testing.assert_allclose(filtered, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_savgol_filter_delta(curves):
+
+    np.testing.assert_allclose(savgol_filter(curves[2], 41, 3, deriv=1, delta=0.5),
+                               signal.savgol_filter(curves[2], 41, 3, deriv=1, delta=0.5),
+                               rtol=1e-10, atol=1e-12)
+
+
+def test_kernel_cache():
+
+    assert get_savgol_kernel(101, 2, 1) is get_savgol_kernel(101, 2, 1)
+
+    with pytest.raises(ValueError):
+        get_savgol_kernel(101, 2, 1).coeffs[0] = 0
+
+
+def test_get_dvdq_curves(curves):
+
+    capacity = [np.linspace(0, 2.4, len(curve)) ** 1.1 for curve in curves[1:]]
+    voltage = curves[1:]
+
+    for q, v, result in zip(capacity, voltage, get_dvdq_curves(capacity, voltage, 41, 2)):
+
+        dq = signal.savgol_filter(q, 41, 2, 1)
+        dv = signal.savgol_filter(v, 41, 2, 1)
+
+        np.testing.assert_allclose(result['q'], signal.savgol_filter(q, 41, 2), rtol=1e-10)
+        np.testing.assert_allclose(result['v'], signal.savgol_filter(v, 41, 2), rtol=1e-10)
+        np.testing.assert_allclose(result['dvdq'], dv / dq, rtol=1e-8)
+        np.testing.assert_allclose(result['dqdv'], dq / dv, rtol=1e-8)
+
+
+def test_short_curve():
+
+    with pytest.raises(AssertionError):
+        savgol_filter(np.ones(10), 41, 3)
@@ -0,0 +1,198 @@
+"""
+Check the on-disk storage helpers using small synthetic files
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.storage import RecordCache, clear_cache, load_column_store, read_csv_cached
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+
+    df = pd.DataFrame({'Cycle Number': [0, 0, 1, 1],
+                       'Step Index': [7, 7, 10, 10],
+                       'Potential (V)': [3.5, 3.6, 3.7, 3.8]})
+
+    file = tmp_path / 'cell_1.csv'
+    df.to_csv(file, index=False)
+
+    return file
+
+
+def test_read_csv_cached_hit(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+
+    df_cold, is_cached_cold = read_csv_cached(csv_file, cache_dir)
+    df_warm, is_cached_warm = read_csv_cached(csv_file, cache_dir)
+
+    assert not is_cached_cold
+    assert is_cached_warm
+    pd.testing.assert_frame_equal(df_cold, df_warm)
+
+
+def test_read_csv_cached_invalidated_on_change(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+
+    read_csv_cached(csv_file, cache_dir)
+
+    df = pd.read_csv(csv_file)
+    df['Potential (V)'] += 1
+    df.to_csv(csv_file, index=False)
+
+    df_new, is_cached = read_csv_cached(csv_file, cache_dir)
+
+    assert not is_cached
+    assert df_new['Potential (V)'].iloc[0] == 4.5
+
+
+def test_read_csv_cached_leaves_no_partial_files(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+
+    read_csv_cached(csv_file, cache_dir)
+
+    assert sorted(path.suffix for path in cache_dir.iterdir()) == ['.feather', '.json']
+
+
+def test_read_csv_cached_touched_file(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+
+    read_csv_cached(csv_file, cache_dir)
+
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    _, is_cached = read_csv_cached(csv_file, cache_dir)
+
+    assert is_cached
+
+
+def test_clear_cache(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+
+    read_csv_cached(csv_file, cache_dir)
+    clear_cache(csv_file, cache_dir)
+
+    _, is_cached = read_csv_cached(csv_file, cache_dir)
+
+    assert not is_cached
+
+
+def test_load_column_store(csv_file, tmp_path):
+
+    cache_dir = tmp_path / 'cache'
+    dtypes = {'Cycle Number': np.int32, 'Potential (V)': np.float64}
+
+    store, is_cached = load_column_store(csv_file, cache_dir, dtypes)
+    store_warm, is_cached_warm = load_column_store(csv_file, cache_dir, dtypes)
+
+    assert not is_cached
+    assert is_cached_warm
+    assert store_warm.columns == ['Cycle Number', 'Potential (V)']
+    assert store_warm['Cycle Number'].dtype == np.int32
+    assert isinstance(store_warm['Potential (V)'], np.memmap)
+
+
+def test_column_store_slices_are_views(csv_file, tmp_path):
+
+    store, _ = load_column_store(csv_file, tmp_path / 'cache',
+                                 {'Potential (V)': np.float64})
+
+    view = store.slice(slice(1, 3))
+
+    assert np.shares_memory(view['Potential (V)'], store['Potential (V)'])
+
+    df = store.take_slices([slice(0, 1), slice(2, 4)])
+
+    assert list(df.index) == [0, 2, 3]
+    assert list(df['Potential (V)']) == [3.5, 3.7, 3.8]
+
+
+def test_record_cache(tmp_path):
+
+    cache = RecordCache(tmp_path / 'cache')
+    keys = ['h_test_time', 'h_potential']
+    calls = []
+
+    def read():
+        calls.append(1)
+        return pd.DataFrame({'h_test_time': [0.0, 1.0], 'h_potential': [3.5, 3.6]})
+
+    df_cold, is_cached_cold = cache.read('CELL_1_CYC', keys, read, version='100')
+    df_warm, is_cached_warm = cache.read('CELL_1_CYC', keys[::-1], read, version='100')
+    _, is_cached_new = cache.read('CELL_1_CYC', keys, read, version='101')
+    _, is_cached_other_keys = cache.read('CELL_1_CYC', keys[:1], read, version='101')
+
+    assert not is_cached_cold
+    assert is_cached_warm
+    assert not is_cached_new
+    assert not is_cached_other_keys
+    assert len(calls) == 3
+    pd.testing.assert_frame_equal(df_cold, df_warm)
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_stats()['misses'] == 3
+    assert cache.get_stats()['entries'] == 2
+
+
+def test_record_cache_keeps_index(tmp_path):
+
+    cache = RecordCache(tmp_path / 'cache')
+
+    df = pd.DataFrame({'voltage_v': [3.5, 3.6, 3.7]},
+                      index=pd.Index([10, 11, 12], name='row'))
+
+    cache.read('CELL_1', ['voltage_v'], lambda: df, version='1')
+    df_warm, is_cached = cache.read('CELL_1', ['voltage_v'], lambda: None, version='1')
+
+    assert is_cached
+    pd.testing.assert_frame_equal(df_warm, df)
+
+
+def test_record_cache_evicts_least_recently_used(tmp_path):
+
+    df = pd.DataFrame({'voltage_v': np.arange(1000, dtype=np.float64)})
+
+    cache = RecordCache(tmp_path / 'cache')
+    cache.read('CELL_1', ['voltage_v'], lambda: df, version='1')
+    size = cache.get_stats()['bytes']
+
+    cache.max_bytes = 2 * size
+    cache.read('CELL_2', ['voltage_v'], lambda: df, version='1')
+    cache.read('CELL_1', ['voltage_v'], lambda: df, version='1')
+    cache.read('CELL_3', ['voltage_v'], lambda: df, version='1')
+
+    assert cache.get_stats()['entries'] == 2
+    assert cache.read('CELL_1', ['voltage_v'], lambda: df, version='1')[1]
+    assert not cache.read('CELL_2', ['voltage_v'], lambda: df, version='1')[1]
+
+
+def test_record_cache_without_version(tmp_path):
+
+    cache = RecordCache(tmp_path / 'cache')
+    calls = []
+
+    def read():
+        calls.append(1)
+        return pd.DataFrame({'voltage_v': [3.5, 3.6]})
+
+    for _ in range(3):
+        _, is_cached = cache.read('CELL_1', ['voltage_v'], read)
+        assert not is_cached
+
+    assert len(calls) == 3
+
+    # The copy is kept for reads of any version
+    df = cache.get('CELL_1', ['voltage_v'])
+
+    assert list(df['voltage_v']) == [3.5, 3.6]
+    assert cache.get('CELL_2', ['voltage_v']) is None
+    assert cache.get_stats()['hits'] == 1
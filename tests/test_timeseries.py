@@ -0,0 +1,74 @@
+"""
+Check the timeseries indexing utilities using small synthetic data
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.timeseries import StepRowIndex, iter_csv_cycles, take_slices
+
+
+@pytest.fixture
+def df():
+
+    # Cycle 2 holds two pulses (step 24) separated by rests (step 23)
+    return pd.DataFrame({'Cycle Number': [1, 1, 1, 2, 2, 2, 2, 2, 3],
+                         'Step Index':   [7, 7, 10, 23, 24, 24, 23, 24, 7],
+                         'Potential (V)': np.arange(9, dtype=float)})
+
+
+def test_cycles_with_step(df):
+
+    index = StepRowIndex(df['Cycle Number'], df['Step Index'])
+
+    assert list(index.get_cycles_with_step(7)) == [1, 3]
+    assert list(index.get_cycles_with_step(24)) == [2]
+    assert len(index.get_cycles_with_step(99)) == 0
+
+
+def test_rows_match_boolean_mask(df):
+
+    index = StepRowIndex(df['Cycle Number'], df['Step Index'])
+
+    for cycle in index.get_cycles():
+
+        df_cycle = take_slices(df, index.get_cycle_slices(cycle))
+        pd.testing.assert_frame_equal(df_cycle, df[df['Cycle Number'] == cycle])
+
+        for step in df['Step Index'].unique():
+
+            df_step = take_slices(df, index.get_step_slices(cycle, step))
+            df_mask = df[(df['Cycle Number'] == cycle) & (df['Step Index'] == step)]
+
+            assert df_step.index.equals(df_mask.index)
+
+
+def test_repeated_steps_give_one_slice_each(df):
+
+    index = StepRowIndex(df['Cycle Number'], df['Step Index'])
+
+    assert index.get_step_slices(2, 24) == [slice(4, 6), slice(7, 8)]
+    assert index.get_cycle_slices(2) == [slice(3, 8)]
+
+
+def test_empty():
+
+    index = StepRowIndex([], [])
+
+    assert len(index.get_cycles()) == 0
+    assert index.get_cycle_slices(1) == []
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 100])
+def test_iter_csv_cycles(df, tmp_path, chunksize):
+
+    file = tmp_path / 'timeseries.csv'
+    df.to_csv(file, index=False)
+
+    cycles = list(iter_csv_cycles(file, chunksize))
+
+    assert [cycle for cycle, _ in cycles] == [1, 2, 3]
+
+    for cycle, df_cycle in cycles:
+        pd.testing.assert_frame_equal(df_cycle, df[df['Cycle Number'] == cycle])
@@ -0,0 +1,383 @@
+"""
+Check the VAS helper against a local fake of the voltaiq_studio backend
+"""
+
+import importlib
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class FakeReader:
+
+    def __init__(self, test_record):
+
+        self.test_record = test_record
+        self.keys = []
+        self.filters = []
+
+
+    def add_trace_keys(self, *keys):
+
+        self.keys += keys
+
+
+    def add_info_keys(self, *keys):
+
+        self.keys += keys
+
+
+    def filter_trace(self, key, operation, value):
+
+        assert operation == 'gt'
+        self.filters.append((key, value))
+
+
+    def read_pandas(self):
+
+        backend = self.test_record.backend
+
+        with backend.lock:
+            backend.active += 1
+            backend.max_active = max(backend.max_active, backend.active)
+            backend.calls.append(self.test_record.name)
+
+        try:
+            time.sleep(0.02)
+
+            if backend.failures.get(self.test_record.name, 0) > 0:
+                backend.failures[self.test_record.name] -= 1
+                raise ConnectionError('Too many requests')
+
+            start_ms = self.test_record.start_ms
+            num_rows = self.test_record.num_rows
+            data = {key: np.arange(num_rows, dtype=np.float64) for key in self.keys}
+            data['h_datapoint_num'] = np.arange(1, num_rows + 1)
+            data['h_datapoint_time'] = start_ms + 1000.0 * np.arange(num_rows)
+            data['aux_vdf_timestamp_datetime_0'] = start_ms + 1000.0 * np.arange(num_rows)
+
+            df = pd.DataFrame(data)
+            for key, value in self.filters:
+                df = df[df[key] > value]
+
+            backend.rows_sent.append(len(df))
+
+            return df
+        finally:
+            with backend.lock:
+                backend.active -= 1
+
+
+class FakeTestRecord:
+
+    def __init__(self, backend, name, start_ms):
+
+        self.backend = backend
+        self.name = name
+        self.start_ms = start_ms
+        self.num_rows = 5
+        self.versioned = True
+
+
+    @property
+    def datapoint_count(self):
+
+        return self.num_rows if self.versioned else None
+
+
+    def make_time_series_reader(self):
+
+        return FakeReader(self)
+
+
+def make_backend(num_records=6):
+    """
+    Returns a fake voltaiq_studio module holding one cycler record and
+    `num_records` AuxData records of one device, listed out of time order
+    """
+
+    backend = types.ModuleType('voltaiq_studio')
+    backend.lock = threading.Lock()
+    backend.active = 0
+    backend.max_active = 0
+    backend.calls = []
+    backend.failures = dict()
+    backend.rows_sent = []
+    backend.TraceFilterOperation = types.SimpleNamespace(GREATER_THAN='gt')
+
+    start_ms = 1.6e12 + 1e7 * np.random.default_rng(0).permutation(num_records)
+
+    records = [FakeTestRecord(backend, 'CELL_1_CYC', 1.6e12)]
+    records += [FakeTestRecord(backend, f'CELL_1_AuxDat_{idx}', start)
+                for idx, start in enumerate(start_ms)]
+
+    backend.get_test_records = lambda: records
+    backend.get_devices = lambda: [types.SimpleNamespace(name='CELL_1')]
+
+    return backend
+
+
+@pytest.fixture
+def backend(monkeypatch):
+
+    backend = make_backend()
+
+    monkeypatch.setitem(sys.modules, 'voltaiq_studio', backend)
+    monkeypatch.delitem(sys.modules, 'src.vas', raising=False)
+
+    return backend
+
+
+def test_get_aux_data_compiled(backend):
+
+    vas = importlib.import_module('src.vas')
+
+    backend.failures['CELL_1_AuxDat_2'] = 2
+
+    helper = vas.VasHelper()
+    limiter = vas.RateLimiter(rate=1000, burst=3, retries=2, backoff_s=0)
+
+    df = helper.get_aux_data_compiled('CELL_1', max_workers=3, limiter=limiter)
+
+    expected = pd.concat([helper.get_aux_data(f'CELL_1_AuxDat_{idx}') for idx in range(6)])
+    expected = expected.sort_values(by=['datetime'])
+
+    pd.testing.assert_frame_equal(df, expected)
+    assert df['datetime'].is_monotonic_increasing
+    assert backend.calls.count('CELL_1_AuxDat_2') == 4
+    assert 1 < backend.max_active <= 3
+
+
+def test_get_aux_data_compiled_gives_up(backend):
+
+    vas = importlib.import_module('src.vas')
+
+    backend.failures['CELL_1_AuxDat_0'] = 3
+
+    helper = vas.VasHelper()
+    limiter = vas.RateLimiter(rate=1000, retries=2, backoff_s=0)
+
+    with pytest.raises(ConnectionError):
+        helper.get_aux_data_compiled('CELL_1', limiter=limiter)
+
+
+def test_rate_limiter_retries_transient_errors(backend):
+
+    vas = importlib.import_module('src.vas')
+
+    limiter = vas.RateLimiter(rate=1000, retries=3, backoff_s=0)
+    calls = []
+
+    def fail(error):
+        def function():
+            calls.append(error)
+            raise error('VAS request failed')
+        return function
+
+    for error in [ConnectionError, ConnectionResetError, TimeoutError]:
+        with pytest.raises(error):
+            limiter.call(fail(error))
+
+    assert len(calls) == 12
+
+    # Other errors, including OSErrors that retrying cannot fix, are raised
+    # on the first attempt
+    for error in [KeyError, ValueError, PermissionError, FileNotFoundError]:
+        calls.clear()
+        with pytest.raises(error):
+            limiter.call(fail(error))
+        assert len(calls) == 1
+
+    limiter = vas.RateLimiter(rate=1000, retries=3, backoff_s=0, retry_errors=(KeyError,))
+    calls.clear()
+
+    with pytest.raises(KeyError):
+        limiter.call(fail(KeyError))
+
+    assert len(calls) == 4
+
+
+def test_rate_limiter_retries_flight_errors(backend):
+
+    flight = pytest.importorskip('pyarrow.flight')
+    vas = importlib.import_module('src.vas')
+
+    limiter = vas.RateLimiter(rate=1000, retries=2, backoff_s=0)
+    calls = []
+
+    def function():
+        calls.append(1)
+        if len(calls) < 3:
+            raise flight.FlightUnavailableError('VAS is unavailable')
+        return 'done'
+
+    assert limiter.call(function) == 'done'
+    assert len(calls) == 3
+
+
+def test_rate_limiter(backend):
+
+    vas = importlib.import_module('src.vas')
+
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    limiter = vas.RateLimiter(rate=2, burst=3, clock=lambda: now[0], sleep=sleep)
+
+    for _ in range(5):
+        limiter.acquire()
+
+    # The burst goes through at once, then one request every 1/rate seconds
+    assert waits == pytest.approx([0.5, 0.5])
+    assert now[0] == pytest.approx(1.0)
+
+
+def test_name_index_find(backend):
+
+    vas = importlib.import_module('src.vas')
+
+    names = ['UMBL2022FEB_CELL151805_CYC_1C1CR1',
+             'UMBL2022FEB-CELL151805-01-005',
+             'UMBL2022FEB_CELL151806_CYC_1C1CR1',
+             'UMBL2022FEB_CELL151805_AuxDat_CELL151805',
+             'UMBL2022FEB_CELL15180_FORM']
+    index = vas.NameIndex([types.SimpleNamespace(name=name) for name in names])
+
+    def find(keyword):
+        return [item.name for item in index.find(keyword)]
+
+    # After any separator, and across several tokens
+    assert find('CELL151805') == [names[0], names[1], names[3]]
+    assert find('UMBL2022FEB_CELL151805') == [names[0], names[3]]
+    assert find('CELL151805_CYC') == [names[0]]
+    assert find('01-005') == [names[1]]
+
+    # A name holding the keyword twice is returned once
+    assert find('CELL151805').count(names[3]) == 1
+    assert find('CELL151805_AuxDat') == [names[3]]
+
+    # Prefixes up to the keyword with its last character incremented
+    assert find('CELL15180') == names
+    assert find('CELL151806') == [names[2]]
+    assert find('CELL151807') == []
+
+    assert find('') == names
+    assert index.get(names[1]).name == names[1]
+
+    # No match at a separator falls back to a substring scan
+    assert find('L1518') == names
+    assert find('FEB-CELL') == [names[1]]
+
+
+def test_cache_misses_on_new_datapoints(backend, tmp_path):
+
+    vas = importlib.import_module('src.vas')
+
+    helper = vas.VasHelper(cache_dir=tmp_path / 'cache')
+    test_record = helper._get_test_record('CELL_1_CYC')
+
+    # Hits are validated against the record list, without fetching
+    df_cold = helper.get_cycler_data('CELL_1_CYC')
+    df_warm = helper.get_cycler_data('CELL_1_CYC')
+
+    assert len(backend.calls) == 1
+    pd.testing.assert_frame_equal(df_warm, df_cold)
+
+    test_record.num_rows = 7
+    df_new = helper.get_cycler_data('CELL_1_CYC')
+
+    assert len(backend.calls) == 2
+    assert len(df_new) == 7
+    assert helper.cache.get_stats()['hits'] == 1
+    assert helper.cache.get_stats()['misses'] == 2
+
+
+def test_cache_without_version(backend, tmp_path):
+
+    vas = importlib.import_module('src.vas')
+
+    helper = vas.VasHelper(cache_dir=tmp_path / 'cache')
+    helper._get_test_record('CELL_1_CYC').versioned = False
+
+    for _ in range(2):
+        helper.get_cycler_data('CELL_1_CYC')
+
+    assert len(backend.calls) == 2
+    assert helper.cache.get_stats()['hits'] == 0
+
+    # Offline, the local copy is used whatever the record version
+    helper.offline = True
+    helper._get_test_record('CELL_1_CYC').num_rows = 7
+
+    assert len(helper.get_cycler_data('CELL_1_CYC')) == 5
+    assert len(backend.calls) == 2
+
+
+def test_cache_when_vas_is_unreachable(backend, tmp_path, capsys):
+
+    vas = importlib.import_module('src.vas')
+
+    helper = vas.VasHelper(cache_dir=tmp_path / 'cache')
+    test_record = helper._get_test_record('CELL_1_CYC')
+
+    df = helper.get_cycler_data('CELL_1_CYC')
+
+    test_record.num_rows = 7
+    backend.failures['CELL_1_CYC'] = 1
+
+    pd.testing.assert_frame_equal(helper.get_cycler_data('CELL_1_CYC'), df)
+    assert 'could not reach VAS' in capsys.readouterr().out
+
+    # Without a local copy the error is raised
+    backend.failures['CELL_1_AuxDat_0'] = 1
+
+    with pytest.raises(ConnectionError):
+        helper.get_aux_data('CELL_1_AuxDat_0')
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_get_cycler_data_from_start_time(backend, tmp_path, cached):
+
+    vas = importlib.import_module('src.vas')
+
+    helper = vas.VasHelper(cache_dir=tmp_path / 'cache' if cached else None)
+    test_record = helper._get_test_record('CELL_1_CYC')
+
+    df = helper.get_cycler_data('CELL_1_CYC')
+
+    test_record.num_rows = 8
+    df_new = helper.get_cycler_data('CELL_1_CYC', start_time=df['datetime'].iloc[-1])
+
+    # Only the new rows are sent by VAS, and the cached copy is untouched
+    assert backend.rows_sent == [5, 3]
+    assert list(df_new['h_datapoint_num']) == [6, 7, 8]
+    assert df_new['datetime'].min() > df['datetime'].max()
+
+    if cached:
+        assert len(helper.cache.get('CELL_1_CYC', vas.CYCLER_TRACE_KEYS
+                                    + vas.CYCLER_INFO_KEYS)) == 5
+
+
+def test_get_cycler_data_without_trace_filters(backend, capsys):
+
+    vas = importlib.import_module('src.vas')
+
+    del backend.TraceFilterOperation
+
+    helper = vas.VasHelper()
+    df = helper.get_cycler_data('CELL_1_CYC')
+    df_new = helper.get_cycler_data('CELL_1_CYC', start_time=df['datetime'].iloc[2])
+
+    # The whole record is fetched, then cut to the new rows
+    assert backend.rows_sent == [5, 5]
+    assert list(df_new['h_datapoint_num']) == [4, 5]
+    assert 'cannot filter' in capsys.readouterr().out